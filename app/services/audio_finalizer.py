@@ -2,6 +2,7 @@ import boto3
 import json
 import time
 import os
+import re
 import subprocess
 from collections import defaultdict
 
@@ -13,6 +14,9 @@ topics_table = dynamodb.Table("EPTopicsRequest")
 AUDIO_BUCKET = "echopod-audio"
 TMP_DIR = "/tmp"
 
+# Streamed parts are named <chapter>_<take>_partNNN, the take being an 8-digit hex id
+STREAM_TAKE_PART = re.compile(r"_([0-9a-f]{8})_part\d")
+
 def lambda_handler(event, context):
     print("Received event:", json.dumps(event))
 
@@ -24,16 +28,30 @@ def lambda_handler(event, context):
     try:
         update_status(topic_id, "FINALIZING_AUDIO")
 
-        audio_files = get_audio_files(topic_id, chapter_key)
-        if len(audio_files) <= 1:
-            print(f"Skipping compression for {chapter_key}: only one file")
+        audio_files, stale_files = get_audio_files(topic_id, chapter_key, get_stream_take(topic_id, chapter_key))
+        # Parts an earlier, regenerated take of a streamed chapter left behind are never used
+        for key in stale_files:
+            s3.delete_object(Bucket=AUDIO_BUCKET, Key=key)
+
+        if not audio_files:
+            print(f"Skipping compression for {chapter_key}: no part files")
             return {"status": "SKIPPED", "chapter_key": chapter_key}
 
+        combined_key = f"{topic_id}/{chapter_key}.mp3"
+        if len(audio_files) == 1:
+            # A chapter synthesized as one task only needs its Polly output renamed
+            move_audio_file(audio_files[0], combined_key)
+            update_status(topic_id, "COMPLETED")
+            return {
+                "status": "COMPLETED",
+                "topic_id": topic_id,
+                "chapter_key": chapter_key
+            }
+
         local_files = download_audio_files(audio_files)
         output_file = f"{TMP_DIR}/{chapter_key}_combined.mp3"
         combine_audio_files(local_files, output_file)
 
-        combined_key = f"{topic_id}/{chapter_key}.mp3"
         s3.upload_file(output_file, AUDIO_BUCKET, combined_key)
         print(f"Uploaded: {combined_key}")
         
@@ -57,12 +75,41 @@ def lambda_handler(event, context):
         print(f"Error finalizing audio: {str(e)}")
         return {"status": "FAILED", "error": str(e)}
 
-def get_audio_files(topic_id, chapter_key):
+def get_audio_files(topic_id, chapter_key, take=None):
+    """
+    Part files of one chapter in speech order, and the parts of streamed takes other than the
+    given one. Polly names them <prefix>.<task id>.mp3 and the zero-padded _partNNN prefixes
+    sort in order; chapter_1 must not pick up chapter_10's parts.
+    """
+    prefix = f"{topic_id}/{chapter_key}"
     response = s3.list_objects_v2(
         Bucket=AUDIO_BUCKET,
-        Prefix=f"{topic_id}/{chapter_key}"
+        Prefix=prefix
+    )
+    keys, stale = [], []
+    for item in response.get("Contents", []):
+        key, rest = item["Key"], item["Key"][len(prefix):]
+        if not key.endswith(".mp3") or key == f"{prefix}.mp3": continue
+        take_match = STREAM_TAKE_PART.match(rest)
+        if take_match: (keys if take_match.group(1) == take else stale).append(key)
+        elif rest.startswith(".") or rest.startswith("_part"): keys.append(key)
+    return sorted(keys), stale
+
+def get_stream_take(topic_id, chapter_key):
+    """The take whose parts make up a streamed chapter, None for chapters that were not streamed"""
+    item = status_table.get_item(Key={"topic_id": topic_id}).get("Item", {})
+    return item.get("streamed_chapters", {}).get(chapter_key, {}).get("take")
+
+def move_audio_file(source_key, destination_key):
+    s3.copy_object(
+        Bucket=AUDIO_BUCKET,
+        Key=destination_key,
+        CopySource={"Bucket": AUDIO_BUCKET, "Key": source_key},
+        ContentType="audio/mpeg",
+        MetadataDirective="REPLACE"
     )
-    return [item["Key"] for item in response.get("Contents", []) if item["Key"].endswith(".mp3")]
+    s3.delete_object(Bucket=AUDIO_BUCKET, Key=source_key)
+    print(f"Moved {source_key} to {destination_key}")
 
 def download_audio_files(keys):
     paths = []
@@ -0,0 +1,173 @@
+import boto3
+import json
+import time
+import threading
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+s3 = boto3.client("s3", region_name="us-east-1")
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+status_table = dynamodb.Table("EPPodcastStatus")
+
+CONTENT_BUCKET = "echopod-content"
+
+# Per-call records are written next to the topic's content; the content lister only
+# picks up intro/chapter_N objects, so this never reaches Polly
+USAGE_KEY = "{topic_id}/_usage.json"
+
+# CloudWatch embedded metric format, one log line per Bedrock call
+METRICS_NAMESPACE = "EchoPod/Bedrock"
+METRICS_DIMENSIONS = [["Category", "CallType"], ["ModelId"]]
+METRICS = [
+    ("Latency", "Seconds"),
+    ("TimeToFirstByte", "Seconds"),
+    ("InputTokens", "Count"),
+    ("OutputTokens", "Count"),
+    ("CacheReadTokens", "Count"),
+    ("Retries", "Count"),
+    ("ThrottleWait", "Seconds")
+]
+
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+TIME_FIELDS = ("latency", "throttle_wait", "limiter_wait")
+
+# Calls made during the current invocation
+_calls = []
+_category = None
+_lock = threading.Lock()
+
+# What the current thread is generating (outline, chapter_3, ...), attached to every call it makes
+_label = threading.local()
+
+
+def reset(category=None):
+    """Start a new invocation"""
+    global _category
+    with _lock:
+        _calls.clear()
+        _category = category
+
+
+def set_label(label):
+    _label.value = label
+
+
+def record_call(call_type, model_id, usage, latency, ttfb=None, retries=0, throttle_wait=0.0, limiter_wait=0.0):
+    """Record one successful Bedrock call and emit it as metrics"""
+    call = {
+        "label": getattr(_label, "value", None),
+        "call_type": call_type,
+        "model_id": model_id,
+        "input_tokens": usage.get("input_tokens", 0) or 0,
+        "output_tokens": usage.get("output_tokens", 0) or 0,
+        "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0) or 0,
+        "cache_creation_input_tokens": usage.get("cache_creation_input_tokens", 0) or 0,
+        "ttfb": round(ttfb, 3) if ttfb is not None else None,
+        "latency": round(latency, 3),
+        "retries": retries,
+        "throttle_wait": round(throttle_wait, 3),
+        "limiter_wait": round(limiter_wait, 3),
+        "at": round(time.time(), 3)
+    }
+    with _lock:
+        _calls.append(call)
+        category = _category
+
+    emit_metrics(call, category)
+    return call
+
+
+def emit_metrics(call, category):
+    """Print the call in CloudWatch embedded metric format, Lambda ships it to CloudWatch Metrics"""
+    values = {
+        "Latency": call["latency"],
+        "TimeToFirstByte": call["ttfb"] if call["ttfb"] is not None else call["latency"],
+        "InputTokens": call["input_tokens"],
+        "OutputTokens": call["output_tokens"],
+        "CacheReadTokens": call["cache_read_input_tokens"],
+        "Retries": call["retries"],
+        "ThrottleWait": call["throttle_wait"]
+    }
+    print(json.dumps({
+        **call,
+        **values,
+        "Category": category or "unknown",
+        "CallType": call["call_type"],
+        "ModelId": call["model_id"],
+        "_aws": {
+            "Timestamp": int(call["at"] * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": METRICS_DIMENSIONS,
+                "Metrics": [{"Name": name, "Unit": unit} for name, unit in METRICS]
+            }]
+        }
+    }))
+
+
+def get_calls():
+    with _lock:
+        return list(_calls)
+
+
+def totals(calls=None):
+    """Token totals and call count, for handler responses"""
+    calls = get_calls() if calls is None else calls
+    result = {"calls": len(calls)}
+    for field in TOKEN_FIELDS:
+        result[field] = sum(call[field] for call in calls)
+    return result
+
+
+def summarize(calls):
+    """Compact per-topic record: totals plus latency and tokens per call type and per label"""
+    summary = totals(calls)
+    for field in TIME_FIELDS:
+        summary[field] = round(sum(call[field] for call in calls), 3)
+    summary["retries"] = sum(call["retries"] for call in calls)
+
+    for group in ("call_type", "label"):
+        grouped = {}
+        for call in calls:
+            entry = grouped.setdefault(call[group] or "unlabeled", {"calls": 0, "latency": 0.0, "output_tokens": 0, "retries": 0})
+            entry["calls"] += 1
+            entry["latency"] = round(entry["latency"] + call["latency"], 3)
+            entry["output_tokens"] += call["output_tokens"]
+            entry["retries"] += call["retries"]
+        summary[f"by_{group}"] = grouped
+
+    return summary
+
+
+def persist(topic_id):
+    """
+    Append this invocation's calls to the topic's usage record in S3 and store the summary
+    on the status item. Continuations and Step Functions retries add to the same record.
+    """
+    calls = get_calls()
+    if not topic_id or not calls: return None
+
+    key = USAGE_KEY.format(topic_id=topic_id)
+    try:
+        obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=key)
+        record = json.loads(obj["Body"].read().decode("utf-8"))
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"): raise
+        record = {"topic_id": topic_id, "calls": []}
+
+    record["category"] = _category
+    record["invocations"] = record.get("invocations", 0) + 1
+    record["calls"].extend(calls)
+    record["summary"] = summarize(record["calls"])
+    s3.put_object(Bucket=CONTENT_BUCKET, Key=key, Body=json.dumps(record), ContentType="application/json")
+
+    # DynamoDB rejects floats, the summary goes in as Decimals
+    status_table.update_item(
+        Key={"topic_id": topic_id},
+        UpdateExpression="SET #usage = :usage",
+        ExpressionAttributeNames={"#usage": "usage"},
+        ExpressionAttributeValues={":usage": json.loads(json.dumps(record["summary"]), parse_float=Decimal)}
+    )
+
+    print(f"Usage for topic {topic_id}:", json.dumps(record["summary"]))
+    return record["summary"]
@@ -0,0 +1,292 @@
+import boto3
+import json
+import time
+import uuid
+from botocore.exceptions import ClientError
+
+import lambda_tech_programming as generator
+import model_router
+import prompt_packs
+from topic_requests import validate_request, store_request, start_step_function
+
+# Bulk catalogue seeding with Bedrock batch inference instead of on-demand calls.
+# A backfill runs in phases, each one a batch job over a JSONL file in S3:
+#   OUTLINES -> one record per topic, ingested as intro.json + outline.json
+#   CHAPTERS -> one record per chapter of every outlined topic, ingested as chapter_N.json
+# after which every topic is started on PodcastGenerationWorkflow with content_ready set,
+# so only the audio stages run. Topics or chapters the batch could not produce are left
+# unmarked and the workflow's content generation step resumes them on demand.
+#
+# Submit:  {"action": "submit", "topics": [{"topic", "desc", "category", "level_of_difficulty", "chapters"}, ...]}
+# Advance: {"action": "advance", "batch_id": "..."}  (idempotent, run it on a schedule until DONE)
+
+bedrock_batch = boto3.client("bedrock", region_name="us-east-1")
+s3 = boto3.client("s3", region_name="us-east-1")
+
+CONTENT_BUCKET = "echopod-content"
+BATCH_PREFIX = "_batch"
+BATCH_ROLE_ARN = "arn:aws:iam::184226036469:role/EPBedrockBatchRole"
+
+# Batch jobs run a single model, the primary of each route
+BATCH_MODELS = {
+    "outline": model_router.ROUTES["outline"]["default"][0],
+    "chapter": model_router.ROUTES["chapter"]["default"][0]
+}
+
+# Bedrock rejects batch jobs below its minimum record count, smaller seeds belong on the normal workflow
+MIN_BATCH_RECORDS = 100
+
+RUNNING_JOB_STATES = {"Submitted", "Validating", "Scheduled", "InProgress", "Stopping"}
+
+
+def lambda_handler(event, context):
+    """Submit a backfill or move an existing one on to its next phase"""
+    print("Received event:", json.dumps(event))
+    action = event.get("action")
+
+    if action == "submit":
+        return submit_backfill(event.get("topics", []), event.get("min_batch_records", MIN_BATCH_RECORDS))
+    if action == "advance":
+        return advance_backfill(event["batch_id"])
+
+    return {"statusCode": 400, "error": f"Unknown action {action!r}, expected 'submit' or 'advance'"}
+
+
+def submit_backfill(topics, min_batch_records=MIN_BATCH_RECORDS):
+    """Register every topic like a normal request and submit the outline batch job"""
+    if len(topics) < min_batch_records:
+        return {
+            "statusCode": 400,
+            "error": f"Batch inference needs at least {min_batch_records} topics, submit {len(topics)} through the normal workflow"
+        }
+
+    try:
+        for request in topics: validate_request(request)
+    except ValueError as e:
+        return {"statusCode": 400, "error": f"Topic {request.get('topic')!r}: {e}"}
+
+    batch_id = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:8]
+    manifest = {"batch_id": batch_id, "phase": "OUTLINES", "created_at": str(int(time.time())), "topics": {}}
+
+    records = []
+    for request in topics:
+        topic_id, request_id = str(uuid.uuid4()), str(uuid.uuid4())
+        store_request(request, topic_id, request_id, str(int(time.time())))
+        generator.update_status(topic_id, "BATCH_GENERATING_INTRODUCTION")
+        manifest["topics"][topic_id] = dict(request, request_id=request_id)
+
+        pack = prompt_packs.get_pack(request["category"])
+        prompt = generator.get_intro_prompt(request["topic"], request["desc"], request["level_of_difficulty"], request["chapters"], pack)
+        records.append(batch_record(f"{topic_id}|outline", [{"role": "user", "content": [{"type": "text", "text": prompt}]}]))
+
+    manifest["job_arn"] = submit_job(batch_id, "outline", records)
+    write_manifest(manifest)
+
+    return {"statusCode": 200, "batch_id": batch_id, "phase": manifest["phase"], "topics": len(topics)}
+
+
+def advance_backfill(batch_id):
+    """Check the current phase's job and, once it has finished, ingest its output and start the next phase"""
+    manifest = read_manifest(batch_id)
+    if manifest["phase"] == "DONE":
+        return {"statusCode": 200, "batch_id": batch_id, "phase": "DONE"}
+
+    job = bedrock_batch.get_model_invocation_job(jobIdentifier=manifest["job_arn"])
+    if job["status"] in RUNNING_JOB_STATES:
+        return {"statusCode": 202, "batch_id": batch_id, "phase": manifest["phase"], "job_status": job["status"]}
+
+    if job["status"] != "Completed":
+        # Failed, stopped or expired: everything left goes through the normal on-demand workflow
+        print(f"Batch job {manifest['job_arn']} ended {job['status']}: {job.get('message')}")
+        start_workflows(manifest)
+        return {"statusCode": 200, "batch_id": batch_id, "phase": "DONE", "job_status": job["status"]}
+
+    outputs = read_job_output(manifest, job)
+    if manifest["phase"] == "OUTLINES":
+        ingest_outlines(manifest, outputs)
+        records = build_chapter_records(manifest)
+        if records:
+            manifest["job_arn"] = submit_job(batch_id, "chapter", records)
+            manifest["phase"] = "CHAPTERS"
+            write_manifest(manifest)
+            return {"statusCode": 202, "batch_id": batch_id, "phase": "CHAPTERS", "records": len(records)}
+    else:
+        ingest_chapters(manifest, outputs)
+
+    start_workflows(manifest)
+    return {"statusCode": 200, "batch_id": batch_id, "phase": "DONE", "summary": summarize(manifest)}
+
+
+def batch_record(record_id, messages):
+    """One JSONL line of batch input, the model input matches the on-demand calls"""
+    # Batch inference has no prompt cache to write to
+    for message in messages:
+        for block in message["content"]:
+            block.pop("cache_control", None)
+
+    return {
+        "recordId": record_id,
+        "modelInput": {
+            "anthropic_version": "bedrock-2023-05-31",
+            "messages": messages,
+            "max_tokens": 4096,
+            "temperature": 0.5,
+            "top_p": 0.999
+        }
+    }
+
+
+def submit_job(batch_id, call_type, records):
+    """Write the records as JSONL and start a batch inference job over them"""
+    input_key = f"{BATCH_PREFIX}/{batch_id}/{call_type}/input.jsonl"
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=input_key,
+        Body="\n".join(json.dumps(record) for record in records),
+        ContentType="application/jsonl"
+    )
+
+    response = bedrock_batch.create_model_invocation_job(
+        jobName=f"echopod-{batch_id}-{call_type}",
+        roleArn=BATCH_ROLE_ARN,
+        modelId=BATCH_MODELS[call_type],
+        inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{CONTENT_BUCKET}/{input_key}", "s3InputFormat": "JSONL"}},
+        outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{CONTENT_BUCKET}/{BATCH_PREFIX}/{batch_id}/{call_type}/output/"}}
+    )
+    print(f"Submitted {call_type} batch job {response['jobArn']} with {len(records)} records")
+    return response["jobArn"]
+
+
+def read_job_output(manifest, job):
+    """Response text and stop reason per record id; records that errored are left out"""
+    call_type = "outline" if manifest["phase"] == "OUTLINES" else "chapter"
+    job_id = job["jobArn"].rsplit("/", 1)[-1]
+    prefix = f"{BATCH_PREFIX}/{manifest['batch_id']}/{call_type}/output/{job_id}/"
+
+    output_keys = []
+    list_args = {"Bucket": CONTENT_BUCKET, "Prefix": prefix}
+    while True:
+        response = s3.list_objects_v2(**list_args)
+        output_keys.extend(obj["Key"] for obj in response.get("Contents", []) if obj["Key"].endswith(".jsonl.out"))
+        if not response.get("IsTruncated"): break
+        list_args["ContinuationToken"] = response["NextContinuationToken"]
+
+    outputs = {}
+    for key in output_keys:
+        body = s3.get_object(Bucket=CONTENT_BUCKET, Key=key)["Body"].read().decode("utf-8")
+        for line in filter(None, body.splitlines()):
+            result = json.loads(line)
+            output = result.get("modelOutput")
+            if not output:
+                print(f"Batch record {result['recordId']} failed: {result.get('error')}")
+                continue
+            outputs[result["recordId"]] = (output.get("content", [{}])[0].get("text", ""), output.get("stop_reason"))
+
+    return outputs
+
+
+def ingest_outlines(manifest, outputs):
+    """Store intro.json and outline.json for every topic whose outline parsed"""
+    for topic_id, request in manifest["topics"].items():
+        text, _ = outputs.get(f"{topic_id}|outline", (None, None))
+        outline, error = generator.parse_outline(text, request["chapters"]) if text else (None, "no batch output")
+        if not outline:
+            print(f"No usable batch outline for {topic_id} ({error}), leaving it to the workflow")
+            continue
+
+        s3.put_object(
+            Bucket=CONTENT_BUCKET,
+            Key=f"{topic_id}/intro.json",
+            Body=json.dumps({"content": generator.render_intro_script(outline)}),
+            ContentType="application/json"
+        )
+        generator.store_outline(topic_id, outline)
+        generator.update_status(topic_id, "BATCH_GENERATING_CHAPTERS", intro_complete=True)
+        request["outline"] = True
+
+
+def build_chapter_records(manifest):
+    """One record per chapter, written from the outline alone like parallel generation does"""
+    records = []
+    for topic_id, request in manifest["topics"].items():
+        if not request.get("outline"): continue
+
+        outline = generator.read_content_object(topic_id, "outline.json")
+        pack = prompt_packs.get_pack(request["category"])
+        conversation = generator.get_intro_conversation(
+            request["topic"], request["desc"], request["level_of_difficulty"], request["chapters"], outline, pack
+        )
+        for entry in outline["chapters"]:
+            prompt = generator.get_outline_chapter_prompt(entry, len(outline["chapters"]), pack)
+            messages = conversation + [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+            records.append(batch_record(f"{topic_id}|chapter_{entry['number']}", json.loads(json.dumps(messages))))
+
+    return records
+
+
+def ingest_chapters(manifest, outputs):
+    """
+    Store every chapter that finished. Chapters cut off at max_tokens are not stored, the
+    workflow regenerates them on demand where it can continue a truncated response.
+    """
+    for topic_id, request in manifest["topics"].items():
+        if not request.get("outline"): continue
+
+        stored = []
+        for number in range(1, request["chapters"] + 1):
+            text, stop_reason = outputs.get(f"{topic_id}|chapter_{number}", (None, None))
+            if not text or stop_reason == "max_tokens": continue
+
+            generator.store_chapter(topic_id, number, text)
+            generator.update_chapter_status(topic_id, number, True)
+            stored.append(number)
+
+        request["chapters_stored"] = stored
+
+
+def start_workflows(manifest):
+    """Start PodcastGenerationWorkflow for every topic, skipping content generation when it is all there"""
+    for topic_id, request in manifest["topics"].items():
+        if request.get("started"): continue
+
+        content_ready = bool(request.get("outline")) and len(request.get("chapters_stored", [])) == request["chapters"]
+        if content_ready: generator.update_status(topic_id, "CONTENT_GENERATION_COMPLETE")
+
+        try:
+            start_step_function(request, topic_id, request["request_id"], content_ready=content_ready)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ExecutionAlreadyExists": raise
+        request["started"] = True
+        request["content_ready"] = content_ready
+
+    manifest["phase"] = "DONE"
+    write_manifest(manifest)
+
+
+def summarize(manifest):
+    topics = manifest["topics"].values()
+    return {
+        "topics": len(topics),
+        "outlines": sum(1 for request in topics if request.get("outline")),
+        "content_ready": sum(1 for request in topics if request.get("content_ready"))
+    }
+
+
+def read_manifest(batch_id):
+    obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=f"{BATCH_PREFIX}/{batch_id}/manifest.json")
+    return json.loads(obj["Body"].read().decode("utf-8"))
+
+
+def write_manifest(manifest):
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=f"{BATCH_PREFIX}/{manifest['batch_id']}/manifest.json",
+        Body=json.dumps(manifest),
+        ContentType="application/json"
+    )
+
+# zip function.zip bulk_backfill.py topic_requests.py lambda_tech_programming.py rate_limiter.py generation_cache.py topic_similarity.py model_router.py prompt_packs.py prompt_packs.json bedrock_usage.py
+# aws lambda update-function-code \
+#     --function-name EPBulkBackfill \
+#     --zip-file fileb://function.zip \
+#     --region us-east-1
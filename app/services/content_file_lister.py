@@ -1,10 +1,14 @@
 import boto3
 import os
+import re
 import json
 
 s3 = boto3.client("s3", region_name="us-east-1")
 CONTENT_BUCKET = "echopod-content"
 
+# Only these objects are spoken content, everything else under a topic (outline.json, ...) is metadata
+SPOKEN_CONTENT_PATTERN = re.compile(r"^(intro|chapter_\d+)$")
+
 def lambda_handler(event, context):
     print("Received event:", json.dumps(event))
     
@@ -28,9 +32,10 @@ def lambda_handler(event, context):
         for obj in response["Contents"]:
             key = obj["Key"]
             if key.endswith(".json"):
-                files.append(key)
                 filename = os.path.basename(key)
                 chapter_key = filename.split(".")[0]  # intro.json → intro
+                if not SPOKEN_CONTENT_PATTERN.match(chapter_key): continue
+                files.append(key)
                 chapter_keys.append(chapter_key)
         
         return {
@@ -0,0 +1,97 @@
+import boto3
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+
+s3 = boto3.client("s3", region_name="us-east-1")
+
+# Cached generations live next to topic content, under a prefix no topic_id can collide with
+CONTENT_BUCKET = "echopod-content"
+CACHE_PREFIX = "_cache/generation"
+LRU_SIZE = 128
+
+# In-process LRU of manifests in front of S3, survives across warm invocations
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def normalize(value):
+    """Case-fold and collapse whitespace so trivially different requests share a key"""
+    return " ".join(str(value or "").lower().split())
+
+
+def make_cache_key(category, topic, desc, level_of_difficulty, chapters, prompt_version):
+    """Content-addressed key for a generation request"""
+    parts = [
+        normalize(category),
+        normalize(topic),
+        normalize(desc),
+        normalize(level_of_difficulty),
+        int(chapters),
+        str(prompt_version)
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def lookup(cache_key):
+    """Return the cached manifest for cache_key, or None on a miss"""
+    with _lru_lock:
+        if cache_key in _lru:
+            _lru.move_to_end(cache_key)
+            return _lru[cache_key]
+
+    try:
+        obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=f"{CACHE_PREFIX}/{cache_key}/manifest.json")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"): return None
+        raise
+
+    manifest = json.loads(obj["Body"].read().decode("utf-8"))
+    remember(cache_key, manifest)
+    return manifest
+
+
+def store(cache_key, topic_id, object_names):
+    """Copy a finished topic's content objects into the cache and write its manifest last"""
+    for name in object_names:
+        s3.copy_object(
+            Bucket=CONTENT_BUCKET,
+            Key=f"{CACHE_PREFIX}/{cache_key}/{name}",
+            CopySource={"Bucket": CONTENT_BUCKET, "Key": f"{topic_id}/{name}"}
+        )
+
+    manifest = {
+        "cache_key": cache_key,
+        "source_topic_id": topic_id,
+        "objects": list(object_names),
+        "created_at": str(int(time.time()))
+    }
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=f"{CACHE_PREFIX}/{cache_key}/manifest.json",
+        Body=json.dumps(manifest),
+        ContentType="application/json"
+    )
+    remember(cache_key, manifest)
+    return manifest
+
+
+def materialize(manifest, topic_id):
+    """Server-side copy every cached object into place for a new topic_id"""
+    for name in manifest["objects"]:
+        s3.copy_object(
+            Bucket=CONTENT_BUCKET,
+            Key=f"{topic_id}/{name}",
+            CopySource={"Bucket": CONTENT_BUCKET, "Key": f"{CACHE_PREFIX}/{manifest['cache_key']}/{name}"}
+        )
+
+
+def remember(cache_key, manifest):
+    with _lru_lock:
+        _lru[cache_key] = manifest
+        _lru.move_to_end(cache_key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
@@ -1,8 +1,17 @@
 import boto3
 import json
+import re
 import time
-import random
+import uuid
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from botocore.exceptions import ClientError
+from rate_limiter import get_limiter, backoff_delay
+import generation_cache
+import topic_similarity
+import model_router
+import prompt_packs
+import bedrock_usage
 
 lambda_client = boto3.client("lambda", region_name="us-east-1")
 sqs = boto3.client("sqs", region_name="us-east-1")
@@ -12,17 +21,73 @@ s3 = boto3.client('s3', region_name="us-east-1")
 dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
 status_table = dynamodb.Table("EPPodcastStatus")
 
+# One limiter paces every Bedrock call in this container, chapter threads included.
+# Calls slower than the latency target count as pressure, like a throttle but gentler.
+BEDROCK_LATENCY_TARGET_SECONDS = 90
+bedrock_limiter = get_limiter("bedrock", latency_target=BEDROCK_LATENCY_TARGET_SECONDS)
+
 # S3 bucket for content storage
 CONTENT_BUCKET = "echopod-content"
 
+# Chapter generation modes: "sequential" writes one chapter per conversation turn,
+# "parallel" writes every chapter at once from the shared intro and outline
+DEFAULT_GENERATION_MODE = "sequential"
+DEFAULT_CHAPTER_CONCURRENCY = 4
+MAX_CHAPTER_CONCURRENCY = 8
+
+# Sequential context strategies: "recap" builds each chapter call from intro + outline + a short
+# recap per finished chapter, "window" keeps the original first/last message window
+DEFAULT_CONTEXT_STRATEGY = "recap"
+RECAP_WITH_MODEL = False
+RECAP_MAX_SENTENCES = 3
+RECAP_MAX_CHARS = 600
+
+# Mark the shared intro prompt + outline as a prompt-cache checkpoint so chapter calls
+# 2..N read that prefix from Bedrock's cache instead of reprocessing it
+PROMPT_CACHING = True
+
+# Difficulty of the request being handled, used to pick models per call
+current_difficulty = None
+
+# Prompt pack (intro/chapter templates and style rules) for the category being handled
+current_pack = prompt_packs.DEFAULT_PACK
+
+# Deadline scheduling: a chapter is only started when the Lambda has time left to finish it,
+# otherwise the handler returns a continuation payload and the state machine invokes it again
+DEADLINE_SAFETY_MARGIN_SECONDS = 30
+DEFAULT_CHAPTER_ESTIMATE_SECONDS = 90
+MAX_CONTINUATIONS = 10
+
+# Bump whenever the intro/chapter prompts change so cached generations from older prompts stop matching
+PROMPT_TEMPLATE_VERSION = "3"
+
+# Estimated Jaccard similarity of topic+desc above which a stored outline is reused
+SIMILAR_OUTLINE_THRESHOLD = 0.7
+
+# Attempts at getting a parseable JSON outline out of the intro stage
+MAX_OUTLINE_ATTEMPTS = 3
+
+# A response cut off at max_tokens is continued from its last complete sentence at most this many times
+MAX_TRUNCATION_CONTINUATIONS = 3
+SENTENCE_END = re.compile(r"[.!?][\"')\]]?(?=\s)")
+SENTENCE_END_AT_END = re.compile(r"[.!?][\"')\]]?$")
+
+# Streaming: chapter text is flushed to S3 in paragraph-sized segments while it is
+# still being written and each segment is handed to EPPolly straight away
+DEFAULT_STREAM_TO_TTS = False
+POLLY_FUNCTION_NAME = "EPPolly"
+STREAM_SEGMENT_MIN_CHARS = 400
+STREAM_SEGMENT_MAX_CHARS = 2800
 
-def generate_content(prompt, max_retries=8):
+
+def generate_content(prompt, max_retries=8, call_type="outline"):
     retries = 0
-    backoff_time = 2
+    throttle_wait = limiter_wait = 0.0
     
     while retries < max_retries:
+        model_id = model_router.pick(call_type, current_difficulty)
         try:
-            time.sleep(0.5)
+            limiter_wait += bedrock_limiter.acquire()
             payload = {
                 "anthropic_version": "bedrock-2023-05-31",
                 "messages": [
@@ -38,30 +103,32 @@ def generate_content(prompt, max_retries=8):
                 "top_p": 0.999
             }
 
+            started = time.time()
             response = bedrock.invoke_model(
-                modelId="us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+                modelId=model_id,
                 body=json.dumps(payload),
                 contentType="application/json",
                 accept="application/json"
             )
-            
-            # ✅ Debug: Log raw response
-            print("DEBUG: Raw Bedrock Response:", response)
-
-            
-            # ✅ Fix: Read the response stream correctly
-            # response_body = response["body"].read().decode("utf-8")  # 🔥 Properly read and decode StreamingBody
+            ttfb = time.time() - started
             
             response_body = response["body"].read().decode("utf-8")
             response_json = json.loads(response_body)
+            latency = time.time() - started
+            bedrock_limiter.on_success(latency)
+            model_router.record_success(call_type, model_id, latency)
+            bedrock_usage.record_call(
+                call_type, model_id, response_json.get("usage", {}), latency, ttfb, retries, throttle_wait, limiter_wait
+            )
             return response_json.get("content", [{}])[0].get("text", "")
         
         except bedrock.exceptions.ThrottlingException as e:
             retries += 1
-            wait_time = backoff_time * (2 ** retries) + random.uniform(0, 0.5)
-            time.sleep(wait_time)
+            bedrock_limiter.on_throttle()
+            throttle_wait += wait_for_retry(call_type, model_id, retries)
         
         except Exception as e:
+            model_router.record_error(call_type, model_id)
             print(f"Error generating content: str{(e)}")
             return None
     
@@ -72,10 +139,27 @@ def generate_content(prompt, max_retries=8):
 def lambda_handler(event, context):
     
     """
-    Handles content generation for tech & programming podcasts
+    Handles content generation for every podcast category, the category's prompt pack drives the prompts
     Called by Step Functions
     """
     print("Received event:", json.dumps(event))
+    bedrock_usage.reset(event.get("category"))
+    model_router.reset_stats()
+    try:
+        return generate_topic(event, context)
+    finally:
+        # Whatever the outcome, keep the per-call usage of this invocation on the topic
+        try:
+            bedrock_usage.persist(event.get("topic_id"))
+        except Exception as e:
+            print(f"Error persisting usage: {str(e)}")
+
+
+def generate_topic(event, context):
+    """Generate the outline and chapters for one topic, or as much of it as this invocation has time for"""
+    global current_difficulty, current_pack
+    current_difficulty = event.get("level_of_difficulty")
+    current_pack = prompt_packs.get_pack(event.get("category"))
     
     topic_id = event.get("topic_id")
     topic = event.get("topic")
@@ -83,81 +167,623 @@ def lambda_handler(event, context):
     difficulty = event.get("level_of_difficulty")
     chapters = event.get("chapters")
     
-    # Update status in DynamoDB
-    update_status(topic_id, "GENERATING_INTRODUCTION")
+    # Step Functions retries re-run the handler, so pick up whatever an earlier attempt already stored
+    outline, completed_chapters = load_checkpoint(topic_id, chapters)
+    
+    # Serve identical (after normalization) requests from the generation cache
+    use_cache = event.get("use_cache", True)
+    cache_key = generation_cache.make_cache_key(
+        event.get("category"), topic, desc, difficulty, chapters, get_prompt_version()
+    )
+    if use_cache and not outline and serve_from_cache(topic_id, cache_key, chapters):
+        return {
+            "statusCode": 200,
+            "topic_id": topic_id,
+            "message": "Content served from generation cache",
+            "cache_hit": True,
+            "next_step": "AUDIO_GENERATION"
+        }
+    
+    if outline:
+        print(f"Resuming topic {topic_id}: outline and {len(completed_chapters)} of {chapters} chapters already stored")
+    else:
+        outline = create_outline(event, topic_id, use_cache)
+        if not outline:
+            update_status(topic_id, "FAILED")
+            return {
+                "statusCode": 500,
+                "error": "Failed to generate introduction"
+            }
     
-    # Generate introduction and chapter outline
-    intro_content = generate_introduction(topic, desc, difficulty, chapters)
+    # Initialize conversation history for chapter generation
+    conversation = get_intro_conversation(topic, desc, difficulty, chapters, outline)
     
-    if not intro_content:
+    scheduler = DeadlineScheduler(context)
+    generation_mode = event.get("generation_mode", DEFAULT_GENERATION_MODE)
+    stream_to_tts = event.get("stream_to_tts", DEFAULT_STREAM_TO_TTS)
+    if generation_mode == "parallel":
+        max_concurrency = get_chapter_concurrency(event)
+        failed_chapter, next_chapter = generate_chapters_in_parallel(
+            topic_id, conversation, outline, max_concurrency, stream_to_tts, completed_chapters, scheduler
+        )
+    else:
+        context_strategy = event.get("context_strategy", DEFAULT_CONTEXT_STRATEGY)
+        failed_chapter, next_chapter = generate_chapters_sequentially(
+            topic_id, conversation, chapters, stream_to_tts, context_strategy, completed_chapters, scheduler
+        )
+    
+    if failed_chapter:
         update_status(topic_id, "FAILED")
         return {
             "statusCode": 500,
-            "error": "Failed to generate introduction"
+            "error": f"Failed to generate chapter {failed_chapter}"
         }
     
-    # Store introduction in S3
+    if next_chapter:
+        return build_continuation(event, topic_id, next_chapter)
+    
+    # Streamed chapters carry per-topic audio bookkeeping, so only plain runs are cached
+    if use_cache and not stream_to_tts: cache_generation(cache_key, topic_id, chapters)
+    
+    # Update status to content generation complete
+    update_status(topic_id, "CONTENT_GENERATION_COMPLETE")
+    
+    # Return success response
+    return {
+        "statusCode": 200,
+        "topic_id": topic_id,
+        "message": "Content generation complete",
+        "usage": bedrock_usage.totals(),
+        "routing": model_router.get_stats(),
+        "next_step": "AUDIO_GENERATION"
+    }
+    
+def build_continuation(event, topic_id, next_chapter):
+    """
+    Stop cleanly before the Lambda timeout. The continuation carries the original request plus
+    where to pick up; the stored outline and chapters (see load_checkpoint) are the context.
+    """
+    continuation_count = event.get("continuation_count", 0) + 1
+    if continuation_count > MAX_CONTINUATIONS:
+        update_status(topic_id, "FAILED")
+        return {
+            "statusCode": 500,
+            "error": f"Gave up after {MAX_CONTINUATIONS} continuations at chapter {next_chapter}"
+        }
+    
+    print(f"Not enough time left for chapter {next_chapter}, handing off to continuation {continuation_count}")
+    update_status(topic_id, f"CONTINUING_AT_CHAPTER_{next_chapter}")
+    
+    continuation = dict(event)
+    continuation.update({
+        "next_chapter": next_chapter,
+        "context_pointer": f"s3://{CONTENT_BUCKET}/{topic_id}/outline.json",
+        "continuation_count": continuation_count
+    })
+    
+    return {
+        "statusCode": 202,
+        "topic_id": topic_id,
+        "message": f"Content generation continuing at chapter {next_chapter}",
+        "usage": bedrock_usage.totals(),
+        "continuation": continuation
+    }
+
+
+class DeadlineScheduler:
+    """
+    Predicts the next chapter's duration from the chapter calls observed so far
+    and compares it with the time the Lambda has left.
+    """
+    
+    def __init__(self, context, safety_margin=DEADLINE_SAFETY_MARGIN_SECONDS, default_estimate=DEFAULT_CHAPTER_ESTIMATE_SECONDS):
+        self.context = context
+        self.safety_margin = safety_margin
+        self.default_estimate = default_estimate
+        self.durations = []
+        self.started = 0
+    
+    def start(self):
+        self.started += 1
+    
+    def record(self, seconds):
+        self.durations.append(seconds)
+    
+    def predicted_duration(self):
+        """Slowest chapter so far, throttling back-offs make averages too optimistic"""
+        return max(self.durations) if self.durations else self.default_estimate
+    
+    def remaining_seconds(self):
+        if not self.context or not hasattr(self.context, "get_remaining_time_in_millis"): return float("inf")
+        return self.context.get_remaining_time_in_millis() / 1000
+    
+    def has_time_for_next(self):
+        """
+        The first chapter of an invocation always goes ahead. With a timeout below the margin plus
+        the estimate, every continuation would otherwise hand on the same chapter until the workflow
+        runs out of continuations.
+        """
+        fits = self.remaining_seconds() - self.safety_margin >= self.predicted_duration()
+        if not self.started:
+            if not fits: print(f"Only {self.remaining_seconds():.0f}s left, writing one chapter anyway")
+            return True
+        return fits
+
+
+def create_outline(event, topic_id, use_cache):
+    """Produce, store and mark complete the introduction and outline for a fresh run"""
+    topic = event.get("topic")
+    desc = event.get("desc")
+    difficulty = event.get("level_of_difficulty")
+    chapters = event.get("chapters")
+    
+    # Update status in DynamoDB
+    update_status(topic_id, "GENERATING_INTRODUCTION")
+    
+    # Reuse the outline of a near-duplicate topic, otherwise generate introduction and structured chapter outline
+    bedrock_usage.set_label("outline")
+    similarity_scope = get_similarity_scope(event.get("category"), difficulty, chapters)
+    outline = find_similar_outline(topic, desc, similarity_scope) if use_cache else None
+    if not outline:
+        outline = generate_introduction(topic, desc, difficulty, chapters)
+        if outline and use_cache: index_outline(topic_id, topic, desc, similarity_scope)
+    
+    if not outline: return None
+    
+    # Store the spoken introduction and the outline artifact in S3
+    intro_content = render_intro_script(outline)
     s3.put_object(
         Bucket=CONTENT_BUCKET,
         Key=f"{topic_id}/intro.json",
         Body=json.dumps({"content": intro_content}),
         ContentType="application/json"
     )
+    store_outline(topic_id, outline)
     
     # Mark introduction as complete
     update_status(topic_id, "GENERATING_CHAPTERS", intro_complete=True)
     
-    # Initialize conversation history for chapter generation
-    conversation = [
-        {"role": "user", "content": [{"type": "text", "text": get_intro_prompt(topic, desc, difficulty, chapters)}]},
-        {"role": "assistant", "content": [{"type": "text", "text": intro_content}]}
-    ]
+    return outline
+
+
+def load_checkpoint(topic_id, chapters):
+    """
+    Read what an earlier attempt already produced: the outline (once the intro is marked complete)
+    and every chapter that is both marked complete and stored in S3, keyed by chapter number.
+    """
+    try:
+        item = status_table.get_item(Key={"topic_id": topic_id}).get("Item", {})
+        if not item.get("intro_complete"): return None, {}
+        
+        outline = read_content_object(topic_id, "outline.json")
+        if not outline: return None, {}
+        
+        stored_keys = set()
+        response = s3.list_objects_v2(Bucket=CONTENT_BUCKET, Prefix=f"{topic_id}/chapter_")
+        for obj in response.get("Contents", []):
+            stored_keys.add(obj["Key"])
+        
+        completed_chapters = {}
+        for number, complete in item.get("chapters_complete", {}).items():
+            key = f"{topic_id}/chapter_{number}.json"
+            if not complete or key not in stored_keys or int(number) > chapters: continue
+            completed_chapters[int(number)] = read_content_object(topic_id, f"chapter_{number}.json")["content"]
+        
+        return outline, completed_chapters
+    except Exception as e:
+        print(f"Error reading checkpoint, starting from scratch: {str(e)}")
+        return None, {}
+
+
+def read_content_object(topic_id, name):
+    """Read a JSON content object of the topic, None if it doesn't exist"""
+    try:
+        obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=f"{topic_id}/{name}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"): return None
+        raise
+    
+    return json.loads(obj["Body"].read().decode("utf-8"))
+
+
+def serve_from_cache(topic_id, cache_key, chapters):
+    """Materialize a cached generation for topic_id, returns False on a miss or any cache error"""
+    try:
+        manifest = generation_cache.lookup(cache_key)
+        if not manifest: return False
+        
+        print(f"Generation cache hit {cache_key} from topic {manifest['source_topic_id']}")
+        generation_cache.materialize(manifest, topic_id)
+    except Exception as e:
+        print(f"Error reading generation cache: {str(e)}")
+        return False
     
-    # Generate each chapter
-    # all_chapters_complete = True
+    update_status(topic_id, "GENERATING_CHAPTERS", intro_complete=True)
     for i in range(1, chapters + 1):
-        update_status(topic_id, f"GENERATING_CHAPTER_{i}")
+        update_chapter_status(topic_id, i, True)
+    update_status(topic_id, "CONTENT_GENERATION_COMPLETE")
+    
+    return True
+
+
+def cache_generation(cache_key, topic_id, chapters):
+    """Copy a finished generation into the cache, a cache failure never fails the run"""
+    object_names = ["intro.json", "outline.json"] + [f"chapter_{i}.json" for i in range(1, chapters + 1)]
+    try:
+        generation_cache.store(cache_key, topic_id, object_names)
+    except Exception as e:
+        print(f"Error writing generation cache: {str(e)}")
+
+
+def get_prompt_version():
+    """Template version plus prompt-pack registry version, so editing a pack invalidates cached generations"""
+    return f"{PROMPT_TEMPLATE_VERSION}.{prompt_packs.REGISTRY_VERSION}"
+
+
+def get_similarity_scope(category, difficulty, chapters):
+    """Outlines are only interchangeable between requests with the same category, difficulty and length"""
+    return "|".join([generation_cache.normalize(category), generation_cache.normalize(difficulty), str(chapters)])
+
+
+def find_similar_outline(topic, desc, scope):
+    """Load the stored outline of a near-duplicate topic, or None when there isn't one"""
+    try:
+        match = topic_similarity.find_similar(f"{topic} {desc}", scope, SIMILAR_OUTLINE_THRESHOLD)
+        if not match: return None
         
+        source_topic_id, meta, score = match
+        print(f"Reusing outline of topic {source_topic_id} ({meta.get('topic')}), similarity {score:.2f}")
+        obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=f"{source_topic_id}/outline.json")
+        return json.loads(obj["Body"].read().decode("utf-8"))
+    except Exception as e:
+        print(f"Error looking up similar outline: {str(e)}")
+        return None
+
+
+def index_outline(topic_id, topic, desc, scope):
+    """Make a freshly generated outline available to near-duplicate requests"""
+    try:
+        topic_similarity.add(topic_id, f"{topic} {desc}", scope, {"topic": topic})
+    except Exception as e:
+        print(f"Error updating topic similarity index: {str(e)}")
+
+
+def generate_chapters_sequentially(topic_id, conversation, chapters, stream_to_tts=False,
+                                   context_strategy=DEFAULT_CONTEXT_STRATEGY, completed_chapters=None, scheduler=None):
+    """
+    Generate chapters one conversation turn at a time.
+    Chapters in completed_chapters are not regenerated, they only rebuild the context.
+    Returns (failed chapter, chapter to continue from when out of time), both None on success.
+    """
+    completed_chapters = completed_chapters or {}
+    intro_conversation = list(conversation)
+    recaps = []
+    
+    for i in range(1, chapters + 1):
+        # Recaps of resumed chapters are made here without write_chapter, so label them too
+        bedrock_usage.set_label(f"chapter_{i}")
         chapter_prompt = get_chapter_prompt(i)
-        conversation.append({"role": "user", "content": [{"type": "text", "text": chapter_prompt}]})
-        
-        # Generate chapter content
-        chapter_content = generate_content_with_context(conversation)
+        if context_strategy == "recap":
+            # Prompt size stays flat: intro + outline + one short recap per finished chapter
+            conversation = intro_conversation + [
+                {"role": "user", "content": [{"type": "text", "text": get_recap_context(recaps) + chapter_prompt}]}
+            ]
+        else:
+            conversation.append({"role": "user", "content": [{"type": "text", "text": chapter_prompt}]})
         
+        chapter_content = completed_chapters.get(i)
         if not chapter_content:
-            update_status(topic_id, "FAILED")
-            return {
-                "statusCode": 500,
-                "error": f"Failed to generate chapter {i}"
-            }
+            if scheduler:
+                if not scheduler.has_time_for_next(): return None, i
+                scheduler.start()
+            update_status(topic_id, f"GENERATING_CHAPTER_{i}")
+            
+            # Generate and store chapter content
+            started = time.time()
+            chapter_content = write_chapter(topic_id, i, conversation, stream_to_tts)
+            if not chapter_content: return i, None
+            if scheduler: scheduler.record(time.time() - started)
+            
+            # Mark chapter as complete
+            update_chapter_status(topic_id, i, True)
         
-        # Add chapter content to conversation history
-        conversation.append({"role": "assistant", "content": [{"type": "text", "text": chapter_content}]})
+        if context_strategy == "recap":
+            recaps.append(summarize_chapter(chapter_content))
+        else:
+            # Add chapter content to conversation history
+            conversation.append({"role": "assistant", "content": [{"type": "text", "text": chapter_content}]})
+            
+            # Manage conversation context length if needed
+            conversation = manage_conversation_context(conversation)
+    
+    return None, None
+
+
+def summarize_chapter(chapter_content):
+    """Short recap of a finished chapter, from a cheap model call or an extractive summary"""
+    if RECAP_WITH_MODEL:
+        recap = generate_content(get_recap_prompt(chapter_content), call_type="recap")
+        if recap: return recap.strip()[:RECAP_MAX_CHARS]
+    
+    # Chapters open with a recap of the previous chapter, so skip the first sentence
+    sentences = [s.strip() for s in chapter_content.replace("\n", " ").split(". ") if s.strip()]
+    recap = ""
+    for sentence in sentences[1:1 + RECAP_MAX_SENTENCES] or sentences[:1]:
+        if not sentence.endswith((".", "?", "!")): sentence += "."
+        if recap and len(recap) + len(sentence) + 1 > RECAP_MAX_CHARS: break
+        recap += (" " if recap else "") + sentence
+    
+    return recap[:RECAP_MAX_CHARS]
+
+
+def get_recap_context(recaps):
+    """Recaps of the chapters written so far, prepended to the next chapter prompt"""
+    if not recaps: return ""
+    
+    lines = ["Chapters written so far (recaps):"]
+    for number, recap in enumerate(recaps, start=1):
+        lines.append(f"Chapter {number}: {recap}")
+    
+    return "\n".join(lines) + "\n"
+
+
+def generate_chapters_in_parallel(topic_id, intro_conversation, outline, max_concurrency, stream_to_tts=False,
+                                 completed_chapters=None, scheduler=None):
+    """
+    Generate all chapters concurrently, each seeded only with the intro and outline.
+    Chapters in completed_chapters are skipped, and no new chapter is started once the
+    scheduler says it could not finish in time.
+    Returns (failed chapter, chapter to continue from when out of time), both None on success.
+    """
+    completed_chapters = completed_chapters or {}
+    total_chapters = len(outline["chapters"])
+    pending_entries = [entry for entry in outline["chapters"] if entry["number"] not in completed_chapters]
+    
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        in_flight = {}
         
-        # Store chapter in S3
-        s3.put_object(
-            Bucket=CONTENT_BUCKET,
-            Key=f"{topic_id}/chapter_{i}.json",
-            Body=json.dumps({"content": chapter_content}),
-            ContentType="application/json"
+        while pending_entries or in_flight:
+            # Keep the pool full while there is time to finish another chapter
+            while pending_entries and len(in_flight) < max_concurrency:
+                if scheduler:
+                    if not scheduler.has_time_for_next(): break
+                    scheduler.start()
+                entry = pending_entries.pop(0)
+                future = executor.submit(generate_chapter_from_outline, topic_id, intro_conversation, entry, total_chapters, stream_to_tts)
+                in_flight[future] = (entry["number"], time.time())
+            
+            if not in_flight: return None, pending_entries[0]["number"]
+            
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chapter_number, started = in_flight.pop(future)
+                try:
+                    chapter_content = future.result()
+                except Exception as e:
+                    print(f"Error generating chapter {chapter_number}: {str(e)}")
+                    chapter_content = None
+                
+                # The run has already failed, let in-flight chapters finish but start no more
+                if not chapter_content: return chapter_number, None
+                
+                if scheduler: scheduler.record(time.time() - started)
+                
+                # DynamoDB updates stay on the handler thread
+                update_chapter_status(topic_id, chapter_number, True)
+    
+    return None, None
+
+
+def generate_chapter_from_outline(topic_id, intro_conversation, outline_entry, total_chapters, stream_to_tts=False):
+    """Write a single chapter from the shared intro/outline and store it in S3"""
+    conversation = intro_conversation + [
+        {"role": "user", "content": [{"type": "text", "text": get_outline_chapter_prompt(outline_entry, total_chapters)}]}
+    ]
+    
+    return write_chapter(topic_id, outline_entry["number"], conversation, stream_to_tts)
+
+
+def write_chapter(topic_id, chapter_number, conversation, stream_to_tts=False):
+    """Generate one chapter and store it in S3, streaming segments to Polly when enabled"""
+    bedrock_usage.set_label(f"chapter_{chapter_number}")
+    if not stream_to_tts:
+        chapter_content = generate_complete_content(
+            conversation, lambda messages: generate_content_with_context(messages, return_stop_reason=True)
         )
+        if chapter_content: store_chapter(topic_id, chapter_number, chapter_content)
+        return chapter_content
+    
+    content_type = f"chapter_{chapter_number}"
+    take = start_stream_take(topic_id, content_type)
+    segmenter = StreamSegmenter(lambda part, text: publish_stream_segment(topic_id, content_type, take, part, text))
+    
+    chapter_content = generate_complete_content(
+        conversation, lambda messages: generate_content_streaming(messages, segmenter), segmenter
+    )
+    if chapter_content:
+        segmenter.flush()
+        store_chapter(topic_id, chapter_number, chapter_content, streamed_parts=segmenter.parts, take=take)
+        record_streamed_parts(topic_id, content_type, take, segmenter.parts)
+    
+    return chapter_content
+
+
+def generate_complete_content(conversation, generate, segmenter=None):
+    """
+    Run generate(messages) -> (text, stop_reason) and, while the model stops on max_tokens,
+    prefill the text kept up to its last complete sentence and let the model carry on from there.
+    Text already sent out by the segmenter can't be taken back, so streamed cuts only trim its buffer.
+    """
+    text, stop_reason = generate(conversation)
+    continuations = 0
+    
+    while text and stop_reason == "max_tokens" and continuations < MAX_TRUNCATION_CONTINUATIONS:
+        continuations += 1
+        kept, tail = split_at_sentence_boundary(text)
+        if segmenter and tail:
+            # A paragraph the segmenter just released takes the whitespace before the tail with it
+            partial = tail.lstrip()
+            buffered = segmenter.buffer.rstrip()
+            if buffered.endswith(partial):
+                segmenter.buffer = buffered[:-len(partial)].rstrip()
+            else:
+                kept = text.rstrip()
+        print(f"Response hit max_tokens, continuing ({continuations}) after {len(kept)} chars")
         
-        # Mark chapter as complete
-        update_chapter_status(topic_id, i, True)
+        continuation, stop_reason = generate(conversation + [
+            {"role": "assistant", "content": [{"type": "text", "text": kept}]}
+        ])
+        if not continuation:
+            # Keep what we have rather than losing the whole chapter
+            return kept
+        text = kept + continuation
+    
+    if stop_reason == "max_tokens": print("Response still truncated after continuations")
+    return text
+
+
+def split_at_sentence_boundary(text):
+    """Split text into (everything up to the last complete sentence, the partial sentence after it)"""
+    text = text.rstrip()
+    if SENTENCE_END_AT_END.search(text): return text, ""
+    
+    matches = list(SENTENCE_END.finditer(text))
+    if not matches: return text, ""
+    
+    cut = matches[-1].end()
+    return text[:cut], text[cut:]
+
+
+class StreamSegmenter:
+    """
+    Buffers streamed text and releases it as whole paragraphs, falling back to
+    sentence boundaries when a paragraph grows past max_chars.
+    """
+    
+    SENTENCE_ENDS = (". ", "? ", "! ", ".\n", "?\n", "!\n")
+    
+    def __init__(self, on_segment, min_chars=STREAM_SEGMENT_MIN_CHARS, max_chars=STREAM_SEGMENT_MAX_CHARS):
+        self.on_segment = on_segment
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.parts = 0
+    
+    def feed(self, text):
+        self.buffer += text
+        cut = self._find_cut()
+        while cut:
+            self._emit(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+            cut = self._find_cut()
+    
+    def flush(self):
+        self._emit(self.buffer)
+        self.buffer = ""
+    
+    def _find_cut(self):
+        if len(self.buffer) < self.min_chars: return None
+        
+        # Prefer the last paragraph break that keeps the segment under max_chars
+        paragraph_end = self.buffer.rfind("\n\n", self.min_chars, self.max_chars)
+        if paragraph_end != -1: return paragraph_end + 2
+        if len(self.buffer) < self.max_chars: return None
+        
+        sentence_end = max(self.buffer.rfind(end, self.min_chars, self.max_chars) for end in self.SENTENCE_ENDS)
+        if sentence_end != -1: return sentence_end + 2
         
-        # Manage conversation context length if needed
-        conversation = manage_conversation_context(conversation)
+        return self.max_chars
     
-    # Update status to content generation complete
-    update_status(topic_id, "CONTENT_GENERATION_COMPLETE")
+    def _emit(self, text):
+        text = text.strip()
+        if not text: return
+        
+        self.parts += 1
+        self.on_segment(self.parts, text)
+
+
+def publish_stream_segment(topic_id, content_type, take, part, text):
+    """Store a streamed segment as an ordered chunk object and start its synthesis right away"""
+    key = f"{topic_id}/stream/{content_type}/{take}/part_{part:03d}.json"
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=key,
+        Body=json.dumps({"content": text, "content_type": content_type, "part": part, "take": take}),
+        ContentType="application/json"
+    )
     
-    # Return success response
-    return {
-        "statusCode": 200,
-        "topic_id": topic_id,
-        "message": "Content generation complete",
-        "next_step": "AUDIO_GENERATION"
-    }
+    # Fire and forget; the status checker resubmits any part that never produced a Polly task
+    lambda_client.invoke(
+        FunctionName=POLLY_FUNCTION_NAME,
+        InvocationType="Event",
+        Payload=json.dumps({"topic_id": topic_id, "key": key, "content_type": content_type, "part": part, "take": take})
+    )
+
+
+def start_stream_take(topic_id, content_type):
+    """
+    Start a new take of a streamed chapter. Its segments are keyed by the take, so whatever an
+    earlier, failed attempt at the chapter already sent to Polly is ignored rather than mixed in.
+    """
+    take = uuid.uuid4().hex[:8]
+    # Status items created before store_topic wrote the map lack it, and DynamoDB rejects a nested
+    # SET below a missing map
+    status_table.update_item(
+        Key={"topic_id": topic_id},
+        UpdateExpression="SET streamed_chapters = if_not_exists(streamed_chapters, :empty)",
+        ExpressionAttributeValues={":empty": {}}
+    )
+    status_table.update_item(
+        Key={"topic_id": topic_id},
+        UpdateExpression="SET streamed_chapters.#ct = :entry, updated_at = :updated_at",
+        ExpressionAttributeNames={"#ct": content_type},
+        ExpressionAttributeValues={
+            ":entry": {"take": take},
+            ":updated_at": str(int(time.time()))
+        }
+    )
+    return take
+
+
+def record_streamed_parts(topic_id, content_type, take, parts):
+    """
+    Record how many segments the finished take sent, the status checker waits for all of them.
+    start_stream_take has made sure the streamed_chapters map exists.
+    """
+    status_table.update_item(
+        Key={"topic_id": topic_id},
+        UpdateExpression="SET streamed_chapters.#ct = :entry, updated_at = :updated_at",
+        ExpressionAttributeNames={"#ct": content_type},
+        ExpressionAttributeValues={
+            ":entry": {"take": take, "parts": parts, "stored_at": int(time.time()), "resubmissions": {}},
+            ":updated_at": str(int(time.time()))
+        }
+    )
+
+
+def get_chapter_concurrency(event):
+    """Read the chapter concurrency cap from the event, bounded to a sane range"""
+    try:
+        max_concurrency = int(event.get("max_concurrency", DEFAULT_CHAPTER_CONCURRENCY))
+    except (TypeError, ValueError):
+        max_concurrency = DEFAULT_CHAPTER_CONCURRENCY
+    
+    return max(1, min(max_concurrency, MAX_CHAPTER_CONCURRENCY))
+
+
+def store_chapter(topic_id, chapter_number, chapter_content, streamed_parts=None, take=None):
+    """Store a chapter in S3, streamed chapters record how many segments of which take were sent to Polly"""
+    body = {"content": chapter_content}
+    if streamed_parts: body["streamed_parts"] = streamed_parts
+    if take: body["take"] = take
+    
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=f"{topic_id}/chapter_{chapter_number}.json",
+        Body=json.dumps(body),
+        ContentType="application/json"
+    )
+
     
 def get_chapter_prompt(chapter_number):
     """Creates the chapter prompt"""
@@ -166,25 +792,64 @@ def get_chapter_prompt(chapter_number):
 
     Please provide the complete content for this chapter that is optimized for AUDIO delivery:
     - Opening with a one-sentence recap
-    - Detailed explanation using educational style
-    - Describe all concepts verbally without relying on visual diagrams
-    - Use audio-friendly analogies and descriptions that don't require visual aids
-    - Include verbal cues like "first," "second," "moving on to," etc. to help listeners follow along
+{get_chapter_guidelines()}
     - A smooth transition to the next chapter
     - 800-3000 words total
 
-    IMPORTANT: Do NOT include any ASCII art, diagrams, or content that requires visual representation. All explanations must work in an audio-only format.
+{get_style_rules()}
+    """
+
+
+def get_recap_prompt(chapter_content):
+    """Creates the prompt for a short chapter recap"""
+    return f"""
+    Summarize the following podcast chapter in 2-3 sentences for the writer of the next chapter.
+    Mention the key concepts covered and any examples or analogies used. Reply with ONLY the summary.
+
+    {chapter_content}
+    """
+
+
+def get_outline_chapter_prompt(outline_entry, total_chapters, pack=None):
+    """Creates the chapter prompt used when chapters are written independently from the outline"""
+    chapter_number = outline_entry["number"]
+    return f"""
+    Write Chapter {chapter_number} of {total_chapters}: {outline_entry["title"]}
+
+    Chapter summary: {outline_entry["summary"]}
+
+    The other chapters are being written separately, so rely ONLY on the chapter outline above.
+    Cover exactly what this chapter summary describes, and do not repeat material the outline assigns to other chapters.
+
+    Please provide the complete content for this chapter that is optimized for AUDIO delivery:
+    - Opening with a one-sentence recap of the previous chapter's outline summary (or of the introduction for Chapter 1)
+{get_chapter_guidelines(pack)}
+    - A smooth transition to the next chapter's topic from the outline (or a closing wrap-up for the final chapter)
+    - 800-3000 words total
+
+{get_style_rules(pack)}
     """
 
 
-def generate_content_with_context(conversation, max_retries=8):
-    """Generate content using conversation history"""
+def get_chapter_guidelines(pack=None):
+    """The category's chapter template, as prompt bullet lines"""
+    return "\n".join(f"    - {line}" for line in (pack or current_pack)["chapter_template"])
+
+
+def get_style_rules(pack=None):
+    """The category's style rules, as IMPORTANT lines closing a prompt"""
+    return "\n".join(f"    IMPORTANT: {rule}" for rule in (pack or current_pack)["style_rules"])
+
+
+def generate_content_with_context(conversation, max_retries=8, call_type="chapter", return_stop_reason=False):
+    """Generate content using conversation history, optionally returning (text, stop_reason)"""
     retries = 0
-    backoff_time = 2
+    throttle_wait = limiter_wait = 0.0
     
     while retries < max_retries:
+        model_id = model_router.pick(call_type, current_difficulty)
         try:
-            time.sleep(0.5)
+            limiter_wait += bedrock_limiter.acquire()
             payload = {
                 "anthropic_version": "bedrock-2023-05-31",
                 "messages": conversation,
@@ -193,25 +858,35 @@ def generate_content_with_context(conversation, max_retries=8):
                 "top_p": 0.999
             }
 
+            started = time.time()
             response = bedrock.invoke_model(
-                modelId="us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+                modelId=model_id,
                 body=json.dumps(payload),
                 contentType="application/json",
                 accept="application/json"
             )
+            ttfb = time.time() - started
             
             response_body = response["body"].read().decode("utf-8")
             response_json = json.loads(response_body)
+            latency = time.time() - started
+            bedrock_limiter.on_success(latency)
+            model_router.record_success(call_type, model_id, latency)
+            bedrock_usage.record_call(
+                call_type, model_id, response_json.get("usage", {}), latency, ttfb, retries, throttle_wait, limiter_wait
+            )
             
-            return response_json.get("content", [{}])[0].get("text", "")
+            text = response_json.get("content", [{}])[0].get("text", "")
+            if return_stop_reason: return text, response_json.get("stop_reason")
+            return text
         
         except bedrock.exceptions.ThrottlingException as e:
             retries += 1
-            wait_time = backoff_time * (2 ** retries) + random.uniform(0, 0.5)
-            print(f"Throttled. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
+            bedrock_limiter.on_throttle()
+            throttle_wait += wait_for_retry(call_type, model_id, retries)
         
         except Exception as e:
+            model_router.record_error(call_type, model_id)
             print(f"Error generating content with context: {str(e)}")
             retries += 1
             if retries >= max_retries:
@@ -219,25 +894,211 @@ def generate_content_with_context(conversation, max_retries=8):
             time.sleep(1)
     
     print("Max retries reached")
+    if return_stop_reason: return None, None
     return None
         
     
 
     
+def generate_content_streaming(conversation, segmenter, max_retries=8, call_type="chapter"):
+    """
+    Generate content with the response-stream API, feeding text to the segmenter as it arrives.
+    Only retries while nothing has been emitted yet, a half-published chapter can't be replayed.
+    Returns (text, stop_reason); the segmenter is left unflushed so a continuation can extend it.
+    """
+    retries = 0
+    throttle_wait = limiter_wait = 0.0
+    emitted_parts = segmenter.parts
+    initial_buffer = segmenter.buffer
+    
+    while retries < max_retries:
+        model_id = model_router.pick(call_type, current_difficulty)
+        try:
+            limiter_wait += bedrock_limiter.acquire()
+            # Drop any partial text from a failed attempt that never reached a full segment
+            segmenter.buffer = initial_buffer
+            payload = {
+                "anthropic_version": "bedrock-2023-05-31",
+                "messages": conversation,
+                "max_tokens": 4096,
+                "temperature": 0.5,
+                "top_p": 0.999
+            }
+
+            started = time.time()
+            response = bedrock.invoke_model_with_response_stream(
+                modelId=model_id,
+                body=json.dumps(payload),
+                contentType="application/json",
+                accept="application/json"
+            )
+            
+            text_parts = []
+            usage = {}
+            stop_reason = None
+            ttfb = None
+            for event in response["body"]:
+                chunk = event.get("chunk")
+                if not chunk: continue
+                
+                chunk_json = json.loads(chunk["bytes"].decode("utf-8"))
+                delta = chunk_json.get("delta", {})
+                if chunk_json.get("type") == "content_block_delta" and delta.get("type") == "text_delta":
+                    if ttfb is None: ttfb = time.time() - started
+                    text_parts.append(delta["text"])
+                    segmenter.feed(delta["text"])
+                elif chunk_json.get("type") == "message_start":
+                    usage.update(chunk_json.get("message", {}).get("usage", {}))
+                elif chunk_json.get("type") == "message_delta":
+                    usage.update(chunk_json.get("usage", {}))
+                    stop_reason = chunk_json.get("delta", {}).get("stop_reason", stop_reason)
+            
+            latency = time.time() - started
+            bedrock_limiter.on_success(latency)
+            model_router.record_success(call_type, model_id, latency)
+            bedrock_usage.record_call(call_type, model_id, usage, latency, ttfb, retries, throttle_wait, limiter_wait)
+            return "".join(text_parts), stop_reason
+        
+        except bedrock.exceptions.ThrottlingException as e:
+            if segmenter.parts > emitted_parts: break
+            retries += 1
+            bedrock_limiter.on_throttle()
+            throttle_wait += wait_for_retry(call_type, model_id, retries)
+        
+        except Exception as e:
+            model_router.record_error(call_type, model_id)
+            print(f"Error streaming content: {str(e)}")
+            if segmenter.parts > emitted_parts: break
+            retries += 1
+            if retries >= max_retries:
+                break
+            time.sleep(1)
+    
+    print("Streaming generation failed")
+    return None, None
+
+
+def wait_for_retry(call_type, model_id, retries):
+    """
+    After a throttle, fail over straight away when the route has a healthy secondary, else back off.
+    Returns the seconds spent waiting.
+    """
+    model_router.record_throttle(call_type, model_id)
+    next_model = model_router.pick(call_type, current_difficulty)
+    if next_model != model_id:
+        print(f"Throttled on {model_id}. Failing over to {next_model}")
+        return 0.0
+    
+    wait_time = backoff_delay(retries)
+    print(f"Throttled. Retrying in {wait_time} seconds...")
+    time.sleep(wait_time)
+    return wait_time
+
+
 def generate_introduction(topic, desc, difficulty, chapters):
-    """Generate introduction and chapter outline"""
+    """
+    Generate the introduction and structured chapter outline.
+    Re-prompts with the parse error only when the response is not a valid outline.
+    """
     prompt = get_intro_prompt(topic, desc, difficulty, chapters)
-    return generate_content(prompt)
+    response_text = generate_content(prompt)
+    
+    for attempt in range(1, MAX_OUTLINE_ATTEMPTS + 1):
+        if not response_text: return None
+        
+        outline, error = parse_outline(response_text, chapters)
+        if outline: return outline
+        
+        print(f"Outline attempt {attempt} could not be parsed: {error}")
+        if attempt == MAX_OUTLINE_ATTEMPTS: break
+        
+        repair_conversation = [
+            {"role": "user", "content": [{"type": "text", "text": prompt}]},
+            {"role": "assistant", "content": [{"type": "text", "text": response_text}]},
+            {"role": "user", "content": [{"type": "text", "text": get_outline_repair_prompt(error)}]}
+        ]
+        response_text = generate_content_with_context(repair_conversation, call_type="outline")
+    
+    print("Failed to produce a valid outline")
+    return None
+
+
+def parse_outline(response_text, chapters):
+    """
+    Parse and validate the outline JSON returned by the intro stage.
+    Returns (outline, None) on success or (None, error message) on failure.
+    """
+    start, end = response_text.find("{"), response_text.rfind("}")
+    if start == -1 or end <= start: return None, "no JSON object found"
+    
+    try:
+        data = json.loads(response_text[start:end + 1])
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON: {str(e)}"
+    
+    introduction = data.get("introduction") if isinstance(data, dict) else None
+    if not isinstance(introduction, str) or not introduction.strip():
+        return None, "missing 'introduction' text"
+    
+    entries = data.get("chapters")
+    if not isinstance(entries, list) or len(entries) != chapters:
+        return None, f"'chapters' must be a list of exactly {chapters} entries"
+    
+    outline_chapters = []
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict): return None, f"chapter {number} is not an object"
+        
+        title, summary = entry.get("title"), entry.get("summary")
+        if not isinstance(title, str) or not title.strip(): return None, f"chapter {number} is missing a title"
+        if not isinstance(summary, str) or not summary.strip(): return None, f"chapter {number} is missing a summary"
+        
+        outline_chapters.append({"number": number, "title": title.strip(), "summary": summary.strip()})
+    
+    return {"introduction": introduction.strip(), "chapters": outline_chapters}, None
 
 
-def get_intro_prompt(topic, desc, difficulty, chapters):
-    """Creates the introduction prompt"""
+def render_intro_script(outline):
+    """Turn the structured outline into the spoken introduction stored in intro.json"""
+    lines = [outline["introduction"], "", "Here is how this podcast is laid out."]
+    for entry in outline["chapters"]:
+        lines.append(f"Chapter {entry['number']}: {entry['title']}. {entry['summary']}")
+    
+    return "\n".join(lines)
+
+
+def store_outline(topic_id, outline):
+    """Store the structured outline next to intro.json"""
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=f"{topic_id}/outline.json",
+        Body=json.dumps(outline),
+        ContentType="application/json"
+    )
+
+
+def get_intro_conversation(topic, desc, difficulty, chapters, outline, pack=None):
+    """
+    Conversation prefix every chapter call builds on: the intro prompt and its outline.
+    The outline block ends the shared prefix, so it carries the prompt-cache checkpoint.
+    """
+    outline_block = {"type": "text", "text": json.dumps(outline)}
+    if PROMPT_CACHING: outline_block["cache_control"] = {"type": "ephemeral"}
+    
+    return [
+        {"role": "user", "content": [{"type": "text", "text": get_intro_prompt(topic, desc, difficulty, chapters, pack)}]},
+        {"role": "assistant", "content": [outline_block]}
+    ]
+
+
+def get_intro_prompt(topic, desc, difficulty, chapters, pack=None):
+    """Creates the introduction prompt, in the given prompt pack or the invocation's category pack"""
+    pack = pack or current_pack
     return f"""
     Topic: {topic}
     Difficulty: {difficulty}
     Total Chapters: {chapters}
-    Tone: EDUCATIONAL 
-    Style: EDUCATIONAL 
+    Tone: {pack["tone"]}
+    Style: {pack["style"]}
     Format: PODCAST SCRIPT 
     Description: {desc}
 
@@ -247,14 +1108,30 @@ def get_intro_prompt(topic, desc, difficulty, chapters):
     Do NOT write any chapter content yet
     Do NOT ask if I want you to continue
     Do NOT add any closing remarks
-    Introduction: Write a 1-2 paragraph introduction to the topic that frames the discussion, peaks listener interest, and transitions into the chapter breakdown.
+    Introduction: {prompt_packs.render(pack["intro_template"], topic=topic, difficulty=difficulty, chapters=chapters)}
 
-    Chapter Outline: Generate [X] chapter titles and 4-5 sentence summaries for each chapter. The chapters should build logically and cover key concepts for a [BEGINNER/INTERMEDIATE/ADVANCED] understanding.
+    Chapter Outline: {prompt_packs.render(pack["outline_template"], topic=topic, difficulty=difficulty, chapters=chapters)}
 
-    ===END OF INITIAL OUTPUT===
+    Respond with ONLY a JSON object in exactly this shape, with no text before or after it:
+    {{
+        "introduction": "<the 1-2 paragraph introduction>",
+        "chapters": [
+            {{"number": 1, "title": "<chapter title>", "summary": "<4-5 sentence summary>"}}
+        ]
+    }}
+    The "chapters" list must contain exactly {chapters} entries numbered 1 to {chapters}.
 
     After reviewing your introduction and outline, I will explicitly request specific chapters by saying "Write Chapter [Number]".
     """
+
+
+def get_outline_repair_prompt(error):
+    """Creates the re-prompt sent when the outline response could not be parsed"""
+    return f"""
+    Your previous response could not be used: {error}.
+    Reply again with ONLY the JSON object described above, containing the same introduction and chapter outline.
+    """
+
     
 def manage_conversation_context(conversation, max_messages=10):
     """Prevent conversation context from getting too large"""
@@ -305,7 +1182,7 @@ def update_chapter_status(topic_id, chapter_number, complete):
         }
     )
 
-# zip function.zip lambda_tech_programming.py
+# zip function.zip lambda_tech_programming.py rate_limiter.py generation_cache.py topic_similarity.py model_router.py prompt_packs.py prompt_packs.json bedrock_usage.py
 # aws lambda update-function-code \
 #     --function-name EPTechProgramming \
 #     --zip-file fileb://function.zip \
@@ -0,0 +1,100 @@
+import time
+import threading
+
+SONNET = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+SONNET_FALLBACK = "us.anthropic.claude-3-5-sonnet-20240620-v1:0"
+HAIKU = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+
+# Ordered models (primary first) per call type, with optional per-difficulty overrides.
+# Outlines and recaps are short structured calls that don't need the largest model.
+ROUTES = {
+    "outline": {
+        "default": [HAIKU, SONNET],
+        "ADVANCED": [SONNET, HAIKU]
+    },
+    "chapter": {
+        "default": [SONNET, SONNET_FALLBACK]
+    },
+    "recap": {
+        "default": [HAIKU, SONNET]
+    }
+}
+
+# Calls slower than the budget (seconds) push the route onto its next model for a while
+LATENCY_BUDGETS = {
+    "outline": 45,
+    "chapter": 150,
+    "recap": 20
+}
+
+# How long a throttled or slow model is passed over before it gets traffic again
+DEGRADED_COOLDOWN_SECONDS = 60
+
+_degraded_until = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def candidates(call_type, difficulty=None):
+    """Models for a call in the order they should be tried, healthy ones first"""
+    routes = ROUTES.get(call_type, ROUTES["chapter"])
+    models = routes.get(str(difficulty or "").upper(), routes["default"])
+
+    now = time.time()
+    with _lock:
+        healthy = [m for m in models if _degraded_until.get((call_type, m), 0) <= now]
+    return healthy + [m for m in models if m not in healthy]
+
+
+def pick(call_type, difficulty=None):
+    return candidates(call_type, difficulty)[0]
+
+
+def record_success(call_type, model_id, latency):
+    """Record a successful call, degrading the model on this route if it blew the latency budget"""
+    budget = LATENCY_BUDGETS.get(call_type)
+    with _lock:
+        stats = _route_stats(call_type, model_id)
+        stats["calls"] += 1
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        if budget and latency > budget:
+            stats["over_budget"] += 1
+            _degraded_until[(call_type, model_id)] = time.time() + DEGRADED_COOLDOWN_SECONDS
+            print(f"Model {model_id} took {latency:.1f}s on {call_type} route (budget {budget}s), failing over for {DEGRADED_COOLDOWN_SECONDS}s")
+
+
+def record_throttle(call_type, model_id):
+    with _lock:
+        _route_stats(call_type, model_id)["throttles"] += 1
+        _degraded_until[(call_type, model_id)] = time.time() + DEGRADED_COOLDOWN_SECONDS
+
+
+def record_error(call_type, model_id):
+    with _lock:
+        _route_stats(call_type, model_id)["errors"] += 1
+
+
+def reset_stats():
+    """Start a new invocation; degraded models stay passed over, their cooldown outlives it"""
+    with _lock:
+        _stats.clear()
+
+
+def get_stats():
+    """Per-route, per-model counters with average latency, for logs and handler responses"""
+    with _lock:
+        result = {}
+        for (call_type, model_id), stats in _stats.items():
+            route = dict(stats, avg_latency=round(stats["total_latency"] / stats["calls"], 2) if stats["calls"] else None)
+            route["total_latency"] = round(route["total_latency"], 2)
+            route["max_latency"] = round(route["max_latency"], 2)
+            result.setdefault(call_type, {})[model_id] = route
+        return result
+
+
+def _route_stats(call_type, model_id):
+    key = (call_type, model_id)
+    if key not in _stats:
+        _stats[key] = {"calls": 0, "errors": 0, "throttles": 0, "over_budget": 0, "total_latency": 0.0, "max_latency": 0.0}
+    return _stats[key]
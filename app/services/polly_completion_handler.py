@@ -0,0 +1,128 @@
+import boto3
+import json
+import time
+from urllib.parse import urlparse, unquote
+from botocore.exceptions import ClientError
+
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+stepfunctions = boto3.client("stepfunctions", region_name="us-east-1")
+status_table = dynamodb.Table("EPPodcastStatus")
+
+AUDIO_BUCKET = "echopod-audio"
+
+
+def lambda_handler(event, context):
+    """
+    Event-driven Polly completion tracking, replaces the fixed WaitForPolly loop.
+    - Polly publishes every finished task to the completion SNS topic; each message
+      decrements the topic's polly_pending counter (once per task, SNS can redeliver).
+    - WaitForPollyCompletion invokes this with {"action": "register", topic_id, task_token}
+      after all chunks are submitted.
+    Whichever of the two sees the counter at zero with a token stored resumes the workflow.
+    """
+    print("Received event:", json.dumps(event))
+
+    if event.get("action") == "register":
+        return register_task_token(event["topic_id"], event["task_token"])
+
+    results = []
+    for record in event.get("Records", []):
+        message = json.loads(record["Sns"]["Message"])
+        results.append(handle_task_completion(message))
+    return {"statusCode": 200, "results": results}
+
+
+def register_task_token(topic_id, task_token):
+    """Store the workflow's task token, resuming straight away when nothing is pending"""
+    status_table.update_item(
+        Key={"topic_id": topic_id},
+        UpdateExpression="SET polly_task_token = :token, updated_at = :u",
+        ExpressionAttributeValues={":token": task_token, ":u": str(int(time.time()))}
+    )
+    resumed = resume_if_done(topic_id)
+    return {"statusCode": 200, "topic_id": topic_id, "resumed": resumed}
+
+
+def handle_task_completion(message):
+    """Count one finished Polly task against its topic"""
+    task_id = message.get("taskId")
+    topic_id = topic_id_from_output_uri(message.get("outputUri", ""))
+    if not task_id or not topic_id:
+        print(f"Ignoring completion without task id or topic: {message}")
+        return {"task_id": task_id, "counted": False}
+
+    try:
+        response = status_table.update_item(
+            Key={"topic_id": topic_id},
+            UpdateExpression="ADD polly_pending :minus_one, polly_finished_ids :task_ids SET updated_at = :u",
+            ConditionExpression="attribute_not_exists(polly_finished_ids) OR NOT contains(polly_finished_ids, :task_id)",
+            ExpressionAttributeValues={
+                ":minus_one": -1,
+                ":task_ids": {task_id},
+                ":task_id": task_id,
+                ":u": str(int(time.time()))
+            },
+            ReturnValues="UPDATED_NEW"
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException": raise
+        print(f"Duplicate completion for task {task_id}, already counted")
+        return {"task_id": task_id, "topic_id": topic_id, "counted": False}
+
+    pending = response["Attributes"].get("polly_pending", 0)
+    print(f"Polly task {task_id} for {topic_id} {message.get('taskStatus')}, {pending} still pending")
+    resumed = resume_if_done(topic_id) if pending <= 0 else False
+    return {"task_id": task_id, "topic_id": topic_id, "counted": True, "pending": int(pending), "resumed": resumed}
+
+
+def resume_if_done(topic_id):
+    """
+    Atomically take the stored task token once no task is pending and send it back, so the
+    workflow resumes exactly once however the register call and completions interleave.
+    Failed tasks count as finished here, the status check after the wait deals with them.
+    """
+    try:
+        response = status_table.update_item(
+            Key={"topic_id": topic_id},
+            UpdateExpression="REMOVE polly_task_token",
+            ConditionExpression="attribute_exists(polly_task_token) AND (attribute_not_exists(polly_pending) OR polly_pending <= :zero)",
+            ExpressionAttributeValues={":zero": 0},
+            ReturnValues="ALL_OLD"
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException": return False
+        raise
+
+    try:
+        stepfunctions.send_task_success(
+            taskToken=response["Attributes"]["polly_task_token"],
+            output=json.dumps({"topic_id": topic_id, "allTasksFinished": True})
+        )
+    except ClientError as e:
+        # The wait already timed out and fell back to polling
+        if e.response["Error"]["Code"] not in ("TaskTimedOut", "InvalidToken", "TaskDoesNotExist"): raise
+        print(f"Task token for {topic_id} no longer valid: {str(e)}")
+        return False
+
+    print(f"All Polly tasks finished for {topic_id}, workflow resumed")
+    return True
+
+
+def topic_id_from_output_uri(output_uri):
+    """
+    Polly output keys start with the topic id. The SNS message gives s3://<bucket>/<topic_id>/...,
+    GetSpeechSynthesisTask the path-style https://s3.<region>.amazonaws.com/<bucket>/<topic_id>/...
+    """
+    parsed = urlparse(output_uri)
+    if parsed.scheme == "s3":
+        bucket, key = parsed.netloc, unquote(parsed.path).lstrip("/")
+    else:
+        bucket, _, key = unquote(parsed.path).lstrip("/").partition("/")
+    if bucket != AUDIO_BUCKET or "/" not in key: return None
+    return key.split("/", 1)[0]
+
+# zip function.zip polly_completion_handler.py
+# aws lambda update-function-code \
+#     --function-name EPPollyCompletionHandler \
+#     --zip-file fileb://function.zip \
+#     --region us-east-1
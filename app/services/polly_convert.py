@@ -2,7 +2,14 @@ import boto3
 import json
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
+from rate_limiter import get_limiter, backoff_delay
+import tts_audio_cache
+from tts_normalizer import normalize_for_speech
+from text_chunker import chunk_spans
+from polly_sizing import plan_chunks, MAX_ASYNC_TASK_CHARS
 
 s3 = boto3.client("s3", region_name="us-east-1")
 polly = boto3.client("polly", region_name="us-east-1")
@@ -14,6 +21,24 @@ AUDIO_BUCKET = "echopod-audio"
 DEFAULT_VOICE_ID = "Danielle"
 DEFAULT_ENGINE = "neural"
 DEFAULT_LANGUAGE = "en-US"
+OUTPUT_FORMAT = "mp3"
+
+# Chunks are submitted side by side; the shared limiter keeps the container under Polly's
+# StartSpeechSynthesisTask rate and slows down when Polly throttles
+POLLY_SUBMIT_CONCURRENCY = 4
+POLLY_MAX_ATTEMPTS = 5
+# Polly models no throttling exception class, throttles arrive as ClientErrors with these codes
+THROTTLING_ERROR_CODES = ("ThrottlingException", "Throttling", "TooManyRequestsException")
+polly_limiter = get_limiter("polly", initial_rate=4.0, max_rate=10.0, burst=4)
+
+# Text up to synthesize_speech's 3000 billed characters is synthesized on the spot and
+# streamed straight into the final object, there is no async task to wait for
+SYNC_MAX_CHARS = 3000
+SYNC_UPLOAD_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024)
+
+# Polly publishes each finished async task here, EPPollyCompletionHandler counts them down
+# against the topic's polly_pending and resumes the workflow when none are left
+POLLY_COMPLETION_TOPIC_ARN = "arn:aws:sns:us-east-1:184226036469:EPPollyCompletion"
 
 
 def lambda_handler(event, context):
@@ -26,22 +51,61 @@ def lambda_handler(event, context):
 
     try:
         file_name = os.path.basename(file_key)
-        content_type = file_name.split('.')[0]
+        content_type = event.get("content_type") or file_name.split('.')[0]
 
         obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=file_key)
         content_data = json.loads(obj["Body"].read().decode("utf-8"))
         text_content = content_data.get("content", "")
 
-        text_chunks = split_text_into_chunks(text_content)
-        tasks = process_polly_tasks(topic_id, content_type, text_chunks)
+        # Chapters streamed during content generation already have their audio tasks
+        if content_data.get("streamed_parts"):
+            print(f"Skipping {content_type}: {content_data['streamed_parts']} streamed parts already submitted")
+            return {
+                "statusCode": 200,
+                "topic_id": topic_id,
+                "content_type": content_type,
+                "tasks": []
+            }
+
+        part, take = event.get("part"), event.get("take")
+        skip_reason = get_stream_skip_reason(topic_id, content_type, take, part) if part and take else None
+        if skip_reason:
+            print(f"Skipping {content_type} part {part} of take {take}: {skip_reason}")
+            return {
+                "statusCode": 200,
+                "topic_id": topic_id,
+                "content_type": content_type,
+                "tasks": []
+            }
+
+        # Strip markdown and rewrite symbols before Polly bills the text
+        speech_text, chars_removed = normalize_for_speech(text_content)
+        print(f"Normalized {content_type}: {len(text_content)} -> {len(speech_text)} chars ({chars_removed} removed)")
+
+        plan = None
+        if speech_text and len(speech_text) <= event.get("sync_max_chars", SYNC_MAX_CHARS):
+            tasks = [synthesize_now(topic_id, content_type, speech_text, part=part, take=take)]
+        else:
+            # Fewer, larger async tasks unless splitting finishes sooner, see polly_sizing
+            plan = plan_chunks(len(speech_text), event.get("files_in_topic", 1), **event.get("sizing", {}))
+            spans = split_text_into_spans(speech_text, plan["max_chars"])
+            text_chunks = [speech_text[start:end] for start, end in spans]
+            print(
+                f"Sizing {content_type}: {len(text_chunks)} chunks of up to {plan['max_chars']} chars, "
+                f"expected {plan['expected_seconds']}s vs {plan['baseline_seconds']}s for 3000-char chunks ({plan['speedup']}x)"
+            )
+            tasks = process_polly_tasks(topic_id, content_type, text_chunks, part=part, take=take, source_key=file_key, spans=spans)
 
-        update_audio_status(topic_id, content_type, "PROCESSING")
+        all_done = bool(tasks) and all(task["status"] == "completed" for task in tasks)
+        update_audio_status(topic_id, content_type, "COMPLETED" if all_done else "PROCESSING")
         store_polly_tasks(topic_id, tasks)
 
         return {
             "statusCode": 200,
             "topic_id": topic_id,
             "content_type": content_type,
+            "chars_removed": chars_removed,
+            "sizing": plan,
             "tasks": tasks
         }
     except Exception as e:
@@ -49,59 +113,228 @@ def lambda_handler(event, context):
         return {"statusCode": 500, "error": str(e)}
 
 
-def split_text_into_chunks(text, max_chars=3000):
-    if len(text) <= max_chars:
-        return [text]
+def split_text_into_spans(text, max_chars=MAX_ASYNC_TASK_CHARS):
+    """
+    Sentence-aligned (start, end) chunk spans that never exceed max_chars, evened out so no
+    chunk is a short leftover
+    """
+    return chunk_spans(text, max_chars, balance=True)
+
+
+def process_polly_tasks(topic_id, content_type, text_chunks, part=None, source_key=None, spans=None, take=None):
+    """Submit every chunk concurrently, tasks come back in chunk order"""
+    def submit(i):
+        output_key = get_output_key(topic_id, content_type, i, len(text_chunks), part, take)
+        # Where the chunk came from, so a failed task can be resubmitted from the content file
+        source = {"source_key": source_key, "span": list(spans[i])} if source_key and spans else None
+        return submit_chunk(content_type, i, text_chunks[i], output_key, part, source, take)
+
+    workers = max(1, min(POLLY_SUBMIT_CONCURRENCY, len(text_chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(submit, range(len(text_chunks))))
+
+
+def submit_chunk(content_type, i, text, output_key, part=None, source=None, take=None):
+    """Copy the chunk's audio from the cache when it was synthesized before, else start a Polly task"""
+    cache_key = get_cache_key(text)
+    audio_key = f"{output_key}.mp3"
+    if tts_audio_cache.copy_to(cache_key, audio_key):
+        print(f"Audio cache hit for {audio_key}")
+        return completed_task(content_type, i, audio_key, "cached", part, take)
+
+    response = start_synthesis_task(text, output_key)
+    task = {
+        "task_id": response["SynthesisTask"]["TaskId"],
+        "content_type": content_type,
+        "chunk": i,
+        "status": response["SynthesisTask"]["TaskStatus"],
+        # The status checker adds the output to the audio cache once the task completes
+        "cache_key": cache_key,
+        # Workload and age the status checker times its next poll from
+        "chars": len(text),
+        "submitted_at": int(time.time()),
+        "output_prefix": output_key,
+        "attempt": 1
+    }
+    if part: task["part"] = part
+    if take: task["take"] = take
+    if source: task.update(source)
+    return task
+
+
+def resubmit_chunk(task):
+    """
+    Start a new Polly task for a failed chunk, re-reading its text from the content file.
+    Returns the task record that replaces the failed one.
+    """
+    text = load_chunk_text(task)
+    response = start_synthesis_task(text, task["output_prefix"])
+
+    new_task = {key: value for key, value in task.items() if key not in ("completed_after", "status_reason")}
+    new_task.update({
+        "task_id": response["SynthesisTask"]["TaskId"],
+        "status": response["SynthesisTask"]["TaskStatus"],
+        "submitted_at": int(time.time()),
+        "attempt": int(task.get("attempt", 1)) + 1,
+        "previous_task_ids": list(task.get("previous_task_ids", [])) + [task["task_id"]]
+    })
+    print(f"Resubmitted {task['output_prefix']} as {new_task['task_id']}, attempt {new_task['attempt']}")
+    return new_task
+
+
+def load_chunk_text(task):
+    """The chunk's speech text, rebuilt the same way the original submission produced it"""
+    obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=task["source_key"])
+    speech_text, _ = normalize_for_speech(json.loads(obj["Body"].read().decode("utf-8")).get("content", ""))
+    start, end = (int(position) for position in task["span"])
+    text = speech_text[start:end]
+
+    # The cache key hashes the submitted text, a mismatch means the content file was rewritten
+    if get_cache_key(text) != task.get("cache_key"):
+        raise ValueError(f"Source text of {task['output_prefix']} changed since it was submitted")
+    return text
+
+
+def completed_task(content_type, i, audio_key, source, part=None, take=None):
+    """Task record for audio that is already in place, source is "sync" or "cached" """
+    task = {
+        "task_id": f"{source}:{audio_key}",
+        "content_type": content_type,
+        "chunk": i,
+        "status": "completed",
+        source: True,
+        "output_key": audio_key
+    }
+    if part: task["part"] = part
+    if take: task["take"] = take
+    return task
+
+
+def get_cache_key(text):
+    return tts_audio_cache.make_cache_key(text, DEFAULT_VOICE_ID, DEFAULT_ENGINE, DEFAULT_LANGUAGE, OUTPUT_FORMAT)
 
-    chunks, current_chunk = [], ""
-    for sentence in text.replace("\n", " ").split(". "):
-        if not sentence.endswith("."): sentence += "."
-        if len(current_chunk) + len(sentence) + 1 <= max_chars:
-            current_chunk += (" " if current_chunk else "") + sentence
-        else:
-            chunks.append(current_chunk)
-            current_chunk = sentence
-    if current_chunk:
-        chunks.append(current_chunk)
-    return chunks
-
-
-def process_polly_tasks(topic_id, content_type, text_chunks):
-    tasks = []
-    for i, chunk in enumerate(text_chunks):
-        output_key = f"{topic_id}/{content_type}"
-        if len(text_chunks) > 1:
-            output_key += f"_part{i+1}"
-
-        response = polly.start_speech_synthesis_task(
-            Engine=DEFAULT_ENGINE,
-            LanguageCode=DEFAULT_LANGUAGE,
-            OutputFormat="mp3",
-            OutputS3BucketName=AUDIO_BUCKET,
-            OutputS3KeyPrefix=output_key,
-            Text=chunk,
-            VoiceId=DEFAULT_VOICE_ID
-        )
-
-        tasks.append({
-            "task_id": response["SynthesisTask"]["TaskId"],
-            "content_type": content_type,
-            "chunk": i,
-            "status": response["SynthesisTask"]["TaskStatus"]
-        })
-        time.sleep(0.5)
-    return tasks
+
+def get_output_key(topic_id, content_type, i, chunk_count, part=None, take=None):
+    output_key = f"{topic_id}/{content_type}"
+    if part:
+        # Streamed segments are zero-padded so the finalizer's key order matches speech order,
+        # the take keeps a regenerated chapter's parts apart from those of the attempt it replaced
+        if take: output_key += f"_{take}"
+        output_key += f"_part{part:03d}"
+        if chunk_count > 1: output_key += f"_{i+1}"
+    elif chunk_count > 1:
+        output_key += f"_part{i+1:03d}"
+    return output_key
+
+
+def synthesize_now(topic_id, content_type, text, part=None, take=None):
+    """
+    Synthesize short text synchronously into {output_key}.mp3, the object the finalizer would
+    otherwise produce (or a part it concatenates), and return it as an already completed task.
+    """
+    output_key = get_output_key(topic_id, content_type, 0, 1, part, take)
+    audio_key = f"{output_key}.mp3"
+
+    cache_key = get_cache_key(text)
+    if tts_audio_cache.copy_to(cache_key, audio_key):
+        print(f"Audio cache hit for {audio_key}")
+        return completed_task(content_type, 0, audio_key, "cached", part, take)
+
+    response = call_polly(
+        polly.synthesize_speech, output_key,
+        Engine=DEFAULT_ENGINE,
+        LanguageCode=DEFAULT_LANGUAGE,
+        OutputFormat=OUTPUT_FORMAT,
+        Text=text,
+        VoiceId=DEFAULT_VOICE_ID
+    )
+    # Streamed from Polly to S3 without buffering the whole file, multipart once it is large
+    s3.upload_fileobj(
+        response["AudioStream"], AUDIO_BUCKET, audio_key,
+        ExtraArgs={"ContentType": "audio/mpeg"},
+        Config=SYNC_UPLOAD_CONFIG
+    )
+    tts_audio_cache.store(cache_key, audio_key)
+    print(f"Synthesized {content_type} synchronously into {audio_key}")
+
+    return completed_task(content_type, 0, audio_key, "sync", part, take)
+
+
+def get_stream_part_key(topic_id, content_type, take, part):
+    """Content object of a streamed segment, as written by the generation function"""
+    return f"{topic_id}/stream/{content_type}/{take}/part_{part:03d}.json"
+
+
+def get_stream_skip_reason(topic_id, content_type, take, part):
+    """
+    Why a streamed segment needs no audio: its chapter was regenerated as a newer take, or the
+    part already has tasks because the status checker resubmitted it before this invocation ran
+    """
+    item = status_table.get_item(
+        Key={"topic_id": topic_id},
+        ProjectionExpression="streamed_chapters, polly_tasks"
+    ).get("Item", {})
+
+    current_take = item.get("streamed_chapters", {}).get(content_type, {}).get("take")
+    if current_take and current_take != take: return f"superseded by take {current_take}"
+
+    for task in item.get("polly_tasks", []):
+        if task.get("content_type") == content_type and task.get("take") == take and task.get("part") == part:
+            return "already submitted"
+    return None
+
+
+def start_synthesis_task(text, output_key):
+    """Start one async Polly task"""
+    return call_polly(
+        polly.start_speech_synthesis_task, output_key,
+        Engine=DEFAULT_ENGINE,
+        LanguageCode=DEFAULT_LANGUAGE,
+        OutputFormat=OUTPUT_FORMAT,
+        OutputS3BucketName=AUDIO_BUCKET,
+        OutputS3KeyPrefix=output_key,
+        SnsTopicArn=POLLY_COMPLETION_TOPIC_ARN,
+        Text=text,
+        VoiceId=DEFAULT_VOICE_ID
+    )
+
+
+def call_polly(operation, output_key, **params):
+    """Call Polly through the shared limiter, backing off and retrying when throttled"""
+    for attempt in range(1, POLLY_MAX_ATTEMPTS + 1):
+        polly_limiter.acquire()
+        try:
+            response = operation(**params)
+            polly_limiter.on_success()
+            return response
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in THROTTLING_ERROR_CODES: raise
+            polly_limiter.on_throttle()
+            if attempt == POLLY_MAX_ATTEMPTS: raise
+            wait_time = backoff_delay(attempt)
+            print(f"Polly throttled {output_key}. Retrying in {wait_time:.1f} seconds...")
+            time.sleep(wait_time)
 
 
 def store_polly_tasks(topic_id, tasks):
+    """Record the tasks and add the ones still running to the topic's pending counter"""
+    update_expression = "SET polly_tasks = list_append(if_not_exists(polly_tasks, :empty), :t), updated_at = :u"
+    values = {
+        ":t": tasks,
+        ":u": str(int(time.time())),
+        ":empty": []
+    }
+
+    # Sync and cached chunks are done already and never produce a completion event
+    pending = sum(1 for task in tasks if not (task.get("sync") or task.get("cached")))
+    if pending:
+        update_expression += " ADD polly_pending :pending"
+        values[":pending"] = pending
+
     status_table.update_item(
         Key={"topic_id": topic_id},
-        UpdateExpression="SET polly_tasks = list_append(if_not_exists(polly_tasks, :empty), :t), updated_at = :u",
-        ExpressionAttributeValues={
-            ":t": tasks,
-            ":u": str(int(time.time())),
-            ":empty": []
-        }
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=values
     )
 
 
@@ -117,7 +350,7 @@ def update_audio_status(topic_id, content_type, status):
     )
 
 
-# zip function.zip polly_convert.py
+# zip function.zip polly_convert.py tts_normalizer.py text_chunker.py polly_sizing.py rate_limiter.py tts_audio_cache.py
 # aws lambda update-function-code \
 #     --function-name EPPolly \
 #     --zip-file fileb://function.zip \
@@ -0,0 +1,115 @@
+import math
+
+# Chooses how many Polly async tasks a text is split into. More chunks synthesize in
+# parallel, but each one pays task start-up overhead, a status poll and an ffmpeg concat
+# input, and Polly only runs so many tasks at once. For each candidate chunk count k the
+# expected completion time of n characters is
+#
+#     ceil(k / parallel_tasks) * (task_overhead + (n / k) / chars_per_second) + k * per_chunk_cost
+#
+# and the k with the smallest estimate wins (fewer chunks on ties). All defaults can be
+# overridden per call, e.g. from the "sizing" object of the EPPolly event.
+
+# Polly caps an asynchronous task at 100,000 billed characters
+MAX_ASYNC_TASK_CHARS = 100_000
+MIN_CHUNK_CHARS = 500
+
+# What the old fixed split used, kept as the baseline the speedup is reported against
+LEGACY_CHUNK_CHARS = 3000
+
+DEFAULTS = {
+    "chars_per_second": 600.0,   # synthesis throughput of a single neural task
+    "task_overhead": 6.0,        # seconds from submission until a task starts producing audio
+    "per_chunk_cost": 0.4,       # seconds of status polling and concat work per extra part
+    "parallel_tasks": 8,         # tasks Polly runs concurrently for the whole topic
+    "max_chunk_chars": MAX_ASYNC_TASK_CHARS
+}
+
+
+def expected_seconds(total_chars, chunks, chars_per_second, task_overhead, per_chunk_cost, parallel_tasks):
+    """Estimated completion time of total_chars split into equal chunks"""
+    waves = math.ceil(chunks / max(1, parallel_tasks))
+    return waves * (task_overhead + total_chars / chunks / chars_per_second) + chunks * per_chunk_cost
+
+
+def plan_chunks(total_chars, files_in_topic=1, **overrides):
+    """
+    Pick the chunk count and size for a text of total_chars characters. The topic's files are
+    synthesized side by side, so each gets an equal share of the parallel task budget.
+    Returns the plan with its estimate and the speedup over fixed 3000-character chunks.
+    """
+    config = dict(DEFAULTS, **{name: value for name, value in overrides.items() if name in DEFAULTS and value})
+    max_chunk_chars = min(int(config["max_chunk_chars"]), MAX_ASYNC_TASK_CHARS)
+    parallel_tasks = max(1, int(config["parallel_tasks"]) // max(1, files_in_topic))
+    model = {
+        "chars_per_second": float(config["chars_per_second"]),
+        "task_overhead": float(config["task_overhead"]),
+        "per_chunk_cost": float(config["per_chunk_cost"]),
+        "parallel_tasks": parallel_tasks
+    }
+
+    if total_chars <= 0:
+        return {"chunks": 0, "max_chars": max_chunk_chars, "expected_seconds": 0.0, "baseline_seconds": 0.0, "speedup": 1.0}
+
+    fewest = math.ceil(total_chars / max_chunk_chars)
+    most = max(fewest, math.ceil(total_chars / MIN_CHUNK_CHARS))
+    best = min(range(fewest, most + 1), key=lambda k: (round(expected_seconds(total_chars, k, **model), 6), k))
+
+    baseline_chunks = math.ceil(total_chars / LEGACY_CHUNK_CHARS)
+    best_seconds = expected_seconds(total_chars, best, **model)
+    baseline_seconds = expected_seconds(total_chars, baseline_chunks, **model)
+
+    return {
+        "chunks": best,
+        # Headroom over the even split so sentence-aligned chunks still come out as `best` pieces
+        "max_chars": min(max_chunk_chars, max(MIN_CHUNK_CHARS, math.ceil(total_chars / best * 1.1))),
+        "parallel_tasks": parallel_tasks,
+        "expected_seconds": round(best_seconds, 1),
+        "baseline_chunks": baseline_chunks,
+        "baseline_seconds": round(baseline_seconds, 1),
+        "speedup": round(baseline_seconds / best_seconds, 2)
+    }
+
+
+# Bounds for the status-check loop's wait between polls
+MIN_POLL_SECONDS = 5
+MAX_POLL_SECONDS = 300
+# Share of a task's overrun added to the wait once it is past its estimate, capped at the
+# old fixed interval
+OVERRUN_BACKOFF = 0.25
+OVERRUN_MAX_POLL_SECONDS = 60
+
+
+def observed_chars_per_second(finished, **overrides):
+    """
+    Throughput seen on this topic's finished tasks, given as (chars, seconds from submission
+    to first seen complete) pairs. Falls back to the default without samples and stays within
+    a factor of four of it so one odd task cannot swing the estimate.
+    """
+    config = dict(DEFAULTS, **{name: value for name, value in overrides.items() if name in DEFAULTS and value})
+    default = float(config["chars_per_second"])
+    chars = sum(c for c, _ in finished)
+    seconds = sum(max(1.0, s - float(config["task_overhead"])) for _, s in finished)
+    if not chars or not seconds: return default
+    return min(default * 4, max(default / 4, chars / seconds))
+
+
+def next_poll_seconds(pending, chars_per_second, **overrides):
+    """
+    Seconds until the pending tasks, given as (chars, age in seconds) pairs, are expected to
+    be done: the slowest task's remaining time or the time to work through the remaining
+    characters on parallel_tasks, whichever is longer. Tasks past their estimate are polled
+    again soon, backing off the further they overrun.
+    """
+    if not pending: return 0
+    config = dict(DEFAULTS, **{name: value for name, value in overrides.items() if name in DEFAULTS and value})
+    overhead = float(config["task_overhead"])
+
+    remaining = [overhead + chars / chars_per_second - age for chars, age in pending]
+    queue = overhead + sum(chars for chars, _ in pending) / (chars_per_second * max(1, int(config["parallel_tasks"])))
+    oldest = max(age for _, age in pending)
+    estimate = max(max(remaining), queue - oldest)
+
+    if estimate < MIN_POLL_SECONDS:
+        estimate = min(OVERRUN_MAX_POLL_SECONDS, MIN_POLL_SECONDS + OVERRUN_BACKOFF * max(0.0, -max(remaining)))
+    return int(math.ceil(min(MAX_POLL_SECONDS, estimate)))
@@ -1,13 +1,35 @@
 import boto3
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
+import tts_audio_cache
+import polly_convert
+from polly_sizing import observed_chars_per_second, next_poll_seconds, MIN_POLL_SECONDS
 
 # Initialize AWS clients
 polly = boto3.client("polly", region_name = "us-east-1")
 dynamodb = boto3.resource("dynamodb", region_name = "us-east-1")
 status_table = dynamodb.Table("EPPodcastStatus")
 
+# Wait used when the check itself failed and nothing is known about the tasks
+ERROR_POLL_SECONDS = 30
+
+# Polly statuses that never change again, persisted on the task so later checks skip it
+TERMINAL_STATUSES = ("completed", "failed")
+POLL_CONCURRENCY = 8
+# Tasks updated per UpdateItem, keeps the expression well under DynamoDB's 4KB limit
+WRITE_BATCH_SIZE = 15
+# Task fields a check may change, written back per task
+STATUS_FIELDS = ("status", "completed_after", "status_reason", "attempt")
+
+# Submissions per chunk, the first one included, before the workflow gives up on the topic
+MAX_CHUNK_ATTEMPTS = 3
+
+# Streamed segments are handed to EPPolly as asynchronous invocations. A segment without a task
+# this long after its chapter was stored is taken as lost and submitted from here instead.
+STREAM_PART_GRACE_SECONDS = 120
+
 def lambda_handler(event, context):
     """
     Checks the status of all Polly tasks for a given topic.
@@ -47,50 +69,34 @@ def lambda_handler(event, context):
         if "polly_tasks" not in item: raise ValueError(f"No Polly tasks found for topic_id: {topic_id}")
 
         polly_tasks = item.get("polly_tasks", [])
-        all_tasks_complete = True
-        all_tasks_status = []
-        print("these are the polly tasks", polly_tasks)
-        
-        # Check each task's status
-        for task in polly_tasks:
-            task_id = task.get("task_id")
-            # Get current status from Polly
-            try:
-                task_response = polly.get_speech_synthesis_task(TaskId=task_id)
-                task_status = task_response["SynthesisTask"]["TaskStatus"]
-                
-                # Update task status
-                task["status"] = task_status
-                
-                # If any task is not complete, mark as still in progress
-                if task_status != "completed":
-                    if task_status == "failed":
-                        print(f"Polly task {task_id} failed")
-                    else:
-                        print(f"Polly task {task_id} still in progress: {task_status}")
-                    all_tasks_complete = False
-                
-            except ClientError as e:
-                print(f"Error Check Polly task {task_id}: {str(e)}")
-                task["status"] = "ERROR"
-                all_tasks_complete = False
-                
-            all_tasks_status.append({
-                "task_id": task_id,
-                "content_type": task.get("content_type"),
-                "chunk": task.get("chunk"),
-                "status": task.get("status")
-            })
-            
-        # Update DynamoDB with latest task statuses
-        status_table.update_item(
-            Key = {"topic_id": topic_id},
-            UpdateExpression = "SET polly_tasks_status = :status, updated_at = :updated_at",
-            ExpressionAttributeValues = {
-                ":status": all_tasks_status,
-                ":updated_at": str(int(time.time()))
-            }
-        )
+        streamed_chapters = item.get("streamed_chapters", {})
+        now = int(time.time())
+
+        # Tasks of a streamed chapter's superseded takes are neither waited for nor finalized
+        current = [i for i, task in enumerate(polly_tasks) if is_current_take(task, streamed_chapters)]
+        # Completed and failed tasks were persisted by earlier checks, only the rest go to Polly
+        pending = [i for i in current if polly_tasks[i].get("status") not in TERMINAL_STATUSES]
+        print(f"Checking {len(pending)} of {len(polly_tasks)} Polly tasks for {topic_id}")
+        changed = poll_tasks(polly_tasks, pending, now)
+        resubmitted, retry_later, exhausted = resubmit_failed_tasks(polly_tasks, current)
+        store_task_changes(topic_id, polly_tasks, sorted(set(changed + retry_later)), resubmitted)
+
+        missing_parts = find_missing_stream_parts(polly_tasks, current, streamed_chapters)
+        parts_wait, lost_parts = submit_missing_stream_parts(topic_id, missing_parts, streamed_chapters, now)
+        exhausted += lost_parts
+
+        current_tasks = [polly_tasks[i] for i in current]
+        all_tasks_status = [get_status_entry(task, now) for task in current_tasks]
+        all_tasks_complete = not missing_parts and all(task.get("status") == "completed" for task in current_tasks)
+
+        failure_reason = "; ".join(exhausted)
+        if failure_reason:
+            print(f"Audio generation failed for {topic_id}: {failure_reason}")
+            update_status(topic_id, "AUDIO_FAILED")
+
+        next_wait = 0 if all_tasks_complete else get_next_wait(all_tasks_status, event.get("sizing", {}))
+        if parts_wait: next_wait = min(next_wait, parts_wait) if next_wait else parts_wait
+        print(f"Next Polly status check in {next_wait}s")
         
         # Update podcast status based on completion
         if all_tasks_complete: update_status(topic_id, "AUDIO_GENERATED")
@@ -98,7 +104,11 @@ def lambda_handler(event, context):
         return {
             "topic_id": topic_id,
             "allTasksComplete": all_tasks_complete,
-            "taskStatuses": all_tasks_status
+            "taskStatuses": all_tasks_status,
+            "finalizeKeys": get_finalize_keys(current_tasks),
+            "nextWaitSeconds": next_wait,
+            "failed": bool(failure_reason),
+            "failureReason": failure_reason
         }
         
     except Exception as e:
@@ -107,9 +117,236 @@ def lambda_handler(event, context):
         return {
             "topic_id": topic_id,
             "allTasksComplete": False,
+            "taskStatuses": [],
+            "finalizeKeys": [],
+            "nextWaitSeconds": ERROR_POLL_SECONDS,
+            "failed": False,
+            "failureReason": "",
             "error": str(e)
         }
         
+def poll_tasks(polly_tasks, indexes, now):
+    """Fetch the status of the given tasks side by side, returns the indexes whose status changed"""
+    def poll(i):
+        task = polly_tasks[i]
+        try:
+            task_response = polly.get_speech_synthesis_task(TaskId=task.get("task_id"))
+        except ClientError as e:
+            print(f"Error Check Polly task {task.get('task_id')}: {str(e)}")
+            return None
+        # Terminal tasks are never polled again, so each completion is cached exactly once
+        if task_response["SynthesisTask"]["TaskStatus"] == "completed" and task.get("cache_key"):
+            cache_task_output(task, task_response)
+        return task_response
+
+    if not indexes: return []
+    with ThreadPoolExecutor(max_workers=min(POLL_CONCURRENCY, len(indexes))) as executor:
+        responses = list(executor.map(poll, indexes))
+
+    changed = []
+    for i, task_response in zip(indexes, responses):
+        task = polly_tasks[i]
+        # A failed lookup is retried on the next check rather than recorded
+        if task_response is None: continue
+
+        task_status = task_response["SynthesisTask"]["TaskStatus"]
+        if task_status == task.get("status"): continue
+        task["status"] = task_status
+        if task_status == "completed":
+            task["completed_after"] = now - int(task.get("submitted_at", now))
+        if task_status == "failed":
+            task["status_reason"] = task_response["SynthesisTask"].get("TaskStatusReason", "unknown reason")
+        changed.append(i)
+    return changed
+
+
+def resubmit_failed_tasks(polly_tasks, indexes=None):
+    """
+    Start failed chunks among the given tasks (all by default) again from their source text,
+    replacing the failed task in place. Returns the resubmitted indexes, the indexes whose
+    resubmission has to wait for the next check and a reason per chunk that is out of attempts.
+    """
+    resubmitted, retry_later, exhausted = [], [], []
+    for i in range(len(polly_tasks)) if indexes is None else indexes:
+        task = polly_tasks[i]
+        if task.get("status") != "failed": continue
+
+        label = f"{task.get('content_type')} chunk {task.get('chunk')} ({task.get('task_id')})"
+        attempts = int(task.get("attempt", 1))
+        if attempts >= MAX_CHUNK_ATTEMPTS:
+            exhausted.append(f"{label} failed after {attempts} attempts: {task.get('status_reason', 'unknown reason')}")
+            continue
+        if "source_key" not in task:
+            exhausted.append(f"{label} failed and has no source text to resubmit from: {task.get('status_reason', 'unknown reason')}")
+            continue
+
+        try:
+            polly_tasks[i] = polly_convert.resubmit_chunk(task)
+            resubmitted.append(i)
+        except ValueError as e:
+            exhausted.append(f"{label} cannot be resubmitted: {str(e)}")
+        except ClientError as e:
+            # Counts as an attempt so a persistent error still ends the loop
+            print(f"Error resubmitting {label}: {str(e)}")
+            task["attempt"] = attempts + 1
+            task["status_reason"] = f"resubmission failed: {str(e)}"
+            retry_later.append(i)
+    return resubmitted, retry_later, exhausted
+
+
+def store_task_changes(topic_id, polly_tasks, changed, resubmitted=()):
+    """
+    Write back only what changed: the status fields of updated tasks and the whole record of
+    resubmitted ones, whose new task id replaces the failed one. Resubmitted tasks go back on
+    the pending counter the completion handler counts down.
+    """
+    updates = sorted(set(changed) | set(resubmitted))
+    for batch_start in range(0, len(updates), WRITE_BATCH_SIZE):
+        batch = updates[batch_start:batch_start + WRITE_BATCH_SIZE]
+        assignments = ["updated_at = :updated_at"]
+        values = {":updated_at": str(int(time.time()))}
+        names = {}
+        for i in batch:
+            task = polly_tasks[i]
+            if i in resubmitted:
+                assignments.append(f"polly_tasks[{i}] = :task{i}")
+                values[f":task{i}"] = task
+                continue
+            for field in STATUS_FIELDS:
+                if field not in task: continue
+                assignments.append(f"polly_tasks[{i}].#{field} = :{field}{i}")
+                values[f":{field}{i}"] = task[field]
+                names[f"#{field}"] = field
+
+        update_expression = "SET " + ", ".join(assignments)
+        resubmitted_in_batch = sum(1 for i in batch if i in resubmitted)
+        if resubmitted_in_batch:
+            update_expression += " ADD polly_pending :resubmitted"
+            values[":resubmitted"] = resubmitted_in_batch
+
+        # DynamoDB rejects an empty or partly unused ExpressionAttributeNames
+        extra = {"ExpressionAttributeNames": names} if names else {}
+        status_table.update_item(
+            Key = {"topic_id": topic_id},
+            UpdateExpression = update_expression,
+            ExpressionAttributeValues = values,
+            **extra
+        )
+
+
+def is_current_take(task, streamed_chapters):
+    """False for tasks of a streamed take that was replaced by regenerating its chapter"""
+    if not task.get("take"): return True
+    return streamed_chapters.get(task.get("content_type"), {}).get("take") == task["take"]
+
+
+def find_missing_stream_parts(polly_tasks, indexes, streamed_chapters):
+    """(content type, part) of the segments a stored streamed chapter sent that have no task"""
+    submitted = {(polly_tasks[i].get("content_type"), int(polly_tasks[i]["part"])) for i in indexes if polly_tasks[i].get("part")}
+    missing = []
+    for content_type, entry in sorted(streamed_chapters.items()):
+        # A chapter still being written has no part count yet
+        if "parts" not in entry: continue
+        missing += [(content_type, part) for part in range(1, int(entry["parts"]) + 1) if (content_type, part) not in submitted]
+    return missing
+
+
+def submit_missing_stream_parts(topic_id, missing_parts, streamed_chapters, now):
+    """
+    Submit streamed segments whose asynchronous EPPolly invocation never recorded a task, once
+    their chapter has been stored for STREAM_PART_GRACE_SECONDS. Returns the seconds until the
+    missing parts should be looked at again and a reason per part that is out of attempts.
+    """
+    wait, lost = 0, []
+    for content_type, part in missing_parts:
+        entry = streamed_chapters[content_type]
+        grace_left = int(entry.get("stored_at", 0)) + STREAM_PART_GRACE_SECONDS - now
+        if grace_left > 0:
+            print(f"{content_type} part {part} has no task yet, allowing its invocation {grace_left}s more")
+            wait = min(wait, grace_left) if wait else grace_left
+            continue
+
+        label = f"{content_type} streamed part {part} (take {entry['take']})"
+        attempts = int(entry.get("resubmissions", {}).get(str(part), 0))
+        if attempts >= MAX_CHUNK_ATTEMPTS - 1:
+            lost.append(f"{label} never produced a Polly task, {attempts} resubmissions failed")
+            continue
+
+        record_part_resubmission(topic_id, content_type, part, attempts + 1)
+        result = polly_convert.lambda_handler({
+            "topic_id": topic_id,
+            "key": polly_convert.get_stream_part_key(topic_id, content_type, entry["take"], part),
+            "content_type": content_type,
+            "part": part,
+            "take": entry["take"]
+        }, None)
+        if result.get("statusCode") != 200: print(f"Error resubmitting {label}: {result.get('error')}")
+        wait = min(wait, MIN_POLL_SECONDS) if wait else MIN_POLL_SECONDS
+    return wait, lost
+
+
+def record_part_resubmission(topic_id, content_type, part, attempts):
+    """Count a lost streamed part's resubmissions before making them, so a failing one still ends the loop"""
+    status_table.update_item(
+        Key = {"topic_id": topic_id},
+        UpdateExpression = "SET streamed_chapters.#ct.resubmissions.#part = :attempts, updated_at = :updated_at",
+        ExpressionAttributeNames = {"#ct": content_type, "#part": str(part)},
+        ExpressionAttributeValues = {
+            ":attempts": attempts,
+            ":updated_at": str(int(time.time()))
+        }
+    )
+
+
+def get_status_entry(task, now):
+    """Per-task summary returned to the workflow and used to time the next poll"""
+    entry = {
+        "task_id": task.get("task_id"),
+        "content_type": task.get("content_type"),
+        "chunk": task.get("chunk"),
+        "status": task.get("status"),
+        "chars": int(task.get("chars", 0))
+    }
+    # Synchronously synthesized and cached chunks were complete when they were recorded
+    if task.get("sync") or task.get("cached"): return entry
+
+    if "completed_after" in task: entry["completed_after"] = int(task["completed_after"])
+    elif task.get("status") != "completed": entry["age"] = now - int(task.get("submitted_at", now))
+    return entry
+
+
+def cache_task_output(task, task_response):
+    """Add a finished task's audio to the TTS cache, a cache failure never fails the check"""
+    try:
+        output_key = tts_audio_cache.key_from_output_uri(task_response["SynthesisTask"].get("OutputUri", ""))
+        if output_key: tts_audio_cache.store(task["cache_key"], output_key)
+    except ClientError as e:
+        print(f"Error caching audio for task {task.get('task_id')}: {str(e)}")
+
+
+def get_next_wait(all_tasks_status, sizing):
+    """
+    Seconds until the unfinished tasks should be done, from their remaining characters and age
+    and the throughput this topic's finished tasks achieved
+    """
+    finished = [(entry["chars"], entry["completed_after"]) for entry in all_tasks_status if "completed_after" in entry]
+    pending = [(entry["chars"], entry["age"]) for entry in all_tasks_status if entry["status"] != "completed" and "age" in entry]
+    chars_per_second = observed_chars_per_second(finished, **sizing)
+    return next_poll_seconds(pending, chars_per_second, **sizing)
+
+
+def get_finalize_keys(polly_tasks):
+    """Content types whose audio is still split across Polly outputs; a single sync or cached file is already final"""
+    tasks_by_content_type = {}
+    for task in polly_tasks:
+        tasks_by_content_type.setdefault(task.get("content_type"), []).append(task)
+    
+    return [
+        content_type for content_type, tasks in tasks_by_content_type.items()
+        if not (len(tasks) == 1 and (tasks[0].get("sync") or tasks[0].get("cached")) and not tasks[0].get("part"))
+    ]
+
+
 def update_status(topic_id, status):
     """Update pocast status in DynamoDB"""
     status_table.update_item(
@@ -122,7 +359,7 @@ def update_status(topic_id, status):
         }
     )
 
-# zip function.zip polly_status_checker.py
+# zip function.zip polly_status_checker.py tts_audio_cache.py polly_sizing.py polly_convert.py tts_normalizer.py text_chunker.py rate_limiter.py
 # aws lambda update-function-code \
 #     --function-name EPPollyStatusChecker \
 #     --zip-file fileb://function.zip \
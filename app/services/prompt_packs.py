@@ -0,0 +1,44 @@
+import os
+import json
+from string import Template
+
+# Registry of per-category prompt packs, shipped in the deployment zip next to this module.
+# Categories only override the fields they need, everything else comes from "default".
+PACKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_packs.json")
+PACK_FIELDS = ("tone", "style", "intro_template", "outline_template", "chapter_template", "style_rules")
+
+
+def load_registry(path=PACKS_FILE):
+    """Parse the registry and resolve every category against the default pack"""
+    with open(path, encoding="utf-8") as f:
+        registry = json.load(f)
+
+    default = registry["default"]
+    missing = [field for field in PACK_FIELDS if field not in default]
+    if missing: raise ValueError(f"Default prompt pack is missing {', '.join(missing)}")
+
+    packs = {}
+    for category, overrides in registry.get("categories", {}).items():
+        unknown = [field for field in overrides if field not in PACK_FIELDS]
+        if unknown: raise ValueError(f"Prompt pack for {category} has unknown fields {', '.join(unknown)}")
+        packs[category] = dict(default, **overrides, category=category)
+
+    return registry.get("version", "1"), dict(default, category=None), packs
+
+
+# Parsed once per container, at import
+REGISTRY_VERSION, DEFAULT_PACK, PACKS = load_registry()
+
+
+def get_pack(category):
+    """Prompt pack for a category, the default pack when the category has none"""
+    pack = PACKS.get(category)
+    if pack is None:
+        print(f"No prompt pack for category {category!r}, using the default pack")
+        return DEFAULT_PACK
+    return pack
+
+
+def render(template, **values):
+    """Fill $placeholders in a pack template, leaving unknown ones untouched"""
+    return Template(template).safe_substitute(**values)
@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+
+# Named limiters are shared by every caller in the same container (threads included)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class AdaptiveRateLimiter:
+    """
+    Client-side token bucket whose refill rate is tuned with AIMD:
+    the rate grows additively on fast successful calls and is cut
+    multiplicatively on throttling or when latency exceeds the target.
+    """
+
+    def __init__(self, initial_rate=2.0, min_rate=0.2, max_rate=20.0, burst=2,
+                 increase_step=0.2, decrease_factor=0.5, latency_target=None, decrease_cooldown=1.0):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.decrease_cooldown = decrease_cooldown
+
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.throttle_count = 0
+        self.success_count = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def on_success(self, latency=None):
+        """Additive increase, or a gentle decrease when calls are slower than the latency target"""
+        with self.lock:
+            self.success_count += 1
+            self._refill()
+            if self.latency_target and latency and latency > self.latency_target:
+                self._decrease(factor=1 - (1 - self.decrease_factor) / 2)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_step / max(self.rate, 1.0))
+
+    def on_throttle(self):
+        """Multiplicative decrease, at most once per cooldown so a burst of throttles counts once"""
+        with self.lock:
+            self.throttle_count += 1
+            self._refill()
+            self._decrease(factor=self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rate": round(self.rate, 3),
+                "throttles": self.throttle_count,
+                "successes": self.success_count
+            }
+
+    def _decrease(self, factor):
+        now = time.monotonic()
+        if now - self.last_decrease < self.decrease_cooldown: return
+        self.last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+
+def get_limiter(name, **kwargs):
+    """Return the shared limiter for name, creating it with kwargs on first use"""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveRateLimiter(**kwargs)
+        return _limiters[name]
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Bounded exponential back-off with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -1,19 +1,40 @@
 {
-  "StartAt": "ContentGeneration",
+  "StartAt": "CheckContentReady",
   "States": {
+    "CheckContentReady": {
+      "Type": "Choice",
+      "Choices": [
+        {
+          "And": [
+            {
+              "Variable": "$.content_ready",
+              "IsPresent": true
+            },
+            {
+              "Variable": "$.content_ready",
+              "BooleanEquals": true
+            }
+          ],
+          "Next": "SkipContentGeneration"
+        }
+      ],
+      "Default": "ContentGeneration"
+    },
+    "SkipContentGeneration": {
+      "Type": "Pass",
+      "Parameters": {
+        "statusCode": 200,
+        "topic_id.$": "$.topic_id"
+      },
+      "ResultPath": "$.Payload",
+      "Next": "GetContentFileKeys"
+    },
     "ContentGeneration": {
       "Type": "Task",
       "Resource": "arn:aws:states:::lambda:invoke",
       "Parameters": {
         "FunctionName": "arn:aws:lambda:us-east-1:184226036469:function:EPTechProgramming",
-        "Payload": {
-          "topic_id.$": "$.topic_id",
-          "topic.$": "$.topic",
-          "desc.$": "$.desc",
-          "level_of_difficulty.$": "$.level_of_difficulty",
-          "chapters.$": "$.chapters",
-          "category.$": "$.category"
-        }
+        "Payload.$": "$"
       },
       "Retry": [
         {
@@ -42,10 +63,20 @@
           "Variable": "$.Payload.statusCode",
           "NumericEquals": 200,
           "Next": "BuildContentNotification"
+        },
+        {
+          "Variable": "$.Payload.statusCode",
+          "NumericEquals": 202,
+          "Next": "ContinueContentGeneration"
         }
       ],
       "Default": "HandleContentGenerationError"
     },
+    "ContinueContentGeneration": {
+      "Type": "Pass",
+      "InputPath": "$.Payload.continuation",
+      "Next": "ContentGeneration"
+    },
     "BuildContentNotification": {
       "Type": "Pass",
       "Parameters": {
@@ -99,7 +130,8 @@
       "ResultPath": "$.audioGenerationResults",
       "Parameters": {
         "key.$": "$$.Map.Item.Value",
-        "topic_id.$": "$.topic_id"
+        "topic_id.$": "$.topic_id",
+        "files_in_topic.$": "States.ArrayLength($.files)"
       },
       "Iterator": {
         "StartAt": "EPPolly",
@@ -111,11 +143,33 @@
           }
         }
       },
-      "Next": "WaitForPolly"
+      "Next": "WaitForPollyCompletion"
+    },
+    "WaitForPollyCompletion": {
+      "Type": "Task",
+      "Resource": "arn:aws:states:::lambda:invoke.waitForTaskToken",
+      "Parameters": {
+        "FunctionName": "arn:aws:lambda:us-east-1:184226036469:function:EPPollyCompletionHandler",
+        "Payload": {
+          "action": "register",
+          "topic_id.$": "$.topic_id",
+          "task_token.$": "$$.Task.Token"
+        }
+      },
+      "TimeoutSeconds": 1800,
+      "ResultPath": "$.pollyCompletion",
+      "Catch": [
+        {
+          "ErrorEquals": ["States.ALL"],
+          "ResultPath": "$.pollyCompletionError",
+          "Next": "CheckPollyStatus"
+        }
+      ],
+      "Next": "CheckPollyStatus"
     },
     "WaitForPolly": {
       "Type": "Wait",
-      "Seconds": 60,
+      "SecondsPath": "$.Payload.nextWaitSeconds",
       "Next": "CheckPollyStatus"
     },
     "CheckPollyStatus": {
@@ -136,7 +190,11 @@
         "topic_id.$": "$.statusCheck.Payload.topic_id",
         "allTasksComplete.$": "$.statusCheck.Payload.allTasksComplete",
         "taskStatuses.$": "$.statusCheck.Payload.taskStatuses",
-        "chapter_keys.$": "$.chapter_keys"
+        "chapter_keys.$": "$.chapter_keys",
+        "finalize_keys.$": "$.statusCheck.Payload.finalizeKeys",
+        "nextWaitSeconds.$": "$.statusCheck.Payload.nextWaitSeconds",
+        "failed.$": "$.statusCheck.Payload.failed",
+        "failureReason.$": "$.statusCheck.Payload.failureReason"
       },
       "ResultPath": "$.Payload",
       "Next": "IsPollyDone"
@@ -144,6 +202,11 @@
     "IsPollyDone": {
       "Type": "Choice",
       "Choices": [
+        {
+          "Variable": "$.Payload.failed",
+          "BooleanEquals": true,
+          "Next": "AudioGenerationFailed"
+        },
         {
           "Variable": "$.Payload.allTasksComplete",
           "BooleanEquals": true,
@@ -152,6 +215,11 @@
       ],
       "Default": "WaitForPolly"
     },
+    "AudioGenerationFailed": {
+      "Type": "Fail",
+      "Error": "PollyTaskFailed",
+      "CausePath": "$.Payload.failureReason"
+    },
     "BuildAudioNotification": {
       "Type": "Pass",
       "Parameters": {
@@ -176,7 +244,7 @@
     },
     "CompressChaptersInParallel": {
       "Type": "Map",
-      "ItemsPath": "$.Payload.chapter_keys",
+      "ItemsPath": "$.Payload.finalize_keys",
       "Parameters": {
         "chapter_key.$": "$$.Map.Item.Value",
         "topic_id.$": "$.Payload.topic_id"
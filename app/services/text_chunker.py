@@ -0,0 +1,96 @@
+import re
+
+# Splits speech text into Polly-sized chunks in a single left-to-right scan.
+# Chunks end at sentence boundaries (. ! ? optionally followed by a closing quote or
+# bracket, or a line break). A sentence longer than the limit falls back to the last
+# clause boundary, then the last space, and only then a hard cut, so no chunk ever
+# exceeds max_chars. Chunks are returned as (start, end) spans into the original
+# text, which lets callers map a chunk back to its source later.
+
+DEFAULT_MAX_CHARS = 3000
+
+SENTENCE_BOUNDARY = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s)|\n")
+CLAUSE_BOUNDARY = re.compile(r"[,;:)–—](?=\s)")
+WHITESPACE = " \t\r\n\u00a0"
+
+
+def chunk_text(text, max_chars=DEFAULT_MAX_CHARS, balance=False):
+    """Chunks as strings, see chunk_spans"""
+    return [text[start:end] for start, end in chunk_spans(text, max_chars, balance)]
+
+
+def chunk_spans(text, max_chars=DEFAULT_MAX_CHARS, balance=False):
+    """
+    (start, end) spans of chunks of at most max_chars characters, with surrounding
+    whitespace excluded. With balance, the greedy split's chunk count is kept but the
+    chunks are evened out, so the last one is not a short leftover.
+    """
+    if max_chars <= 0: raise ValueError("max_chars must be positive")
+    if not text or not text.strip(WHITESPACE): return []
+
+    boundaries = [match.end() for match in SENTENCE_BOUNDARY.finditer(text)]
+    spans = _greedy_spans(text, boundaries, max_chars)
+    if not balance or len(spans) < 2: return spans
+
+    # Smallest limit that still yields the same number of chunks: O(n log max_chars). The even
+    # share counts whitespace that gets trimmed, so it can exceed max_chars on tiny inputs
+    low, high = min(max_chars, -(-len(text) // len(spans))), max_chars
+    while low < high:
+        middle = (low + high) // 2
+        if len(_greedy_spans(text, boundaries, middle, stop_after=len(spans))) <= len(spans): high = middle
+        else: low = middle + 1
+
+    return _greedy_spans(text, boundaries, low)
+
+
+def _greedy_spans(text, boundaries, max_chars, stop_after=None):
+    """Fill each chunk up to the last sentence boundary that fits; linear in len(text)"""
+    spans = []
+    end = _trim_end(text, 0, len(text))
+    start = _skip_whitespace(text, 0)
+    next_boundary = 0
+
+    while start < end:
+        if stop_after is not None and len(spans) > stop_after: break
+
+        limit = start + max_chars
+        if limit >= end:
+            spans.append((start, end))
+            break
+
+        cut = None
+        while next_boundary < len(boundaries) and boundaries[next_boundary] <= limit:
+            if boundaries[next_boundary] > start: cut = boundaries[next_boundary]
+            next_boundary += 1
+        if cut is None: cut = _fallback_cut(text, start, limit)
+
+        spans.append((start, _trim_end(text, start, cut)))
+        start = _skip_whitespace(text, cut)
+
+    return spans
+
+
+def _fallback_cut(text, start, limit):
+    """Cut a sentence that is too long at a clause boundary, else a space, else at the limit"""
+    clause_cut = None
+    for match in CLAUSE_BOUNDARY.finditer(text, start, limit):
+        clause_cut = match.end()
+    if clause_cut and clause_cut - start >= (limit - start) // 2: return clause_cut
+
+    space = max(text.rfind(char, start + 1, limit + 1) for char in " \t\n")
+    if space > start: return space
+
+    return clause_cut or limit
+
+
+def _skip_whitespace(text, position):
+    while position < len(text) and text[position] in WHITESPACE:
+        position += 1
+    return position
+
+
+def _trim_end(text, start, end):
+    while end > start and text[end - 1] in WHITESPACE:
+        end -= 1
+    return end
+
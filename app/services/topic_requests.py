@@ -0,0 +1,81 @@
+import boto3
+import json
+import time
+
+# Request handling shared by the HTTP entry point (store_topic) and batch Lambdas
+# (bulk_backfill); it must not depend on fastapi so it can ship without the layer.
+
+CATEGORIES = ["Technical & Programming", "Mathematics and Algorithms", "Science & Engineering", "History & Social Studies", "Creative Writing & Literature", "Health & Medicine"]
+DIFFICULTY_LEVELS = ["BEGINNER", "INTERMEDIATE", "ADVANCED"]
+
+# Initialize client
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+stepfunctions = boto3.client('stepfunctions', region_name="us-east-1")
+
+topics_table = dynamodb.Table("EPTopicsRequest")
+status_table = dynamodb.Table("EPPodcastStatus")
+
+STEP_FUNCTION_ARN = "arn:aws:states:us-east-1:184226036469:stateMachine:PodcastGenerationWorkflow"
+
+
+def validate_request(request):
+    """Raises ValueError with a message fit for the caller when the request is invalid"""
+    # validate cateogry
+    if request["category"] not in CATEGORIES:
+        raise ValueError("Invalid category. Choose from: " + ", ".join(CATEGORIES))
+
+    # validate difficulty level
+    if request["level_of_difficulty"] not in DIFFICULTY_LEVELS:
+        raise ValueError("Invalid difficulty level. Choose from: " + ", ".join(DIFFICULTY_LEVELS))
+
+    # validate chapters
+    if request["chapters"] <= 0:
+        raise ValueError("Chapters must be a positive integer")
+
+
+def store_request(request, topic_id, request_id, timestamp):
+
+    topics_table.put_item(Item={
+        "request_id": request_id,
+        "topic_id": topic_id,
+        "category": request["category"],
+        "topic": request["topic"],
+        "desc": request["desc"],
+        "level_of_difficulty": request["level_of_difficulty"],
+        "chapters": request["chapters"],
+        "status": "PENDING",
+        "timestamp": str(time.time())
+    })
+
+    # Initialize status in status table
+    status_table.put_item(Item={
+        "topic_id": topic_id,
+        "status": "CONTENT_GENERATION_STARTED",
+        "intro_complete": False,
+        "chapters_complete": {},
+        "audio_complete": {},
+        "streamed_chapters": {},
+        "created_at": timestamp,
+        "updated_at": timestamp
+    })
+
+def start_step_function(request, topic_id, request_id, content_ready=False):
+    """Starts Step Functions workflow, content_ready skips straight to the audio stages"""
+    # Prepare input for Step Functions
+    workflow_input = {
+        "topic_id": topic_id,
+        "request_id": request_id,
+        "topic": request["topic"],
+        "desc": request["desc"],
+        "level_of_difficulty": request["level_of_difficulty"],
+        "chapters": request["chapters"],
+        "category": request["category"]
+    }
+    if content_ready: workflow_input["content_ready"] = True
+
+    # Start Step Functions execution
+    stepfunctions.start_execution(
+        stateMachineArn=STEP_FUNCTION_ARN,
+        name=f"podcast-{topic_id}",
+        input=json.dumps(workflow_input)
+    )
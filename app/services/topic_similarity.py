@@ -0,0 +1,159 @@
+import boto3
+import json
+import time
+import array
+import base64
+import random
+import hashlib
+import threading
+from botocore.exceptions import ClientError
+
+s3 = boto3.client("s3", region_name="us-east-1")
+
+CONTENT_BUCKET = "echopod-content"
+INDEX_KEY = "_cache/similarity/topic_index.json"
+
+# 64 MinHash permutations split into 16 LSH bands of 4 rows: pairs above ~0.5 Jaccard
+# almost always share a band, pairs below ~0.2 almost never do
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Words that say nothing about the subject of a topic
+STOP_WORDS = {
+    "a", "an", "and", "the", "of", "to", "for", "in", "on", "with", "how", "what", "why",
+    "is", "are", "into", "about", "your", "you", "intro", "introduction", "beginner",
+    "beginners", "basic", "basics", "guide", "overview", "fundamental", "fundamentals",
+    "101", "understanding", "learn", "learning"
+}
+
+_rng = random.Random(20250101)
+_PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# Loaded lazily on the first query and kept for the life of the container
+_index = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lower-case words with stop words dropped and a naive plural strip"""
+    words = "".join(c if c.isalnum() else " " for c in str(text or "").lower()).split()
+    tokens = []
+    for word in words:
+        if word in STOP_WORDS: continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"): word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def shingles(text):
+    """Word unigrams plus bigrams"""
+    tokens = tokenize(text)
+    return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def signature(text):
+    """32-bit MinHash signature of the text's shingles"""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles(text)]
+    if not hashes: return None
+
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMUTATIONS]
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def find_similar(text, scope, threshold):
+    """
+    Return (entry_id, meta, score) for the most similar indexed text within the
+    same scope, or None when nothing reaches the threshold.
+    """
+    sig = signature(text)
+    if not sig: return None
+
+    index = _load_index()
+    with _index_lock:
+        candidates = set()
+        for band_key in _band_keys(sig, scope):
+            candidates.update(index["buckets"].get(band_key, ()))
+
+        best = None
+        for entry_id in candidates:
+            entry = index["entries"][entry_id]
+            score = similarity(sig, entry["sig"])
+            if score >= threshold and (best is None or score > best[2]):
+                best = (entry_id, entry["meta"], score)
+
+    return best
+
+
+def add(entry_id, text, scope, meta):
+    """Add a text to the index and persist it, merging entries other containers wrote meanwhile"""
+    sig = signature(text)
+    if not sig: return
+
+    index = _load_index()
+    with _index_lock:
+        latest = _read_index()
+        for other_id, other in latest["entries"].items():
+            if other_id not in index["entries"]: _insert(index, other_id, other)
+
+        _insert(index, entry_id, {"sig": sig, "scope": scope, "meta": dict(meta, added_at=str(int(time.time())))})
+        _write_index(index)
+
+
+def _band_keys(sig, scope):
+    return [f"{scope}|{band}|" + ",".join(map(str, sig[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def _insert(index, entry_id, entry):
+    index["entries"][entry_id] = entry
+    for band_key in _band_keys(entry["sig"], entry["scope"]):
+        index["buckets"].setdefault(band_key, []).append(entry_id)
+
+
+def _load_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = {"entries": {}, "buckets": {}}
+            for entry_id, entry in _read_index()["entries"].items():
+                _insert(_index, entry_id, entry)
+        return _index
+
+
+def _read_index():
+    """Read the persisted index, signatures are stored as base64 packed 32-bit integers"""
+    try:
+        obj = s3.get_object(Bucket=CONTENT_BUCKET, Key=INDEX_KEY)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"): return {"entries": {}}
+        raise
+
+    stored = json.loads(obj["Body"].read().decode("utf-8"))
+    entries = {}
+    for entry_id, entry in stored.get("entries", {}).items():
+        sig = array.array("I")
+        sig.frombytes(base64.b64decode(entry["sig"]))
+        entries[entry_id] = {"sig": list(sig), "scope": entry["scope"], "meta": entry["meta"]}
+    return {"entries": entries}
+
+
+def _write_index(index):
+    entries = {
+        entry_id: {
+            "sig": base64.b64encode(array.array("I", entry["sig"]).tobytes()).decode("ascii"),
+            "scope": entry["scope"],
+            "meta": entry["meta"]
+        }
+        for entry_id, entry in index["entries"].items()
+    }
+    s3.put_object(
+        Bucket=CONTENT_BUCKET,
+        Key=INDEX_KEY,
+        Body=json.dumps({"num_perm": NUM_PERM, "bands": BANDS, "entries": entries}, separators=(",", ":")),
+        ContentType="application/json"
+    )
@@ -0,0 +1,88 @@
+import boto3
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+from botocore.exceptions import ClientError
+
+s3 = boto3.client("s3", region_name="us-east-1")
+
+# Synthesized audio keyed by everything that determines the bytes Polly returns. Entries are
+# written once and never modified, so a hit can always be copied into place as-is.
+AUDIO_BUCKET = "echopod-audio"
+CACHE_PREFIX = "_cache/tts"
+LRU_SIZE = 1024
+
+# In-process record of keys known to exist, saves a HEAD per chunk on warm containers
+_known = OrderedDict()
+_known_lock = threading.Lock()
+
+
+def make_cache_key(text, voice_id, engine, language_code, output_format):
+    """Content-addressed key for one synthesis request"""
+    parts = [" ".join(str(text).split()), voice_id, engine, language_code, output_format]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def cache_object_key(cache_key):
+    return f"{CACHE_PREFIX}/{cache_key[:2]}/{cache_key}.mp3"
+
+
+def exists(cache_key):
+    with _known_lock:
+        if cache_key in _known:
+            _known.move_to_end(cache_key)
+            return True
+
+    try:
+        s3.head_object(Bucket=AUDIO_BUCKET, Key=cache_object_key(cache_key))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"): return False
+        raise
+
+    remember(cache_key)
+    return True
+
+
+def copy_to(cache_key, destination_key):
+    """Server-side copy of a cached entry into place, returns False on a miss"""
+    if not exists(cache_key): return False
+
+    s3.copy_object(
+        Bucket=AUDIO_BUCKET,
+        Key=destination_key,
+        CopySource={"Bucket": AUDIO_BUCKET, "Key": cache_object_key(cache_key)},
+        ContentType="audio/mpeg",
+        MetadataDirective="REPLACE"
+    )
+    return True
+
+
+def store(cache_key, source_key):
+    """Add freshly synthesized audio to the cache, existing entries are left untouched"""
+    if exists(cache_key): return
+
+    s3.copy_object(
+        Bucket=AUDIO_BUCKET,
+        Key=cache_object_key(cache_key),
+        CopySource={"Bucket": AUDIO_BUCKET, "Key": source_key},
+        ContentType="audio/mpeg",
+        MetadataDirective="REPLACE"
+    )
+    remember(cache_key)
+
+
+def key_from_output_uri(output_uri):
+    """Object key of a Polly task's OutputUri (https://s3.<region>.amazonaws.com/<bucket>/<key>)"""
+    path = unquote(urlparse(output_uri).path).lstrip("/")
+    bucket, _, key = path.partition("/")
+    return key if bucket == AUDIO_BUCKET else None
+
+
+def remember(cache_key):
+    with _known_lock:
+        _known[cache_key] = True
+        _known.move_to_end(cache_key)
+        while len(_known) > LRU_SIZE:
+            _known.popitem(last=False)
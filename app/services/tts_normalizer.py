@@ -0,0 +1,111 @@
+import re
+
+# Turns model-written chapter text into plain speech text before it is billed by Polly.
+# Markdown, list markers, "Chapter N:" banner lines, code identifiers, abbreviations and
+# symbols are rewritten in a single pass over one compiled alternation, then whitespace is
+# collapsed. Every character removed here is a character Polly neither bills nor reads out.
+
+# Spoken forms of symbols; only matched as standalone operators or where noted
+SYMBOLS = {
+    "&": " and ",
+    "%": " percent",
+    "->": " to ",
+    "=>": " to ",
+    "==": " equals ",
+    "!=": " is not equal to ",
+    "<=": " is less than or equal to ",
+    ">=": " is greater than or equal to ",
+    "=": " equals ",
+    "+": " plus ",
+    "<": " is less than ",
+    ">": " is greater than ",
+    "*": " times "
+}
+
+ABBREVIATIONS = {
+    "e.g.": "for example",
+    "i.e.": "that is",
+    "etc.": "et cetera",
+    "vs.": "versus",
+    "approx.": "approximately"
+}
+
+# Abbreviations that can end a sentence keep their period there, so Polly pauses and the
+# chunker still sees the sentence boundary
+SENTENCE_FINAL_ABBREVIATIONS = ("etc.",)
+
+_SPEECH_PATTERN = re.compile(
+    r"(?P<fence>^[ \t]*(?:```|~~~)[^\n]*\n?)"
+    r"|(?P<code>`(?P<code_text>[^`\n]+)`)"
+    r"|(?P<banner>^[ \t]*(?:\#{1,6}[ \t]*)?(?:\*\*|__)?Chapter[ \t]+\d+[ \t]*[:.\-–—][^\n.!?]{0,80}?(?:\*\*|__)?[ \t]*$)"
+    r"|(?P<heading>^[ \t]*\#{1,6}[ \t]+)"
+    r"|(?P<rule>^[ \t]*(?:[-*_][ \t]*){3,}$)"
+    r"|(?P<bullet>^[ \t]*(?:[-*+•▪][ \t]+|>[ \t]?))"
+    r"|(?P<link>\[(?P<link_text>[^\]\n]+)\]\([^)\n]*\))"
+    r"|(?P<identifier>\b[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+\(\)"
+    r"|\b[A-Za-z][A-Za-z0-9]*(?:_[A-Za-z0-9]+)+\b(?:\(\))?"
+    r"|\b[a-z]{2,}(?:[A-Z][a-z0-9]+|[A-Z]{2,}(?=[A-Z][a-z]|\b))+\b(?:\(\))?"
+    r"|\b[A-Za-z_]\w*\(\))"
+    r"|(?P<abbreviation>(?<!\w)(?:" + "|".join(re.escape(a) for a in ABBREVIATIONS) + r"))"
+    r"|(?P<percent>(?<=\d)%)"
+    r"|(?P<operator>(?<=\s)(?:->|=>|==|!=|<=|>=|[=+<>*])(?=\s))"
+    r"|(?P<ampersand>&)"
+    r"|(?P<emphasis>(?<![\w*])(?P<em_mark>\*{1,3}|_{1,3})(?=[^\s*_])(?P<em_text>[^\n]*?[^\s*_])(?P=em_mark)(?![\w*]))",
+    re.MULTILINE
+)
+
+_INLINE_IDENTIFIER = re.compile(r"[A-Za-z_][\w.]*(?:\(\))?")
+# Word breaks inside identifiers: before a capital after lowercase (maxValue) and before the
+# last capital of an acronym run that starts a word (HTTPResponse)
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+_SENTENCE_START = re.compile(r"\s+[A-Z]|\s*\Z")
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_SPACE_BEFORE_PUNCTUATION = re.compile(r" +(?=[,.;:!?])")
+_BLANK_LINES = re.compile(r"[ \t]*\n(?:[ \t]*\n)+")
+
+
+def normalize_for_speech(text):
+    """Return (speech text, characters removed); the count is net of spoken expansions"""
+    if not text: return "", 0
+
+    clean = _SPEECH_PATTERN.sub(_rewrite, text)
+    clean = _SPACES.sub(" ", clean)
+    clean = _SPACE_BEFORE_PUNCTUATION.sub("", clean)
+    clean = _BLANK_LINES.sub("\n\n", clean)
+    clean = "\n".join(line.strip() for line in clean.split("\n")).strip()
+
+    return clean, len(text) - len(clean)
+
+
+def speak_identifier(identifier):
+    """
+    calculate_total() -> calculate total, maxValue -> max value, os.path.join() -> os dot path
+    dot join. Acronyms keep their capitals so Polly spells them: parseHTTPResponse -> parse HTTP
+    response, user_ID -> user ID.
+    """
+    words = identifier.replace("()", "").replace("_", " ").replace(".", " dot ")
+    words = _CAMEL_BOUNDARY.sub(" ", words)
+    if words.isupper(): return words
+    return " ".join(word if len(word) > 1 and word.isupper() else word.lower() for word in words.split())
+
+
+def _rewrite(match):
+    kind = match.lastgroup
+    if kind == "code":
+        code = match.group("code_text")
+        return speak_identifier(code) if _INLINE_IDENTIFIER.fullmatch(code) else code
+    if kind == "link": return match.group("link_text")
+    if kind == "identifier": return speak_identifier(match.group())
+    if kind == "abbreviation":
+        spoken = ABBREVIATIONS[match.group()]
+        if match.group() in SENTENCE_FINAL_ABBREVIATIONS and _SENTENCE_START.match(match.string, match.end()):
+            return spoken + "."
+        return spoken
+    if kind == "percent": return SYMBOLS["%"]
+    if kind == "operator": return SYMBOLS[match.group()]
+    if kind == "ampersand": return SYMBOLS["&"]
+    # Only paired markers are emphasis, a lone * as in 2*3 is left alone; the text inside
+    # still gets rewritten
+    if kind == "emphasis": return _SPEECH_PATTERN.sub(_rewrite, match.group("em_text"))
+    # fence, banner, heading, rule and bullet markup is dropped
+    return ""
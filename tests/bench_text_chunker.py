@@ -0,0 +1,64 @@
+"""
+Benchmark for text_chunker against the splitter polly_convert used before it:
+
+    python tests/bench_text_chunker.py
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "app", "services")))
+
+from text_chunker import chunk_text, DEFAULT_MAX_CHARS
+
+
+def legacy_split(text, max_chars=DEFAULT_MAX_CHARS):
+    """The previous polly_convert splitter: '. ' only, string concatenation, no hard limit"""
+    if len(text) <= max_chars: return [text]
+    chunks, current_chunk = [], ""
+    for sentence in text.replace("\n", " ").split(". "):
+        if not sentence.endswith("."): sentence += "."
+        if len(current_chunk) + len(sentence) + 1 <= max_chars:
+            current_chunk += (" " if current_chunk else "") + sentence
+        else:
+            chunks.append(current_chunk)
+            current_chunk = sentence
+    if current_chunk: chunks.append(current_chunk)
+    return chunks
+
+
+def main():
+    rng = random.Random(7)
+    words = "graph node edge queue stack visit neighbor path weight distance tree search order level".split()
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(6, 30))).capitalize() + rng.choice([".", "?", "!"])
+
+    paragraphs = []
+    while sum(map(len, paragraphs)) < 100_000:
+        paragraphs.append(" ".join(sentence() for _ in range(rng.randint(3, 8))))
+    inputs = {
+        "prose": "\n\n".join(paragraphs)[:100_000],
+        "one long sentence": ", ".join(" ".join(rng.choice(words) for _ in range(12)) for _ in range(1200))[:100_000],
+        "no spaces": "x" * 100_000
+    }
+
+    for name, text in inputs.items():
+        for label, split in (
+            ("legacy", legacy_split),
+            ("chunk_text", chunk_text),
+            ("chunk_text balanced", lambda t: chunk_text(t, balance=True))
+        ):
+            started = time.perf_counter()
+            for _ in range(10): chunks = split(text)
+            elapsed = (time.perf_counter() - started) / 10
+            sizes = [len(chunk) for chunk in chunks]
+            print(
+                f"{name:<18} {label:<20} {elapsed * 1000:7.2f} ms  {len(chunks):3d} chunks  "
+                f"min {min(sizes):5d}  max {max(sizes):6d}  over limit {sum(size > DEFAULT_MAX_CHARS for size in sizes)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+
+# The Lambdas import their helpers flat, the way they are zipped
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "app", "services")))
+
+# Module-level boto3 clients are created on import; the tests swap in local_fakes before any call
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import json
+from collections import OrderedDict
+import pytest
+
+import polly_convert
+import tts_audio_cache
+import lambda_tech_programming as generator
+import bedrock_usage
+import generation_cache
+import topic_similarity
+from rate_limiter import get_limiter
+from local_fakes import FakeBedrockRuntime, FakeS3, FakeTable, FakePolly
+
+TOPIC_ID = "topic-1"
+CHAPTERS = 3
+
+
+def new_topic(table, topic_id):
+    """
+    The status item store_topic creates. streamed_chapters is left out, as on items created
+    before store_topic wrote it; the code must not rely on it being there.
+    """
+    table.put_item(Item={
+        "topic_id": topic_id,
+        "status": "CONTENT_GENERATION_STARTED",
+        "intro_complete": False,
+        "chapters_complete": {},
+        "audio_complete": {}
+    })
+
+
+@pytest.fixture
+def polly_services(monkeypatch):
+    """
+    Fakes behind polly_convert and the audio cache, with a status item for TOPIC_ID. The limiter
+    is fast and the cache's in-memory index empty, so tests neither wait nor leak into each other.
+    Test modules patch the fakes into the Lambda they exercise on top of this.
+    """
+    s3, table = FakeS3(), FakeTable()
+    polly = FakePolly(s3=s3)
+    monkeypatch.setattr(polly_convert, "s3", s3)
+    monkeypatch.setattr(polly_convert, "polly", polly)
+    monkeypatch.setattr(polly_convert, "status_table", table)
+    monkeypatch.setattr(polly_convert, "polly_limiter", get_limiter("polly-tests", initial_rate=1000.0, max_rate=1000.0, burst=100))
+    monkeypatch.setattr(tts_audio_cache, "s3", s3)
+    monkeypatch.setattr(tts_audio_cache, "_known", OrderedDict())
+    new_topic(table, TOPIC_ID)
+    return {"s3": s3, "table": table, "polly": polly}
+
+
+def episode_responder(payload):
+    """An outline of CHAPTERS chapters for the outline prompt, a fixed chapter for anything else"""
+    prompt = payload["messages"][-1]["content"][-1]["text"]
+    if "OUTPUT INSTRUCTIONS" in prompt:
+        return json.dumps({
+            "introduction": "Welcome to the episode. " * 40,
+            "chapters": [{"number": n, "title": f"Part {n}", "summary": "What this part covers."} for n in range(1, CHAPTERS + 1)]
+        })
+    return "This chapter walks through one idea at a time. " * 30
+
+
+@pytest.fixture
+def generator_services(monkeypatch):
+    """Fakes behind the generation function, its caches and usage tracking, with a fast Bedrock limiter"""
+    s3, table, runtime = FakeS3(), FakeTable(), FakeBedrockRuntime(episode_responder)
+    monkeypatch.setattr(generator, "bedrock", runtime)
+    monkeypatch.setattr(generator, "bedrock_limiter", get_limiter("bedrock-tests", initial_rate=1000.0, max_rate=1000.0, burst=100))
+    for module in (generator, generation_cache, topic_similarity, bedrock_usage):
+        monkeypatch.setattr(module, "s3", s3)
+    for module in (generator, bedrock_usage):
+        monkeypatch.setattr(module, "status_table", table)
+    # Both caches keep an in-process copy across warm invocations, start each test without one
+    monkeypatch.setattr(generation_cache, "_lru", OrderedDict())
+    monkeypatch.setattr(topic_similarity, "_index", None)
+    return {"s3": s3, "table": table, "runtime": runtime}
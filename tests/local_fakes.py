@@ -0,0 +1,519 @@
+"""
+In-memory stand-ins for the AWS runtimes the services talk to, for running the
+Lambdas locally and in the tests. Swap them in on the module, e.g.:
+
+    import lambda_tech_programming
+    from local_fakes import FakeBedrockRuntime
+    lambda_tech_programming.bedrock = FakeBedrockRuntime()
+"""
+import io
+import re
+import copy
+import json
+import time
+import hashlib
+import threading
+from botocore.exceptions import ClientError
+
+
+class FakeThrottlingException(Exception):
+    pass
+
+
+class FakeBedrockRuntime:
+    """
+    Fake bedrock-runtime client for the Anthropic messages API.
+
+    Replies come from responder(payload) (an echo of the last user message by default).
+    Prompt caching is simulated: the prefix up to the last block marked with
+    cache_control is cached on first use and reported as cache reads afterwards,
+    using roughly 4 characters per token.
+    """
+
+    class exceptions:
+        ThrottlingException = FakeThrottlingException
+
+    def __init__(self, responder=None, throttle_first=0):
+        self.responder = responder or self.echo
+        self.throttle_remaining = throttle_first
+        self.cached_prefixes = set()
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, **kwargs):
+        payload, text, usage = self._respond(modelId, body)
+        response = {
+            "id": "msg_fake",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": usage
+        }
+        return {"body": io.BytesIO(json.dumps(response).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        payload, text, usage = self._respond(modelId, body)
+        output_tokens = usage.pop("output_tokens")
+        events = [{"type": "message_start", "message": {"model": modelId, "usage": dict(usage, output_tokens=1)}}]
+        events += [
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text[i:i + 20]}}
+            for i in range(0, len(text), 20)
+        ]
+        events.append({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": output_tokens}})
+        events.append({"type": "message_stop"})
+        return {"body": [{"chunk": {"bytes": json.dumps(event).encode("utf-8")}} for event in events]}
+
+    @staticmethod
+    def echo(payload):
+        last = payload["messages"][-1]["content"]
+        return f"Fake response to: {last[-1]['text'] if isinstance(last, list) else last}"
+
+    def _respond(self, model_id, body):
+        payload = json.loads(body)
+        with self.lock:
+            self.calls.append({"model_id": model_id, "payload": payload})
+            if self.throttle_remaining > 0:
+                self.throttle_remaining -= 1
+                raise FakeThrottlingException("Too many requests")
+
+        text = self.responder(payload)
+        return payload, text, dict(self._input_usage(payload), output_tokens=max(1, len(text) // 4))
+
+    def _input_usage(self, payload):
+        blocks = []
+        for message in payload.get("messages", []):
+            content = message["content"]
+            blocks.extend(content if isinstance(content, list) else [{"type": "text", "text": content}])
+
+        checkpoint = max((i for i, block in enumerate(blocks) if "cache_control" in block), default=None)
+        total_tokens = sum(len(block.get("text", "")) for block in blocks) // 4
+        if checkpoint is None:
+            return {"input_tokens": total_tokens, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+        prefix = blocks[:checkpoint + 1]
+        prefix_tokens = sum(len(block.get("text", "")) for block in prefix) // 4
+        prefix_hash = hashlib.sha256(json.dumps(prefix, sort_keys=True).encode("utf-8")).hexdigest()
+        with self.lock:
+            hit = prefix_hash in self.cached_prefixes
+            self.cached_prefixes.add(prefix_hash)
+
+        return {
+            "input_tokens": total_tokens - prefix_tokens,
+            "cache_read_input_tokens": prefix_tokens if hit else 0,
+            "cache_creation_input_tokens": 0 if hit else prefix_tokens
+        }
+
+
+class FakeS3:
+    """Dict-backed S3 client covering the calls the services make"""
+
+    def __init__(self, page_size=1000):
+        self.objects = {}
+        self.page_size = page_size
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if hasattr(Body, "read"): Body = Body.read()
+        if isinstance(Body, str): Body = Body.encode("utf-8")
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body
+        return {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        return self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read())
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            if (Bucket, Key) not in self.objects: raise self._error("NoSuchKey", "GetObject")
+            body = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            if (Bucket, Key) not in self.objects: raise self._error("404", "HeadObject")
+            return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        body = self.get_object(CopySource["Bucket"], CopySource["Key"])["Body"].read()
+        return self.put_object(Bucket, Key, body)
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, **kwargs):
+        with self.lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+            start = int(ContinuationToken or 0)
+            page = keys[start:start + self.page_size]
+            response = {"KeyCount": len(page), "IsTruncated": start + self.page_size < len(keys)}
+            if response["IsTruncated"]: response["NextContinuationToken"] = str(start + self.page_size)
+            if page: response["Contents"] = [{"Key": key, "Size": len(self.objects[(Bucket, key)])} for key in page]
+            return response
+
+    @staticmethod
+    def _error(code, operation):
+        return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class FakeTable:
+    """
+    Dict-backed DynamoDB Table resource keyed on one hash key. update_item understands the
+    expressions the services use: SET with dotted/indexed paths, if_not_exists and list_append,
+    ADD on numbers and sets, REMOVE, ReturnValues and simple ConditionExpressions.
+    """
+
+    ASSIGNMENT = re.compile(r"\s*([^=]+?)\s*=\s*(.+?)\s*$")
+    ACTIONS = re.compile(r"\b(SET|ADD|REMOVE)\b")
+    COMPARISON = re.compile(r"^(.+?)\s*(<=|>=|<>|=|<|>)\s*(.+)$")
+
+    def __init__(self, key_name="topic_id"):
+        self.key_name = key_name
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def put_item(self, Item, **kwargs):
+        with self.lock:
+            self.items[Item[self.key_name]] = copy.deepcopy(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            item = self.items.get(Key[self.key_name])
+            return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ConditionExpression=None, ReturnValues="ALL_NEW", **kwargs):
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self.lock:
+            old = self.items.get(Key[self.key_name])
+            item = copy.deepcopy(old) if old is not None else dict(Key)
+            if ConditionExpression and not self._condition(item if old is not None else {}, ConditionExpression, names, values):
+                raise ClientError(
+                    {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+                    "UpdateItem"
+                )
+
+            updated = []
+            tokens = self.ACTIONS.split(UpdateExpression)
+            for action, body in zip(tokens[1::2], tokens[2::2]):
+                for clause in filter(str.strip, self._split(body)):
+                    if action == "SET":
+                        path, expression = self.ASSIGNMENT.match(clause).groups()
+                        steps = self._path(path, names)
+                        self._assign(item, steps, self._evaluate(item, expression, names, values))
+                    elif action == "ADD":
+                        path, placeholder = clause.split()
+                        steps = self._path(path, names)
+                        self._assign(item, steps, self._add(self._lookup(item, steps), values[placeholder]))
+                    else:
+                        steps = self._path(clause, names)
+                        self._remove(item, steps)
+                    updated.append(steps[0])
+
+            self.items[Key[self.key_name]] = item
+            if ReturnValues == "ALL_OLD": return {"Attributes": copy.deepcopy(old or {})}
+            if ReturnValues == "UPDATED_NEW":
+                return {"Attributes": {name: copy.deepcopy(item[name]) for name in updated if name in item}}
+            if ReturnValues == "NONE": return {}
+            return {"Attributes": copy.deepcopy(item)}
+
+    def _condition(self, item, expression, names, values):
+        """Evaluate AND/OR/NOT, parentheses, attribute_exists, attribute_not_exists, contains and comparisons"""
+        expression = expression.strip()
+        while expression.startswith("(") and self._closing(expression, 0) == len(expression) - 1:
+            expression = expression[1:-1].strip()
+
+        for keyword in (" OR ", " AND "):
+            parts = self._split_keyword(expression, keyword)
+            if len(parts) > 1:
+                results = [self._condition(item, part, names, values) for part in parts]
+                return any(results) if keyword == " OR " else all(results)
+        if expression.startswith("NOT "): return not self._condition(item, expression[4:], names, values)
+
+        if "(" in expression and expression.endswith(")"):
+            function, arguments = expression.split("(", 1)
+            arguments = self._split(arguments[:-1])
+            current = self._lookup(item, self._path(arguments[0], names))
+            function = function.strip()
+            if function == "attribute_exists": return current is not None
+            if function == "attribute_not_exists": return current is None
+            if function == "contains": return current is not None and values[arguments[1].strip()] in current
+
+        left, operator, right = self.COMPARISON.match(expression).groups()
+        left, right = self._evaluate_operand(item, left, names, values), self._evaluate_operand(item, right, names, values)
+        if left is None or right is None: return False
+        return {
+            "=": left == right, "<>": left != right, "<": left < right,
+            "<=": left <= right, ">": left > right, ">=": left >= right
+        }[operator]
+
+    @staticmethod
+    def _closing(expression, start):
+        depth = 0
+        for i in range(start, len(expression)):
+            depth += (expression[i] == "(") - (expression[i] == ")")
+            if depth == 0: return i
+        return -1
+
+    @staticmethod
+    def _split_keyword(expression, keyword):
+        """Split on a keyword that is not inside parentheses"""
+        parts, depth, start, i = [], 0, 0, 0
+        while i < len(expression):
+            depth += (expression[i] == "(") - (expression[i] == ")")
+            if depth == 0 and expression.startswith(keyword, i):
+                parts.append(expression[start:i])
+                i += len(keyword)
+                start = i
+                continue
+            i += 1
+        return parts + [expression[start:]]
+
+    @staticmethod
+    def _add(current, value):
+        if isinstance(value, (set, frozenset)): return set(current or set()) | set(value)
+        return (current or 0) + value
+
+    @staticmethod
+    def _remove(item, steps):
+        for step in steps[:-1]:
+            try:
+                item = item[step]
+            except (KeyError, IndexError, TypeError):
+                return
+        if isinstance(item, dict): item.pop(steps[-1], None)
+        elif isinstance(item, list) and steps[-1] < len(item): del item[steps[-1]]
+
+    @staticmethod
+    def _split(expression):
+        """Split on commas that are not inside a function call"""
+        parts, depth, current = [], 0, ""
+        for char in expression:
+            depth += (char == "(") - (char == ")")
+            if char == "," and depth == 0:
+                parts.append(current)
+                current = ""
+            else:
+                current += char
+        return parts + [current]
+
+    @staticmethod
+    def _path(path, names):
+        steps = []
+        for part in path.strip().split("."):
+            name, *indexes = re.split(r"\[(\d+)\]", part)
+            steps.append(names.get(name, name))
+            steps.extend(int(index) for index in indexes if index)
+        return steps
+
+    def _evaluate(self, item, expression, names, values):
+        expression = expression.strip()
+        if expression.startswith(":"): return copy.deepcopy(values[expression])
+
+        function, arguments = expression.split("(", 1)
+        first, second = self._split(arguments[:-1])
+        if function.strip() == "if_not_exists":
+            current = self._lookup(item, self._path(first, names))
+            return current if current is not None else self._evaluate(item, second, names, values)
+        if function.strip() == "list_append":
+            return self._evaluate_operand(item, first, names, values) + self._evaluate_operand(item, second, names, values)
+        raise ValueError(f"Unsupported update expression {expression}")
+
+    def _evaluate_operand(self, item, operand, names, values):
+        """An operand is a value placeholder, a function call or an attribute path"""
+        if operand.strip().startswith(":") or "(" in operand: return self._evaluate(item, operand, names, values)
+        return self._lookup(item, self._path(operand, names))
+
+    @staticmethod
+    def _lookup(item, steps):
+        for step in steps:
+            try:
+                item = item[step]
+            except (KeyError, IndexError, TypeError):
+                return None
+        return item
+
+    @staticmethod
+    def _assign(item, steps, value):
+        # Like DynamoDB, a nested path only resolves when every parent along it exists
+        for step in steps[:-1]:
+            try:
+                item = item[step]
+            except (KeyError, IndexError, TypeError):
+                raise ClientError(
+                    {"Error": {"Code": "ValidationException", "Message": "The document path provided in the update expression is invalid for update"}},
+                    "UpdateItem"
+                )
+        item[steps[-1]] = value
+
+
+class FakeStepFunctions:
+    """Records start_execution and task token callbacks instead of running the state machine"""
+
+    def __init__(self):
+        self.executions = []
+        self.task_results = []
+
+    def start_execution(self, stateMachineArn, name, input, **kwargs):
+        self.executions.append({"stateMachineArn": stateMachineArn, "name": name, "input": json.loads(input)})
+        return {"executionArn": f"{stateMachineArn.replace(':stateMachine:', ':execution:')}:{name}", "startDate": time.time()}
+
+    def send_task_success(self, taskToken, output, **kwargs):
+        self._send(taskToken, "success", output=json.loads(output))
+        return {}
+
+    def send_task_failure(self, taskToken, error=None, cause=None, **kwargs):
+        self._send(taskToken, "failure", error=error, cause=cause)
+        return {}
+
+    def _send(self, token, result, **details):
+        # A token can only be answered once, like the real service
+        if any(sent["taskToken"] == token for sent in self.task_results):
+            raise ClientError({"Error": {"Code": "InvalidToken", "Message": "Task token already used"}}, "SendTaskSuccess")
+        self.task_results.append(dict(details, taskToken=token, result=result))
+
+
+class FakePolly:
+    """
+    Fake Polly client. synthesize_speech returns silence-sized bytes straight away; async tasks
+    stay "scheduled" until complete() or complete_all() finishes them, which writes the audio
+    to the given S3 client and, for tasks started with an SnsTopicArn, delivers the completion
+    notification as an SNS Lambda event to subscriber (e.g. polly_completion_handler.lambda_handler).
+    """
+
+    def __init__(self, s3=None, subscriber=None, throttle_first=0):
+        self.s3 = s3
+        self.subscriber = subscriber
+        self.throttle_first = throttle_first
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def synthesize_speech(self, Text, **kwargs):
+        self._maybe_throttle()
+        return {"AudioStream": io.BytesIO(self._audio(Text)), "ContentType": "audio/mpeg", "RequestCharacters": len(Text)}
+
+    def start_speech_synthesis_task(self, Text, OutputS3BucketName, OutputS3KeyPrefix, OutputFormat="mp3", **kwargs):
+        self._maybe_throttle()
+        with self.lock:
+            task_id = f"faketask{len(self.tasks) + 1:05d}"
+            task = {
+                "TaskId": task_id,
+                "TaskStatus": "scheduled",
+                "OutputUri": f"https://s3.us-east-1.amazonaws.com/{OutputS3BucketName}/{OutputS3KeyPrefix}.{task_id}.{OutputFormat}",
+                "CreationTime": time.time(),
+                "RequestCharacters": len(Text),
+                "OutputFormat": OutputFormat,
+                "VoiceId": kwargs.get("VoiceId"),
+                "Engine": kwargs.get("Engine"),
+                "SnsTopicArn": kwargs.get("SnsTopicArn")
+            }
+            self.tasks[task_id] = dict(task, _text=Text, _bucket=OutputS3BucketName, _key=f"{OutputS3KeyPrefix}.{task_id}.{OutputFormat}")
+        return {"SynthesisTask": task}
+
+    def get_speech_synthesis_task(self, TaskId, **kwargs):
+        with self.lock:
+            if TaskId not in self.tasks:
+                raise ClientError({"Error": {"Code": "SynthesisTaskNotFoundException", "Message": TaskId}}, "GetSpeechSynthesisTask")
+            return {"SynthesisTask": {k: v for k, v in self.tasks[TaskId].items() if not k.startswith("_")}}
+
+    def complete(self, task_id, status="completed", reason="Synthesis failed"):
+        """Finish one task, or fail it with the given reason, and publish its completion event"""
+        with self.lock:
+            task = self.tasks[task_id]
+            task["TaskStatus"] = status
+            if status == "failed": task["TaskStatusReason"] = reason
+        if status == "completed" and self.s3:
+            self.s3.put_object(Bucket=task["_bucket"], Key=task["_key"], Body=self._audio(task["_text"]))
+        if task["SnsTopicArn"] and self.subscriber:
+            # The notification names the output as s3://bucket/key, unlike the task's https OutputUri
+            message = {
+                "taskId": task_id,
+                "taskStatus": status.upper(),
+                "outputUri": f"s3://{task['_bucket']}/{task['_key']}",
+                "creationTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(task["CreationTime"])),
+                "requestCharacters": task["RequestCharacters"],
+                "snsTopicArn": task["SnsTopicArn"],
+                "outputFormat": task["OutputFormat"],
+                "textType": "text",
+                "voiceId": task["VoiceId"]
+            }
+            return self.subscriber({"Records": [{"EventSource": "aws:sns", "Sns": {"TopicArn": task["SnsTopicArn"], "Message": json.dumps(message)}}]}, None)
+
+    def complete_all(self, status="completed"):
+        pending = [task_id for task_id, task in self.tasks.items() if task["TaskStatus"] in ("scheduled", "inProgress")]
+        return [self.complete(task_id, status) for task_id in pending]
+
+    def _maybe_throttle(self):
+        with self.lock:
+            if self.throttle_first > 0:
+                self.throttle_first -= 1
+                # Polly has no modeled throttling exception, the real client raises a plain ClientError
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "StartSpeechSynthesisTask")
+
+    @staticmethod
+    def _audio(text):
+        return hashlib.sha256(text.encode("utf-8")).digest() * 4
+
+
+class FakeBedrockBatch:
+    """
+    Fake bedrock control-plane client for batch inference. A job reads its JSONL input from
+    the given S3 client, runs every record through the runtime (FakeBedrockRuntime by default)
+    and writes {recordId, modelInput, modelOutput | error} lines to
+    <output prefix>/<job id>/<input file name>.out, the layout Bedrock uses.
+    The job reports InProgress for the first polls_until_complete status checks.
+    """
+
+    def __init__(self, s3, runtime=None, polls_until_complete=0):
+        self.s3 = s3
+        self.runtime = runtime or FakeBedrockRuntime()
+        self.polls_until_complete = polls_until_complete
+        self.jobs = {}
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        job_id = f"fakejob{len(self.jobs) + 1:04d}"
+        job_arn = f"arn:aws:bedrock:us-east-1:000000000000:model-invocation-job/{job_id}"
+
+        input_bucket, input_key = self._split_uri(inputDataConfig["s3InputDataConfig"]["s3Uri"])
+        output_bucket, output_prefix = self._split_uri(outputDataConfig["s3OutputDataConfig"]["s3Uri"])
+        lines = self.s3.get_object(Bucket=input_bucket, Key=input_key)["Body"].read().decode("utf-8").splitlines()
+
+        results = []
+        for line in filter(None, lines):
+            record = json.loads(line)
+            result = {"recordId": record["recordId"], "modelInput": record["modelInput"]}
+            try:
+                response = self.runtime.invoke_model(modelId=modelId, body=json.dumps(record["modelInput"]))
+                result["modelOutput"] = json.loads(response["body"].read())
+            except Exception as e:
+                result["error"] = {"errorCode": 400, "errorMessage": str(e)}
+            results.append(json.dumps(result))
+
+        output_key = f"{output_prefix.rstrip('/')}/{job_id}/{input_key.rsplit('/', 1)[-1]}.out"
+        self.s3.put_object(Bucket=output_bucket, Key=output_key, Body="\n".join(results))
+        self.jobs[job_arn] = {
+            "jobArn": job_arn,
+            "jobName": jobName,
+            "modelId": modelId,
+            "roleArn": roleArn,
+            "status": "Completed",
+            "polls_left": self.polls_until_complete
+        }
+        return {"jobArn": job_arn}
+
+    def get_model_invocation_job(self, jobIdentifier, **kwargs):
+        job = self.jobs[jobIdentifier]
+        if job["polls_left"] > 0:
+            job["polls_left"] -= 1
+            return dict(job, status="InProgress")
+        return dict(job)
+
+    @staticmethod
+    def _split_uri(uri):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        return bucket, key
@@ -0,0 +1,62 @@
+import json
+import pytest
+
+import audio_finalizer
+import polly_convert
+import polly_status_checker
+from conftest import TOPIC_ID
+from local_fakes import FakeTable
+
+
+@pytest.fixture
+def services(polly_services, monkeypatch):
+    monkeypatch.setattr(polly_status_checker, "polly", polly_services["polly"])
+    monkeypatch.setattr(polly_status_checker, "status_table", polly_services["table"])
+    monkeypatch.setattr(audio_finalizer, "s3", polly_services["s3"])
+    monkeypatch.setattr(audio_finalizer, "status_table", polly_services["table"])
+    monkeypatch.setattr(audio_finalizer, "topics_table", FakeTable())
+    return polly_services
+
+
+def audio_keys(s3):
+    return sorted(key for bucket, key in s3.objects if bucket == audio_finalizer.AUDIO_BUCKET and not key.startswith("_cache/"))
+
+
+def test_chapter_synthesized_as_one_task_is_finalized(services):
+    s3 = services["s3"]
+    key = f"{TOPIC_ID}/chapter_1.json"
+    text = " ".join(f"Sentence number {i} explains one more idea." for i in range(350))
+    s3.put_object(Bucket=polly_convert.CONTENT_BUCKET, Key=key, Body=json.dumps({"content": text}))
+
+    # Intro plus seven chapters share the parallel budget, so each chapter is one task
+    tasks = polly_convert.lambda_handler({"topic_id": TOPIC_ID, "key": key, "files_in_topic": 8}, None)["tasks"]
+    assert len(tasks) == 1
+    services["polly"].complete_all()
+
+    finalize_keys = polly_status_checker.lambda_handler({"topic_id": TOPIC_ID}, None)["finalizeKeys"]
+    assert finalize_keys == ["chapter_1"]
+
+    result = audio_finalizer.lambda_handler({"topic_id": TOPIC_ID, "chapter_key": "chapter_1"}, None)
+    assert result["status"] == "COMPLETED"
+    assert audio_keys(s3) == [f"{TOPIC_ID}/chapter_1.mp3"]
+
+
+def test_chapter_without_part_files_is_skipped(services):
+    services["s3"].put_object(Bucket=audio_finalizer.AUDIO_BUCKET, Key=f"{TOPIC_ID}/intro.mp3", Body=b"ID3")
+    result = audio_finalizer.lambda_handler({"topic_id": TOPIC_ID, "chapter_key": "intro"}, None)
+    assert result["status"] == "SKIPPED"
+    assert audio_keys(services["s3"]) == [f"{TOPIC_ID}/intro.mp3"]
+
+
+def test_streamed_chapter_uses_only_the_current_take(services):
+    s3 = services["s3"]
+    services["table"].items[TOPIC_ID]["streamed_chapters"] = {"chapter_1": {"take": "a1b2c3d4", "parts": 1}}
+    for key in (f"{TOPIC_ID}/chapter_1_9f8e7d6c_part001.mp3", f"{TOPIC_ID}/chapter_1_9f8e7d6c_part002.mp3",
+                f"{TOPIC_ID}/chapter_1_a1b2c3d4_part001.mp3", f"{TOPIC_ID}/chapter_10_a1b2c3d4_part001.mp3"):
+        s3.put_object(Bucket=audio_finalizer.AUDIO_BUCKET, Key=key, Body=key.encode("utf-8"))
+
+    result = audio_finalizer.lambda_handler({"topic_id": TOPIC_ID, "chapter_key": "chapter_1"}, None)
+
+    assert result["status"] == "COMPLETED"
+    assert audio_keys(s3) == [f"{TOPIC_ID}/chapter_1.mp3", f"{TOPIC_ID}/chapter_10_a1b2c3d4_part001.mp3"]
+    assert s3.objects[(audio_finalizer.AUDIO_BUCKET, f"{TOPIC_ID}/chapter_1.mp3")] == f"{TOPIC_ID}/chapter_1_a1b2c3d4_part001.mp3".encode("utf-8")
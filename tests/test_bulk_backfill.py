@@ -0,0 +1,126 @@
+import json
+import pytest
+
+import bulk_backfill
+import lambda_tech_programming as generator
+import prompt_packs
+import topic_requests
+from local_fakes import FakeBedrockBatch, FakeBedrockRuntime, FakeS3, FakeTable, FakeStepFunctions
+
+CHAPTERS = 3
+
+
+def responder(payload):
+    prompt = payload["messages"][-1]["content"][-1]["text"]
+    if "OUTPUT INSTRUCTIONS" in prompt:
+        if "unparseable" in prompt: return "Sorry, no outline today."
+        return json.dumps({
+            "introduction": "Welcome to the episode.",
+            "chapters": [{"number": n, "title": f"Part {n}", "summary": "What this part covers."} for n in range(1, CHAPTERS + 1)]
+        })
+    return "This chapter walks through one idea at a time. " * 10
+
+
+@pytest.fixture
+def backfill(monkeypatch):
+    s3, status_table, stepfunctions = FakeS3(), FakeTable(), FakeStepFunctions()
+    monkeypatch.setattr(bulk_backfill, "s3", s3)
+    monkeypatch.setattr(generator, "s3", s3)
+    monkeypatch.setattr(generator, "status_table", status_table)
+    monkeypatch.setattr(topic_requests, "status_table", status_table)
+    monkeypatch.setattr(topic_requests, "topics_table", FakeTable("request_id"))
+    monkeypatch.setattr(topic_requests, "stepfunctions", stepfunctions)
+    monkeypatch.setattr(bulk_backfill, "bedrock_batch", FakeBedrockBatch(s3, FakeBedrockRuntime(responder)))
+    return {"s3": s3, "status_table": status_table, "stepfunctions": stepfunctions}
+
+
+def topics(descriptions, category="Science & Engineering"):
+    return [{
+        "topic": f"Topic {i}",
+        "desc": desc,
+        "category": category,
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS
+    } for i, desc in enumerate(descriptions)]
+
+
+def test_small_backfills_are_sent_to_the_normal_workflow(backfill):
+    response = bulk_backfill.lambda_handler({"action": "submit", "topics": topics(["a", "b"])}, None)
+    assert response["statusCode"] == 400
+    assert backfill["stepfunctions"].executions == []
+
+
+def test_submit_advance_advance_starts_audio_only_workflows(backfill):
+    submitted = bulk_backfill.lambda_handler({"action": "submit", "topics": topics(["a", "b", "c"]), "min_batch_records": 2}, None)
+    assert submitted["phase"] == "OUTLINES"
+
+    chapters = bulk_backfill.lambda_handler({"action": "advance", "batch_id": submitted["batch_id"]}, None)
+    assert chapters["phase"] == "CHAPTERS"
+    assert chapters["records"] == 3 * CHAPTERS
+
+    done = bulk_backfill.lambda_handler({"action": "advance", "batch_id": submitted["batch_id"]}, None)
+    assert done["phase"] == "DONE"
+    assert done["summary"] == {"topics": 3, "outlines": 3, "content_ready": 3}
+
+    executions = backfill["stepfunctions"].executions
+    assert len(executions) == 3
+    assert all(execution["input"]["content_ready"] is True for execution in executions)
+
+    # The standard content layout the audio stages read
+    for execution in executions:
+        topic_id = execution["input"]["topic_id"]
+        keys = {key for bucket, key in backfill["s3"].objects if key.startswith(f"{topic_id}/")}
+        assert {f"{topic_id}/intro.json", f"{topic_id}/outline.json"} <= keys
+        assert {f"{topic_id}/chapter_{n}.json" for n in range(1, CHAPTERS + 1)} <= keys
+        assert backfill["status_table"].items[topic_id]["status"] == "CONTENT_GENERATION_COMPLETE"
+
+
+def test_topic_without_a_usable_outline_runs_the_full_workflow(backfill):
+    submitted = bulk_backfill.lambda_handler({"action": "submit", "topics": topics(["a", "unparseable"]), "min_batch_records": 2}, None)
+    bulk_backfill.lambda_handler({"action": "advance", "batch_id": submitted["batch_id"]}, None)
+    done = bulk_backfill.lambda_handler({"action": "advance", "batch_id": submitted["batch_id"]}, None)
+
+    assert done["summary"] == {"topics": 2, "outlines": 1, "content_ready": 1}
+    ready = {execution["input"]["topic"]: "content_ready" in execution["input"] for execution in backfill["stepfunctions"].executions}
+    assert ready == {"Topic 0": True, "Topic 1": False}
+
+
+def test_invalid_topic_is_rejected_before_anything_is_stored(backfill):
+    invalid = topics(["a", "b"])
+    invalid[1]["level_of_difficulty"] = "EXPERT"
+    response = bulk_backfill.lambda_handler({"action": "submit", "topics": invalid, "min_batch_records": 2}, None)
+
+    assert response["statusCode"] == 400
+    assert "Invalid difficulty level" in response["error"]
+    assert backfill["status_table"].items == {}
+
+
+def test_batch_prompts_use_each_topics_pack_without_touching_the_generator(backfill):
+    submitted = bulk_backfill.lambda_handler(
+        {"action": "submit", "topics": topics(["a", "b"], "History & Social Studies"), "min_batch_records": 2}, None
+    )
+    bulk_backfill.lambda_handler({"action": "advance", "batch_id": submitted["batch_id"]}, None)
+
+    assert generator.current_pack is prompt_packs.DEFAULT_PACK
+    pack = prompt_packs.get_pack("History & Social Studies")
+    for call_type, expected in (("outline", f"Tone: {pack['tone']}"), ("chapter", pack["chapter_template"][0])):
+        input_key = f"_batch/{submitted['batch_id']}/{call_type}/input.jsonl"
+        body = backfill["s3"].get_object(Bucket="echopod-content", Key=input_key)["Body"].read().decode("utf-8")
+        prompts = [json.loads(line)["modelInput"]["messages"][-1]["content"][-1]["text"] for line in body.splitlines()]
+        assert prompts and all(expected in prompt for prompt in prompts)
+
+
+def test_job_output_is_read_across_listing_pages(backfill):
+    backfill["s3"].page_size = 1
+    submitted = bulk_backfill.lambda_handler({"action": "submit", "topics": topics(["a", "b"]), "min_batch_records": 2}, None)
+    job_arn = bulk_backfill.read_manifest(submitted["batch_id"])["job_arn"]
+
+    # A second output file after the first page, as Bedrock writes for large inputs
+    prefix = f"_batch/{submitted['batch_id']}/outline/output/{job_arn.rsplit('/', 1)[-1]}/"
+    first = backfill["s3"].get_object(Bucket="echopod-content", Key=f"{prefix}input.jsonl.out")["Body"].read().decode("utf-8")
+    lines = first.splitlines()
+    backfill["s3"].put_object(Bucket="echopod-content", Key=f"{prefix}input.jsonl.out", Body=lines[0])
+    backfill["s3"].put_object(Bucket="echopod-content", Key=f"{prefix}part2.jsonl.out", Body=lines[1])
+
+    chapters = bulk_backfill.lambda_handler({"action": "advance", "batch_id": submitted["batch_id"]}, None)
+    assert chapters["records"] == 2 * CHAPTERS
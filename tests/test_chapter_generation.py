@@ -0,0 +1,173 @@
+import json
+import re
+import time
+import pytest
+
+import lambda_tech_programming as generator
+from conftest import CHAPTERS, episode_responder, new_topic
+
+
+def scripted(responses, segmenter=None):
+    """generate(messages) returning the given (text, stop_reason) pairs in turn, streaming them when a segmenter is given"""
+    calls = []
+
+    def generate(messages):
+        calls.append(messages)
+        text, stop_reason = responses[len(calls) - 1]
+        if segmenter: segmenter.feed(text)
+        return text, stop_reason
+    return generate, calls
+
+
+def prefill(messages):
+    return messages[-1]["content"][0]["text"]
+
+
+def test_truncated_response_continues_from_its_last_sentence():
+    generate, calls = scripted([
+        ("First sentence. Second sen", "max_tokens"),
+        (" Second sentence, written again. Done.", "end_turn")
+    ])
+
+    text = generator.generate_complete_content([{"role": "user", "content": "Write"}], generate)
+
+    assert prefill(calls[1]) == "First sentence."
+    assert text == "First sentence. Second sentence, written again. Done."
+
+
+def test_streamed_continuation_drops_the_partial_sentence_after_a_released_paragraph():
+    segments = []
+    segmenter = generator.StreamSegmenter(lambda part, text: segments.append(text), min_chars=5, max_chars=200)
+    generate, calls = scripted([
+        ("The first paragraph ends here.\n\nA second paragraph is cut", "max_tokens"),
+        (" A second paragraph is complete.", "end_turn")
+    ], segmenter)
+
+    text = generator.generate_complete_content([{"role": "user", "content": "Write"}], generate, segmenter)
+    segmenter.flush()
+
+    # The segmenter released the first paragraph before the cut, the partial sentence was never sent
+    assert prefill(calls[1]) == "The first paragraph ends here."
+    assert text == "The first paragraph ends here. A second paragraph is complete."
+    assert segments == ["The first paragraph ends here.", "A second paragraph is complete."]
+
+
+def test_streamed_continuation_within_one_paragraph():
+    segments = []
+    segmenter = generator.StreamSegmenter(lambda part, text: segments.append(text), min_chars=500, max_chars=1000)
+    generate, calls = scripted([
+        ("One sentence. Another one is cut", "max_tokens"),
+        (" Another one is whole.", "end_turn")
+    ], segmenter)
+
+    generator.generate_complete_content([{"role": "user", "content": "Write"}], generate, segmenter)
+    segmenter.flush()
+
+    assert prefill(calls[1]) == "One sentence."
+    assert segments == ["One sentence. Another one is whole."]
+
+
+class ShrinkingContext:
+    """Lambda context whose remaining time drops to the given seconds after the first reading"""
+
+    def __init__(self, first_seconds, then_seconds):
+        self.readings = [first_seconds, then_seconds]
+
+    def get_remaining_time_in_millis(self):
+        return (self.readings.pop(0) if len(self.readings) > 1 else self.readings[0]) * 1000
+
+
+@pytest.mark.parametrize("generation_mode", ["sequential", "parallel"])
+def test_short_timeout_writes_a_chapter_per_invocation_and_resumes(generator_services, generation_mode):
+    event = {
+        "topic_id": "topic-deadline",
+        "topic": "Graphs",
+        "desc": "Search and shortest paths",
+        "category": "Technical & Programming",
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS,
+        "generation_mode": generation_mode,
+        "max_concurrency": 1,
+        "use_cache": False
+    }
+
+    new_topic(generator_services["table"], "topic-deadline")
+
+    # Below margin plus estimate from the start, and nothing left after the first chapter
+    responses = []
+    for _ in range(CHAPTERS):
+        response = generator.lambda_handler(event, ShrinkingContext(100, 10))
+        responses.append(response)
+        if response["statusCode"] == 202: event = response["continuation"]
+
+    assert [response["statusCode"] for response in responses] == [202] * (CHAPTERS - 1) + [200]
+    assert [response["continuation"]["next_chapter"] for response in responses[:-1]] == list(range(2, CHAPTERS + 1))
+    assert generator_services["table"].items["topic-deadline"]["chapters_complete"] == {str(n): True for n in range(1, CHAPTERS + 1)}
+
+
+def test_parallel_chapters_are_stored_under_their_own_number_whatever_order_they_finish(generator_services):
+    finished = []
+
+    def responder(payload):
+        prompt = payload["messages"][-1]["content"][-1]["text"]
+        match = re.search(r"Write Chapter (\d+) of", prompt)
+        if not match: return episode_responder(payload)
+        # Later chapters finish first
+        number = int(match.group(1))
+        time.sleep(0.05 * (CHAPTERS - number))
+        finished.append(number)
+        return f"Chapter {number} body. " * 20
+    generator_services["runtime"].responder = responder
+    new_topic(generator_services["table"], "topic-parallel")
+
+    response = generator.lambda_handler({
+        "topic_id": "topic-parallel",
+        "topic": "Sorting",
+        "desc": "Comparison sorts",
+        "category": "Technical & Programming",
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS,
+        "generation_mode": "parallel",
+        "max_concurrency": CHAPTERS,
+        "use_cache": False
+    }, None)
+
+    assert response["statusCode"] == 200
+    assert finished == list(range(CHAPTERS, 0, -1))
+    for number in range(1, CHAPTERS + 1):
+        stored = generator.read_content_object("topic-parallel", f"chapter_{number}.json")
+        assert stored["content"].startswith(f"Chapter {number} body.")
+    assert generator_services["table"].items["topic-parallel"]["chapters_complete"] == {str(n): True for n in range(1, CHAPTERS + 1)}
+
+
+def test_resume_regenerates_only_chapters_missing_from_the_checkpoint(generator_services):
+    topic_id = "topic-resume"
+    new_topic(generator_services["table"], topic_id)
+    outline = json.loads(episode_responder({"messages": [{"content": [{"text": "OUTPUT INSTRUCTIONS"}]}]}))
+    generator.store_outline(topic_id, outline)
+    generator.store_chapter(topic_id, 1, "Chapter one as an earlier attempt wrote it.")
+    # Chapter 2 was marked complete but its object never made it to S3
+    generator_services["table"].update_item(
+        Key={"topic_id": topic_id},
+        UpdateExpression="SET intro_complete = :true, chapters_complete = :chapters",
+        ExpressionAttributeValues={":true": True, ":chapters": {"1": True, "2": True}}
+    )
+
+    response = generator.lambda_handler({
+        "topic_id": topic_id,
+        "topic": "Tries",
+        "desc": "Prefix trees",
+        "category": "Technical & Programming",
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS,
+        "generation_mode": "sequential",
+        "use_cache": False
+    }, None)
+
+    assert response["statusCode"] == 200
+    prompts = [call["payload"]["messages"][-1]["content"][-1]["text"] for call in generator_services["runtime"].calls]
+    assert not any("OUTPUT INSTRUCTIONS" in prompt for prompt in prompts)
+    assert [int(number) for prompt in prompts for number in re.findall(r"Write Chapter (\d+):", prompt)] == [2, 3]
+    assert generator.read_content_object(topic_id, "chapter_1.json")["content"] == "Chapter one as an earlier attempt wrote it."
+    assert generator.read_content_object(topic_id, "chapter_2.json") is not None
+    assert generator_services["table"].items[topic_id]["chapters_complete"] == {str(n): True for n in range(1, CHAPTERS + 1)}
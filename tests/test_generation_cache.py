@@ -0,0 +1,62 @@
+import lambda_tech_programming as generator
+import topic_similarity
+from conftest import CHAPTERS, new_topic
+
+
+def generate(services, topic_id, topic, desc):
+    new_topic(services["table"], topic_id)
+    return generator.lambda_handler({
+        "topic_id": topic_id,
+        "topic": topic,
+        "desc": desc,
+        "category": "Technical & Programming",
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS,
+        "generation_mode": "sequential"
+    }, None)
+
+
+def outline_calls(runtime):
+    return [call for call in runtime.calls if "OUTPUT INSTRUCTIONS" in call["payload"]["messages"][-1]["content"][-1]["text"]]
+
+
+def test_request_differing_only_in_case_and_spacing_is_served_without_bedrock(generator_services):
+    runtime = generator_services["runtime"]
+    assert generate(generator_services, "topic-a", "Binary Trees", "Traversals and balancing")["statusCode"] == 200
+    runtime.calls.clear()
+
+    response = generate(generator_services, "topic-b", "  binary   TREES ", "traversals  and Balancing")
+
+    assert response["message"] == "Content served from generation cache"
+    assert runtime.calls == []
+    for name in ["intro.json", "outline.json"] + [f"chapter_{n}.json" for n in range(1, CHAPTERS + 1)]:
+        assert generator.read_content_object("topic-b", name) == generator.read_content_object("topic-a", name)
+    assert generator_services["table"].items["topic-b"]["status"] == "CONTENT_GENERATION_COMPLETE"
+
+
+def test_near_duplicate_topic_reuses_the_outline(generator_services):
+    runtime = generator_services["runtime"]
+    generate(generator_services, "topic-a", "Binary Search Trees", "Insertion, deletion and balancing of binary search trees")
+    runtime.calls.clear()
+
+    # A different cache key, but the same words once plurals and stop words are dropped
+    response = generate(generator_services, "topic-b", "Binary Search Tree", "Insertion, deletion and balancing for a binary search tree")
+
+    assert response["statusCode"] == 200
+    assert outline_calls(runtime) == []
+    assert generator.read_content_object("topic-b", "outline.json") == generator.read_content_object("topic-a", "outline.json")
+    assert len(runtime.calls) == CHAPTERS
+
+
+def test_topic_below_the_similarity_threshold_gets_its_own_outline(generator_services):
+    runtime = generator_services["runtime"]
+    first = ("Binary Search Trees", "Insertion, deletion and balancing of binary search trees")
+    second = ("Binary Search Trees", "Using them as ordered maps in database indexes and schedulers")
+    score = topic_similarity.similarity(topic_similarity.signature(" ".join(first)), topic_similarity.signature(" ".join(second)))
+    assert score < generator.SIMILAR_OUTLINE_THRESHOLD
+
+    generate(generator_services, "topic-a", *first)
+    runtime.calls.clear()
+    generate(generator_services, "topic-b", *second)
+
+    assert len(outline_calls(runtime)) == 1
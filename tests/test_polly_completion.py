@@ -0,0 +1,88 @@
+import json
+import pytest
+
+import polly_convert
+import polly_completion_handler
+from conftest import TOPIC_ID
+from local_fakes import FakeStepFunctions
+
+
+@pytest.fixture
+def services(polly_services, monkeypatch):
+    stepfunctions = FakeStepFunctions()
+    # Completion events go straight to the handler, as the SNS subscription delivers them
+    monkeypatch.setattr(polly_services["polly"], "subscriber", polly_completion_handler.lambda_handler)
+    monkeypatch.setattr(polly_completion_handler, "status_table", polly_services["table"])
+    monkeypatch.setattr(polly_completion_handler, "stepfunctions", stepfunctions)
+    return dict(polly_services, stepfunctions=stepfunctions)
+
+
+def convert(services, name, text):
+    key = f"{TOPIC_ID}/{name}.json"
+    services["s3"].put_object(Bucket=polly_convert.CONTENT_BUCKET, Key=key, Body=json.dumps({"content": text}))
+    return polly_convert.lambda_handler({"topic_id": TOPIC_ID, "key": key, "files_in_topic": 1}, None)
+
+
+def long_chapter():
+    return " ".join(f"Sentence number {i} explains one more idea." for i in range(1500))
+
+
+def test_completions_count_down_and_resume_once(services):
+    table, polly, stepfunctions = services["table"], services["polly"], services["stepfunctions"]
+    convert(services, "intro", "A short intro.")
+    tasks = convert(services, "chapter_1", long_chapter())["tasks"]
+
+    # The synchronous intro is never pending, every async chunk is
+    assert len(tasks) > 1
+    assert table.items[TOPIC_ID]["polly_pending"] == len(tasks)
+
+    # A completion before the workflow registers, and an SNS redelivery of it
+    first = tasks[0]["task_id"]
+    polly.complete(first)
+    polly.complete(first)
+    assert table.items[TOPIC_ID]["polly_pending"] == len(tasks) - 1
+
+    registered = polly_completion_handler.lambda_handler({"action": "register", "topic_id": TOPIC_ID, "task_token": "token-1"}, None)
+    assert registered["resumed"] is False
+    assert stepfunctions.task_results == []
+
+    polly.complete_all()
+    assert table.items[TOPIC_ID]["polly_pending"] == 0
+    assert "polly_task_token" not in table.items[TOPIC_ID]
+    assert [(sent["taskToken"], sent["result"]) for sent in stepfunctions.task_results] == [("token-1", "success")]
+
+
+def test_register_after_all_done_resumes_immediately(services):
+    stepfunctions = services["stepfunctions"]
+    convert(services, "chapter_1", long_chapter())
+    services["polly"].complete_all()
+
+    first = polly_completion_handler.lambda_handler({"action": "register", "topic_id": TOPIC_ID, "task_token": "token-2"}, None)
+    second = polly_completion_handler.lambda_handler({"action": "register", "topic_id": TOPIC_ID, "task_token": "token-2"}, None)
+
+    assert first["resumed"] is True
+    assert second["resumed"] is False
+    assert len(stepfunctions.task_results) == 1
+
+
+def test_failed_tasks_count_as_finished(services):
+    stepfunctions = services["stepfunctions"]
+    convert(services, "chapter_1", long_chapter())
+    polly_completion_handler.lambda_handler({"action": "register", "topic_id": TOPIC_ID, "task_token": "token-3"}, None)
+
+    services["polly"].complete_all(status="failed")
+
+    assert services["table"].items[TOPIC_ID]["polly_pending"] == 0
+    assert [sent["taskToken"] for sent in stepfunctions.task_results] == ["token-3"]
+
+
+@pytest.mark.parametrize("output_uri", [
+    "s3://echopod-audio/topic-1/chapter_1_part001.abc.mp3",
+    "https://s3.us-east-1.amazonaws.com/echopod-audio/topic-1/chapter_1_part001.abc.mp3"
+])
+def test_topic_id_from_either_output_uri_form(output_uri):
+    assert polly_completion_handler.topic_id_from_output_uri(output_uri) == TOPIC_ID
+
+
+def test_output_uri_outside_audio_bucket_is_ignored():
+    assert polly_completion_handler.topic_id_from_output_uri("s3://other-bucket/topic-1/intro.mp3") is None
@@ -0,0 +1,190 @@
+import json
+import re
+import time
+import pytest
+from botocore.exceptions import ClientError
+
+import polly_convert
+import polly_status_checker
+from conftest import TOPIC_ID
+
+
+@pytest.fixture
+def services(polly_services, monkeypatch):
+    monkeypatch.setattr(polly_status_checker, "polly", polly_services["polly"])
+    monkeypatch.setattr(polly_status_checker, "status_table", polly_services["table"])
+    return polly_services
+
+
+def convert_chapter(services):
+    key = f"{TOPIC_ID}/chapter_1.json"
+    text = " ".join(f"Sentence **{i}** explains one more idea." for i in range(1500))
+    services["s3"].put_object(Bucket=polly_convert.CONTENT_BUCKET, Key=key, Body=json.dumps({"content": text}))
+    return polly_convert.lambda_handler({"topic_id": TOPIC_ID, "key": key}, None)["tasks"]
+
+
+def check():
+    return polly_status_checker.lambda_handler({"topic_id": TOPIC_ID}, None)
+
+
+def test_failed_chunk_is_resubmitted_with_the_same_text(services):
+    polly = services["polly"]
+    tasks = convert_chapter(services)
+    failed_id = tasks[0]["task_id"]
+    polly.complete(failed_id, status="failed", reason="Voice busy")
+    for task in tasks[1:]:
+        polly.complete(task["task_id"])
+
+    result = check()
+    replacement = services["table"].items[TOPIC_ID]["polly_tasks"][0]
+
+    assert result["failed"] is False
+    assert result["allTasksComplete"] is False
+    assert replacement["task_id"] != failed_id
+    assert replacement["previous_task_ids"] == [failed_id]
+    assert replacement["attempt"] == 2
+    assert polly.tasks[replacement["task_id"]]["_text"] == polly.tasks[failed_id]["_text"]
+
+    polly.complete(replacement["task_id"])
+    result = check()
+    assert result["allTasksComplete"] is True
+    assert result["failed"] is False
+
+
+def test_chunk_failing_every_attempt_fails_the_topic(services):
+    polly = services["polly"]
+    tasks = convert_chapter(services)
+    polly.complete_all()
+    polly.complete(tasks[0]["task_id"], status="failed", reason="Voice busy")
+
+    for attempt in range(2, polly_status_checker.MAX_CHUNK_ATTEMPTS + 1):
+        assert check()["failed"] is False
+        polly.complete(services["table"].items[TOPIC_ID]["polly_tasks"][0]["task_id"], status="failed", reason="Voice busy")
+
+    result = check()
+    assert result["failed"] is True
+    assert "Voice busy" in result["failureReason"]
+    assert services["table"].items[TOPIC_ID]["status"] == "AUDIO_FAILED"
+
+
+def test_resubmission_rejected_by_polly_every_time_fails_the_topic(services, monkeypatch):
+    polly = services["polly"]
+    tasks = convert_chapter(services)
+    polly.complete_all()
+    polly.complete(tasks[0]["task_id"], status="failed")
+
+    def unavailable(**kwargs):
+        raise ClientError({"Error": {"Code": "ServiceFailureException", "Message": "Polly unavailable"}}, "StartSpeechSynthesisTask")
+    monkeypatch.setattr(polly, "start_speech_synthesis_task", unavailable)
+
+    results = [check() for _ in range(polly_status_checker.MAX_CHUNK_ATTEMPTS)]
+
+    assert [result["failed"] for result in results] == [False] * (polly_status_checker.MAX_CHUNK_ATTEMPTS - 1) + [True]
+    assert "error" not in results[-1]
+    assert "Polly unavailable" in results[-1]["failureReason"]
+
+
+def stream_chapter(services, take, parts, stored_at, submit=()):
+    """A chapter streamed as the given take, with only the listed parts reaching EPPolly"""
+    services["table"].items[TOPIC_ID].setdefault("streamed_chapters", {})["chapter_2"] = {
+        "take": take, "parts": parts, "stored_at": stored_at, "resubmissions": {}
+    }
+    for part in range(1, parts + 1):
+        key = polly_convert.get_stream_part_key(TOPIC_ID, "chapter_2", take, part)
+        text = " ".join(f"Part {part} sentence {i} is streamed." for i in range(200))
+        services["s3"].put_object(Bucket=polly_convert.CONTENT_BUCKET, Key=key, Body=json.dumps({"content": text}))
+        if part in submit:
+            event = {"topic_id": TOPIC_ID, "key": key, "content_type": "chapter_2", "part": part, "take": take}
+            polly_convert.lambda_handler(event, None)
+
+
+def stream_tasks(services):
+    return [task for task in services["table"].items[TOPIC_ID].get("polly_tasks", []) if task.get("part")]
+
+
+def test_lost_streamed_part_is_resubmitted_after_the_grace_period(services):
+    stream_chapter(services, "a1b2c3d4", parts=3, stored_at=0, submit=(1, 3))
+    services["polly"].complete_all()
+
+    result = check()
+    assert result["allTasksComplete"] is False
+    assert {int(task["part"]) for task in stream_tasks(services)} == {1, 2, 3}
+
+    services["polly"].complete_all()
+    result = check()
+    assert result["allTasksComplete"] is True
+    assert result["finalizeKeys"] == ["chapter_2"]
+
+
+def test_missing_streamed_part_is_not_resubmitted_while_its_invocation_may_still_run(services):
+    stream_chapter(services, "a1b2c3d4", parts=2, stored_at=int(time.time()), submit=(1,))
+    services["polly"].complete_all()
+
+    result = check()
+    assert result["allTasksComplete"] is False
+    assert 0 < result["nextWaitSeconds"] <= polly_status_checker.STREAM_PART_GRACE_SECONDS
+    assert {int(task["part"]) for task in stream_tasks(services)} == {1}
+
+
+def test_streamed_part_that_never_reaches_polly_fails_the_topic(services):
+    stream_chapter(services, "a1b2c3d4", parts=2, stored_at=0, submit=(1,))
+    services["s3"].delete_object(
+        Bucket=polly_convert.CONTENT_BUCKET, Key=polly_convert.get_stream_part_key(TOPIC_ID, "chapter_2", "a1b2c3d4", 2)
+    )
+    services["polly"].complete_all()
+
+    results = [check() for _ in range(polly_status_checker.MAX_CHUNK_ATTEMPTS)]
+
+    assert [result["failed"] for result in results] == [False] * (polly_status_checker.MAX_CHUNK_ATTEMPTS - 1) + [True]
+    assert "chapter_2 streamed part 2" in results[-1]["failureReason"]
+
+
+def test_parts_of_a_superseded_take_are_ignored(services):
+    stream_chapter(services, "9f8e7d6c", parts=2, stored_at=0, submit=(1, 2))
+    services["polly"].complete(stream_tasks(services)[0]["task_id"], status="failed")
+
+    # The chapter was regenerated; the old take's late segment must not be synthesized
+    stream_chapter(services, "a1b2c3d4", parts=1, stored_at=0, submit=(1,))
+    late = {"topic_id": TOPIC_ID, "key": polly_convert.get_stream_part_key(TOPIC_ID, "chapter_2", "9f8e7d6c", 2),
+            "content_type": "chapter_2", "part": 2, "take": "9f8e7d6c"}
+    assert polly_convert.lambda_handler(late, None)["tasks"] == []
+    current_ids = {task["task_id"] for task in stream_tasks(services) if task["take"] == "a1b2c3d4"}
+    for task_id in current_ids:
+        services["polly"].complete(task_id)
+
+    result = check()
+    assert result["allTasksComplete"] is True
+    assert result["failed"] is False
+    assert {entry["task_id"] for entry in result["taskStatuses"]} == current_ids
+
+
+def written_indexes(update_expression):
+    return {int(index) for index in re.findall(r"polly_tasks\[(\d+)\]", update_expression)}
+
+
+def test_only_pending_tasks_are_polled_and_only_changes_written(services, monkeypatch):
+    polly, table = services["polly"], services["table"]
+    tasks = convert_chapter(services)
+    assert len(tasks) > 3
+
+    polled, writes = [], []
+    get_task, update_item = polly.get_speech_synthesis_task, table.update_item
+    monkeypatch.setattr(polly, "get_speech_synthesis_task", lambda **kwargs: polled.append(kwargs["TaskId"]) or get_task(**kwargs))
+    monkeypatch.setattr(table, "update_item", lambda **kwargs: writes.append(kwargs["UpdateExpression"]) or update_item(**kwargs))
+
+    for task in tasks[:2]:
+        polly.complete(task["task_id"])
+    check()
+    assert sorted(polled) == sorted(task["task_id"] for task in tasks)
+    assert [written_indexes(expression) for expression in writes] == [{0, 1}]
+
+    # Terminal tasks are skipped, and a check that changes nothing writes nothing
+    polled.clear()
+    writes.clear()
+    check()
+    assert sorted(polled) == sorted(task["task_id"] for task in tasks[2:])
+    assert writes == []
+
+    polly.complete(tasks[2]["task_id"])
+    check()
+    assert [written_indexes(expression) for expression in writes] == [{2}]
@@ -0,0 +1,96 @@
+import json
+import pytest
+
+import lambda_tech_programming as generator
+import bedrock_usage
+from conftest import CHAPTERS, new_topic
+
+
+@pytest.fixture
+def runtime(generator_services):
+    return generator_services["runtime"]
+
+
+def generate(topic_id, generation_mode):
+    new_topic(generator.status_table, topic_id)
+    return generator.lambda_handler({
+        "topic_id": topic_id,
+        "topic": f"Binary trees {topic_id}",
+        "desc": "Traversals and balancing",
+        "category": "Technical & Programming",
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS,
+        "generation_mode": generation_mode,
+        "use_cache": False
+    }, None)
+
+
+@pytest.mark.parametrize("generation_mode", ["sequential", "parallel"])
+def test_chapter_calls_read_the_shared_prefix_from_cache(runtime, generation_mode):
+    response = generate(f"topic-{generation_mode}", generation_mode)
+    assert response["statusCode"] == 200
+
+    chapter_calls = sorted(
+        (call for call in bedrock_usage.get_calls() if call["call_type"] == "chapter"),
+        key=lambda call: call["label"]
+    )
+    assert [call["label"] for call in chapter_calls] == [f"chapter_{n}" for n in range(1, CHAPTERS + 1)]
+
+    # The intro prefix is written to the cache once and read by every later chapter call
+    writes = [call for call in chapter_calls if call["cache_creation_input_tokens"]]
+    reads = [call for call in chapter_calls if call["cache_read_input_tokens"]]
+    assert len(writes) <= 1
+    assert len(reads) >= CHAPTERS - 1
+    assert response["usage"]["cache_read_input_tokens"] == sum(call["cache_read_input_tokens"] for call in chapter_calls)
+
+
+def test_chapter_requests_mark_the_intro_as_a_cache_checkpoint(runtime):
+    generate("topic-checkpoint", "sequential")
+
+    # Chapter calls carry the intro conversation ahead of their own prompt, the outline call does not
+    chapter_payloads = [call["payload"] for call in runtime.calls if len(call["payload"]["messages"]) > 1]
+    assert len(chapter_payloads) == CHAPTERS
+    for payload in chapter_payloads:
+        blocks = [block for message in payload["messages"] if isinstance(message["content"], list) for block in message["content"]]
+        assert any("cache_control" in block for block in blocks)
+
+
+def test_routing_stats_cover_only_the_current_invocation(runtime):
+    first = generate("topic-routing-1", "sequential")
+    second = generate("topic-routing-2", "sequential")
+
+    # A warm container runs both, the second response must not include the first one's calls
+    for response in (first, second):
+        chapter_calls = sum(route["calls"] for route in response["routing"]["chapter"].values())
+        assert chapter_calls == CHAPTERS
+
+
+def test_streamed_chapters_record_the_take_and_parts_they_sent(runtime, monkeypatch):
+    invocations = []
+
+    class RecordingLambda:
+        def invoke(self, FunctionName, InvocationType, Payload):
+            invocations.append(json.loads(Payload))
+    monkeypatch.setattr(generator, "lambda_client", RecordingLambda())
+    new_topic(generator.status_table, "topic-streamed")
+
+    response = generator.lambda_handler({
+        "topic_id": "topic-streamed",
+        "topic": "Hash maps",
+        "desc": "Buckets and probing",
+        "category": "Technical & Programming",
+        "level_of_difficulty": "BEGINNER",
+        "chapters": CHAPTERS,
+        "generation_mode": "sequential",
+        "use_cache": False,
+        "stream_to_tts": True
+    }, None)
+    assert response["statusCode"] == 200
+
+    streamed = generator.status_table.items["topic-streamed"]["streamed_chapters"]
+    assert sorted(streamed) == [f"chapter_{n}" for n in range(1, CHAPTERS + 1)]
+    for content_type, entry in streamed.items():
+        sent = [payload for payload in invocations if payload["content_type"] == content_type]
+        assert entry["parts"] == len(sent) > 0
+        assert {payload["take"] for payload in sent} == {entry["take"]}
+        assert all(payload["key"].startswith(f"topic-streamed/stream/{content_type}/{entry['take']}/") for payload in sent)
@@ -0,0 +1,50 @@
+import random
+import pytest
+
+from text_chunker import chunk_spans, chunk_text, WHITESPACE
+
+ALPHABET = "ab cd ef.!?,;:)\n\t\"'" + " "
+
+
+def random_text(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 120)))
+
+
+def non_whitespace(text):
+    return "".join(char for char in text if char not in WHITESPACE)
+
+
+@pytest.mark.parametrize("balance", [False, True])
+def test_chunks_never_exceed_the_limit_and_lose_nothing(balance):
+    rng = random.Random(1729)
+    for _ in range(3000):
+        text, max_chars = random_text(rng), rng.randint(1, 40)
+        spans = chunk_spans(text, max_chars, balance=balance)
+        chunks = [text[start:end] for start, end in spans]
+
+        assert all(0 < len(chunk) <= max_chars for chunk in chunks), (text, max_chars, chunks)
+        assert all(chunk == chunk.strip(WHITESPACE) for chunk in chunks), (text, max_chars, chunks)
+        assert all(a_end <= b_start for (_, a_end), (b_start, _) in zip(spans, spans[1:])), (text, max_chars, spans)
+        assert non_whitespace("".join(chunks)) == non_whitespace(text), (text, max_chars, chunks)
+
+
+def test_balancing_keeps_the_chunk_count():
+    rng = random.Random(42)
+    for _ in range(1000):
+        text, max_chars = random_text(rng), rng.randint(1, 40)
+        assert len(chunk_spans(text, max_chars, balance=True)) == len(chunk_spans(text, max_chars))
+
+
+def test_whitespace_heavy_input_stays_under_the_limit():
+    assert chunk_text("\n!,", 1, balance=True) == ["!", ","]
+
+
+def test_chunks_end_at_sentence_boundaries_when_they_fit():
+    text = "First sentence here. Second one follows! Third asks why? Fourth ends it."
+    assert chunk_text(text, 45) == ["First sentence here. Second one follows!", "Third asks why? Fourth ends it."]
+
+
+def test_balanced_chunks_even_out_the_leftover():
+    text = " ".join(f"Sentence {i} is here." for i in range(100))
+    sizes = [len(chunk) for chunk in chunk_text(text, 1000, balance=True)]
+    assert max(sizes) - min(sizes) < 100
@@ -0,0 +1,58 @@
+import json
+from collections import OrderedDict
+import pytest
+
+import polly_convert
+import polly_status_checker
+import tts_audio_cache
+from conftest import TOPIC_ID, new_topic
+
+
+@pytest.fixture
+def services(polly_services, monkeypatch):
+    monkeypatch.setattr(polly_status_checker, "polly", polly_services["polly"])
+    monkeypatch.setattr(polly_status_checker, "status_table", polly_services["table"])
+    return polly_services
+
+
+def convert(services, topic_id, name, text):
+    key = f"{topic_id}/{name}.json"
+    services["s3"].put_object(Bucket=polly_convert.CONTENT_BUCKET, Key=key, Body=json.dumps({"content": text}))
+    return polly_convert.lambda_handler({"topic_id": topic_id, "key": key}, None)["tasks"]
+
+
+def audio(services, key):
+    return services["s3"].objects[(polly_convert.AUDIO_BUCKET, key)]
+
+
+def test_chunks_synthesized_before_are_copied_instead_of_resubmitted(services):
+    polly = services["polly"]
+    text = " ".join(f"Sentence number {i} explains one more idea." for i in range(1500))
+    first = convert(services, TOPIC_ID, "chapter_1", text)
+    polly.complete_all()
+    # Completed outputs enter the cache when the status checker first sees them
+    polly_status_checker.lambda_handler({"topic_id": TOPIC_ID}, None)
+    submitted = len(polly.tasks)
+
+    new_topic(services["table"], "topic-2")
+    second = convert(services, "topic-2", "chapter_1", text)
+
+    assert len(polly.tasks) == submitted
+    assert all(task["cached"] and task["status"] == "completed" for task in second)
+    for original, cached in zip(first, second):
+        assert audio(services, cached["output_key"]) == audio(services, polly.tasks[original["task_id"]]["_key"])
+
+
+def test_short_text_is_synthesized_once(services, monkeypatch):
+    synthesized = []
+    synthesize_speech = services["polly"].synthesize_speech
+    monkeypatch.setattr(services["polly"], "synthesize_speech", lambda **kwargs: synthesized.append(kwargs) or synthesize_speech(**kwargs))
+
+    convert(services, TOPIC_ID, "intro", "A short intro.")
+    # A cold container only knows the cache from S3
+    monkeypatch.setattr(tts_audio_cache, "_known", OrderedDict())
+    task = convert(services, TOPIC_ID, "chapter_1", "A short intro.")[0]
+
+    assert len(synthesized) == 1
+    assert task["cached"] is True
+    assert audio(services, f"{TOPIC_ID}/chapter_1.mp3") == audio(services, f"{TOPIC_ID}/intro.mp3")
@@ -0,0 +1,74 @@
+import pytest
+
+from tts_normalizer import normalize_for_speech
+
+
+def speech(text):
+    return normalize_for_speech(text)[0]
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Asterisks and underscores that are not emphasis pairs are content
+    ("Compute 2*3 and a*b", "Compute 2*3 and a*b"),
+    ("The area is w*h*d here", "The area is w*h*d here"),
+    ("Multiply a * b", "Multiply a times b"),
+    # Paired markers are emphasis and are dropped, keeping what they wrap
+    ("This is **important** and *subtle*", "This is important and subtle"),
+    ("Use _italics_ or __bold__ sparingly", "Use italics or bold sparingly"),
+    ("A ***very*** big deal", "A very big deal"),
+    ("Call **`calculate_total()`** first", "Call calculate total first"),
+    ("**2*3** is six", "2*3 is six"),
+])
+def test_emphasis_only_strips_pairs(text, expected):
+    assert speech(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "Most APIs return JSON.",
+    "Several CPUs and GPUs share the bus.",
+])
+def test_acronym_plurals_are_not_made_possessive(text):
+    assert speech(text) == text
+
+
+@pytest.mark.parametrize("text", [
+    "Open the app on your iPhone.",
+    "Listings on eBay and apps on the iPad.",
+])
+def test_brand_names_keep_their_spelling(text):
+    assert speech(text) == text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Set maxValue before calling getUserName()", "Set max value before calling get user name"),
+    ("The snake_case_name is fine", "The snake case name is fine"),
+    ("Call os.path.join() on both", "Call os dot path dot join on both"),
+    ("Run `os.path` first", "Run os dot path first"),
+])
+def test_code_identifiers_are_spoken(text, expected):
+    assert speech(text) == expected
+
+
+def test_markdown_structure_is_removed_and_counted():
+    text = "## Chapter 1: Trees\n\n- First point\n- Second point, e.g. a leaf\n\n---\n\nSee [the docs](https://example.com)."
+    clean, removed = normalize_for_speech(text)
+    assert clean == "First point\nSecond point, for example a leaf\n\nSee the docs."
+    assert removed == len(text) - len(clean)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Trees, graphs, etc. Next we cover heaps.", "Trees, graphs, et cetera. Next we cover heaps."),
+    ("We saw trees, graphs, etc.", "We saw trees, graphs, et cetera."),
+    ("Trees, graphs, etc. are all covered.", "Trees, graphs, et cetera are all covered."),
+])
+def test_sentence_final_abbreviation_keeps_its_period(text, expected):
+    assert speech(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Then parseHTTPResponse runs", "Then parse HTTP response runs"),
+    ("Look up getUserID() and the user_ID", "Look up get user ID and the user ID"),
+    ("Constants like MAX_VALUE stay", "Constants like MAX VALUE stay"),
+])
+def test_acronyms_in_identifiers_keep_their_capitals(text, expected):
+    assert speech(text) == expected